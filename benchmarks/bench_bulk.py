@@ -0,0 +1,40 @@
+'''Measure operations on the chords of a whole generated tab.
+
+    python benchmarks/bench_bulk.py [number of bars]
+'''
+
+import os
+import sys
+import time
+from fractions import Fraction
+
+# run from a source checkout without installing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from bench_render import generate
+from vitabs import bulk
+from vitabs.tablature import ChordRange
+
+
+def measure(name, f, *args):
+    start = time.perf_counter()
+    f(*args)
+    print('{0:<15} {1:8.2f} ms'.format(
+        name, (time.perf_counter() - start) * 1000))
+
+
+if __name__ == '__main__':
+    nbars = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tab = generate(nbars)
+    # keep an index and a change log as the editor does
+    tab.index
+    tab.open_log()
+    crange = ChordRange(tab, (1, 1), tab.last_position())
+    print('{0} bars, {1} chords'.format(nbars, nbars * 8))
+    measure('transpose', bulk.transpose, crange, 2)
+    measure('set duration', bulk.set_duration, crange, Fraction(1, 8))
+    measure('add symbol', bulk.add_symbol, crange, 'vibrato')
+    measure('remove symbol', bulk.remove_symbol, crange, 'vibrato')
+    measure('clamp', bulk.clamp_frets, crange, 0, 12)
+    measure('index', lambda: tab.time_at_bar(nbars))
@@ -0,0 +1,73 @@
+'''Compare saving and loading a generated large tab with pickle and with
+the binary file format.
+
+    python benchmarks/bench_fileformat.py [number of bars]
+'''
+
+import io
+import os
+import pickle
+import random
+import sys
+import time
+from fractions import Fraction
+
+# run from a source checkout without installing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from vitabs import tabfile
+from vitabs.tablature import Fret, Chord, Bar, Tablature
+
+
+def generate(nbars, seed=0):
+    rnd = random.Random(seed)
+    lengths = [Fraction(1, 4), Fraction(1, 8), Fraction(1, 16)]
+    bars = []
+    for b in range(nbars):
+        chords = []
+        for c in range(8):
+            chord = Chord(rnd.choice(lengths))
+            for s in rnd.sample(range(6), rnd.randint(1, 4)):
+                fret = Fret(rnd.randint(0, 15))
+                if rnd.random() < 0.1:
+                    fret.symbols.append('vibrato')
+                chord.strings[s] = fret
+            chords.append(chord)
+        bars.append(Bar.with_chords(chords))
+    tab = Tablature()
+    tab.bars = bars
+    return tab
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    ret = f(*args)
+    return time.perf_counter() - start, ret
+
+
+def bench_pickle(tab):
+    out = io.BytesIO()
+    save_time = timed(pickle.dump, tab, out)[0]
+    data = out.getvalue()
+    load_time = timed(pickle.loads, data)[0]
+    return save_time, load_time, len(data)
+
+
+def bench_tabfile(tab):
+    out = io.BytesIO()
+    save_time = timed(tabfile.write, out, tab)[0]
+    data = out.getvalue()
+    load_time = timed(tabfile.read, data)[0]
+    return save_time, load_time, len(data)
+
+
+if __name__ == '__main__':
+    nbars = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tab = generate(nbars)
+    print('{0} bars'.format(nbars))
+    print('{0:8} {1:>10} {2:>10} {3:>12}'.format('', 'save', 'load', 'size'))
+    for name, bench in (('pickle', bench_pickle), ('tabfile', bench_tabfile)):
+        save_time, load_time, size = bench(tab)
+        print('{0:8} {1:8.3f} s {2:8.3f} s {3:8.1f} MiB'.format(
+            name, save_time, load_time, size / 2**20))
@@ -0,0 +1,88 @@
+'''Compare memory use and pickling time of the slotted tablature classes
+with the former __dict__-based ones on a generated large tab.
+
+    python benchmarks/bench_memory.py [number of bars]
+
+With 5000 bars the slotted classes take about 26% less memory (21.4 MiB
+against 28.9 MiB) and load 1.2-1.4 times faster (1.10-1.02 s against
+1.36-1.39 s).  They dump slower, 0.94-1.03 s against 0.70-0.72 s, as
+__getstate__ builds a dict for each object.
+'''
+
+import os
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+from fractions import Fraction
+
+# run from a source checkout without installing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from vitabs.tablature import Fret, Chord, Bar
+
+
+class LegacyFret:
+    def __init__(self, fret):
+        self.fret = fret
+        self.symbols = []
+
+
+class LegacyChord:
+    def __init__(self, duration=Fraction('1/4')):
+        self.strings = {}
+        self.duration = duration
+
+
+class LegacyBar:
+    def __init__(self, sig_num=4, sig_den=4):
+        self.chords = []
+        self.sig_num = sig_num
+        self.sig_den = sig_den
+
+
+def generate(fret_cls, chord_cls, bar_cls, nbars, seed=0):
+    rnd = random.Random(seed)
+    bars = []
+    for b in range(nbars):
+        bar = bar_cls()
+        chords = []
+        for c in range(8):
+            chord = chord_cls(Fraction(1, 8))
+            for s in rnd.sample(range(6), rnd.randint(1, 4)):
+                fret = fret_cls(rnd.randint(0, 15))
+                if rnd.random() < 0.1:
+                    fret.symbols.append('vibrato')
+                chord.strings[s] = fret
+            chords.append(chord)
+        bar.chords = chords
+        bars.append(bar)
+    return bars
+
+
+def measure(name, classes, nbars):
+    tracemalloc.start()
+    bars = generate(*classes, nbars)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    data = pickle.dumps(bars, protocol=pickle.HIGHEST_PROTOCOL)
+    dump_time = time.perf_counter() - start
+    start = time.perf_counter()
+    pickle.loads(data)
+    load_time = time.perf_counter() - start
+
+    print('{0:8} {1:8.1f} MiB {2:8.3f} s {3:8.3f} s {4:8.1f} MiB'.format(
+        name, used / 2**20, dump_time, load_time, len(data) / 2**20))
+
+
+if __name__ == '__main__':
+    nbars = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print('{0} bars'.format(nbars))
+    print('{0:8} {1:>12} {2:>10} {3:>10} {4:>12}'.format(
+        '', 'memory', 'dump', 'load', 'pickle'))
+    measure('legacy', (LegacyFret, LegacyChord, LegacyBar), nbars)
+    measure('slots', (Fret, Chord, Bar), nbars)
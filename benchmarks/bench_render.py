@@ -0,0 +1,53 @@
+'''Measure how fast a generated tab renders to audio, in seconds of audio
+per second of CPU time.
+
+    python benchmarks/bench_render.py [number of bars] [sample rate]
+'''
+
+import os
+import random
+import sys
+import time
+from fractions import Fraction
+
+# run from a source checkout without installing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from vitabs import render
+from vitabs.tablature import Fret, Chord, Bar, ChordRange, Tablature
+
+
+def generate(nbars, seed=0):
+    rnd = random.Random(seed)
+    lengths = [Fraction(1, 4), Fraction(1, 8), Fraction(1, 16)]
+    symbols = ['vibrato', 'bend', 'slide up', 'slide down']
+    bars = []
+    for b in range(nbars):
+        chords = []
+        for c in range(8):
+            chord = Chord(rnd.choice(lengths))
+            for s in rnd.sample(range(6), rnd.randint(1, 4)):
+                fret = Fret(rnd.randint(0, 15))
+                if rnd.random() < 0.1:
+                    fret.symbols.append(rnd.choice(symbols))
+                chord.strings[s] = fret
+            chords.append(chord)
+        bars.append(Bar.with_chords(chords))
+    tab = Tablature()
+    tab.bars = bars
+    return tab
+
+
+if __name__ == '__main__':
+    nbars = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else render.RATE
+    tab = generate(nbars)
+    crange = ChordRange(tab, (1, 1), tab.last_position())
+    start = time.process_time()
+    samples = render.render(crange, bpm=120, rate=rate)
+    cpu = time.process_time() - start
+    audio = len(samples) / float(rate)
+    print('{0} bars, {1:.1f} s of audio at {2} Hz'.format(nbars, audio, rate))
+    print('rendered in {0:.3f} s of CPU, {1:.1f} s of audio per second'
+          .format(cpu, audio / cpu))
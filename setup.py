@@ -13,6 +13,7 @@ setup(
     long_description=open('README').read(),
     extras_require={
         'midi': ['python-rtmidi'],
+        'audio': ['numpy'],
         'test': ['pytest'],
     },
     project_urls={
@@ -0,0 +1,81 @@
+import curses
+
+import pytest
+
+from vitabs.editor import Editor
+
+
+class FakeWindow:
+    '''Character grid standing in for a curses window'''
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.y = self.x = 0
+        self.erase()
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def erase(self):
+        self.rows = [[' '] * self.width for i in range(self.height)]
+
+    def put(self, y, x, ch):
+        if 0 <= y < self.height and 0 <= x < self.width:
+            self.rows[y][x] = ch
+
+    def move(self, y, x):
+        self.y, self.x = y, x
+
+    def addstr(self, *args):
+        if len(args) >= 3:
+            self.move(args[0], args[1])
+            args = args[2:]
+        for ch in args[0]:
+            self.put(self.y, self.x, ch)
+            self.x += 1
+
+    def hline(self, y, x, ch, n):
+        for i in range(n):
+            self.put(y, x + i, '-')
+
+    def vline(self, y, x, ch, n):
+        for i in range(n):
+            self.put(y + i, x, '|')
+
+    def clrtoeol(self):
+        for x in range(self.x, self.width):
+            self.put(self.y, x, ' ')
+
+    def clrtobot(self):
+        self.clrtoeol()
+        for y in range(self.y + 1, self.height):
+            self.rows[y] = [' '] * self.width
+
+    def noutrefresh(self):
+        pass
+
+    def keypad(self, flag):
+        pass
+
+    def text(self):
+        return '\n'.join(''.join(row) for row in self.rows)
+
+
+@pytest.fixture
+def make_editor(monkeypatch):
+    '''Returns a function creating an editor drawing to a fake window'''
+    for name in ('ACS_VLINE', 'ACS_HLINE'):
+        monkeypatch.setattr(curses, name, ord('|'), raising=False)
+
+    def make(tab, height=40, width=80):
+        ed = Editor(FakeWindow(height + 1, width), tab)
+        ed.set_term_title = lambda text: None
+        ed.stdscr = FakeWindow(height, width)
+        ed.status_line = FakeWindow(1, width)
+        ed.first_visible_bar = 1
+        ed.redraw_view()
+        ed.cy = 2
+        ed.move_cursor()
+        ed.screen_initiated = True
+        return ed
+    return make
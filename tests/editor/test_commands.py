@@ -0,0 +1,154 @@
+import curses.ascii
+from fractions import Fraction
+
+import vitabs.commands
+from vitabs import fingering
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+
+def make_tab(nbars=10):
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(4)]
+        bars.append(bar)
+    tab.bars = bars
+    tab.bpm = 100
+    return tab
+
+
+def run(ed, line):
+    ed.exec_command(line.split())
+
+
+def test_tempo(make_editor):
+    tab = make_tab()
+    ed = make_editor(tab)
+    ed.register_handlers(vitabs.commands)
+    ed.tab.cursor_bar = 3
+    run(ed, 'tempo 80')
+    assert [tab.tempo_at(n) for n in range(1, 11)] == [100] * 2 + [80] * 8
+
+    # a range keeps the tempo following it
+    run(ed, 'for 5 6 tempo 140')
+    assert [tab.tempo_at(n) for n in range(1, 11)] == \
+        [100] * 2 + [80] * 2 + [140] * 2 + [80] * 4
+    run(ed, 'for 4 6 tempo off')
+    assert [tab.tempo_at(n) for n in range(1, 11)] == \
+        [100] * 2 + [80] * 8
+    assert list(tab.tempo_bars()) == [3, 7]
+
+    run(ed, 'tempo')
+    assert ed.st == '80 bpm'
+    run(ed, 'tempo fast')
+    assert ed.st == 'Invalid argument'
+    # too slow for the Set Tempo event of MIDI files
+    run(ed, 'tempo 2')
+    assert ed.st == 'Tempo must be at least 3.58 bpm'
+    assert tab.tempo_at(3) == 80
+
+
+def test_undo_redo(make_editor):
+    tab = make_tab()
+    ed = make_editor(tab)
+    ed.register_handlers(vitabs.commands)
+    ed.checkpoint()
+    ed.move_cursor(3, 1)
+    ed.checkpoint()
+    run(ed, 'label chorus')
+    assert ed.checkpoint()
+    ed.move_cursor(8, 2)
+    ed.nmap[ord('u')](ed, None)
+    assert not hasattr(tab.bars[2], 'label')
+    assert tab.cursor_position() == (3, 1)
+    ed.nmap[curses.ascii.ctrl(ord('r'))](ed, None)
+    assert tab.bars[2].label == 'chorus'
+
+
+def test_registers(make_editor):
+    tab = make_tab(8)
+    for n, bar in enumerate(tab.bars):
+        bar.chords[0].strings[0] = Fret(n)
+    ed = make_editor(tab)
+    ed.register_handlers(vitabs.commands)
+    ed.checkpoint()
+
+    run(ed, 'for 2 4 yank a')
+    ed.move_cursor(8, 1)
+    ed.register = 'a'
+    ed.paste(50)
+    assert len(tab.bars) == 158
+    # pasted bars are decoded when accessed
+    assert not tab.bars.is_loaded(100)
+    assert [tab.bars[n].chords[0].strings[0].fret for n in range(8, 14)] == \
+        [1, 2, 3, 1, 2, 3]
+    tab.bars[8].chords[0].strings[0].fret = 12
+    assert tab.bars[11].chords[0].strings[0].fret == 1
+    assert tab.bars[1].chords[0].strings[0].fret == 1
+    assert tab.time_at_bar(159) == 158
+
+    # chords from one bar are pasted into the cursor bar
+    ed.move_cursor(1, 1)
+    ed.yank(ChordRange(tab, (1, 1), (1, 2)))
+    ed.paste()
+    assert len(tab.bars[0].chords) == 6
+    assert tab.bars[0].chords[1].strings[0].fret == 0
+    assert tab.cursor_position() == (1, 2)
+
+    ed.checkpoint()
+    ed.history.undo()
+    assert len(tab.bars[0].chords) == 4
+    ed.register = 'b'
+    ed.paste()
+    assert ed.st == 'Nothing in register'
+
+
+def test_range_kernels(make_editor):
+    tab = make_tab()
+    for bar in tab.bars:
+        for chord in bar.chords:
+            chord.strings[1] = Fret(5)
+    ed = make_editor(tab)
+    ed.register_handlers(vitabs.commands)
+    run(ed, 'for 2 3 transpose 3')
+    assert [b.chords[0].strings[1].fret for b in tab.bars[:4]] == \
+        [5, 8, 8, 5]
+    run(ed, 'for 1 1 symbol add hammer on')
+    assert tab.bars[0].chords[3].strings[1].has_symbol('hammer on')
+    run(ed, 'symbol add wobble')
+    assert ed.st.startswith('Usage')
+    run(ed, 'for 1 10 shift -2')
+    assert ed.st == 'Note moved off the fretboard'
+    assert 1 in tab.bars[0].chords[0].strings
+
+
+def test_retune_and_shift(make_editor):
+    tab = make_tab(2)
+    tab.bars[0].chords[0].strings[5] = Fret(3)
+    tab.bars[0].chords[1].strings[4] = Fret(5)
+    ed = make_editor(tab)
+    ed.register_handlers(vitabs.commands)
+    run(ed, 'retune -2')
+    assert tab.tuning[5] == 50
+    assert [tab.tuning[s] + f.fret
+            for s, f in tab.bars[0].chords[0].strings.items()] == [55]
+    # from the 2nd fret towards the 7th, G2 is at most at the 5th
+    ed.nmap[ord('>')](ed, 5)
+    assert fingering.hand_position(ChordRange(tab, (1, 1), (1, 4))) == 5
+    run(ed, 'retune 5')
+    assert ed.st == 'Can not play the chord at 1,1'
+    assert tab.tuning[5] == 50
+
+
+def test_rebar(make_editor):
+    tab = make_tab(3)
+    tab.bars[0].chords[3].strings[5] = Fret(3)
+    tab.bars[0].chords[3].duration = Fraction(1, 2)
+    ed = make_editor(tab)
+    ed.register_handlers(vitabs.commands)
+    run(ed, 'rebar')
+    assert len(tab.bars) == 4
+    assert ed.st == '3 bars rebarred into 4'
+    assert [len(b.chords) for b in tab.bars] == [4, 4, 4, 1]
+    assert tab.bars[1].chords[0].strings[5].has_symbol('tie')
@@ -0,0 +1,91 @@
+import random
+from fractions import Fraction
+
+from vitabs.layout import Layout
+from vitabs.tablature import Bar, Chord, Tablature
+
+
+def make_tab(nbars=200, seed=1):
+    rnd = random.Random(seed)
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, rnd.choice([2, 4, 8, 16])))
+                      for i in range(rnd.randint(1, 6))]
+        bars.append(bar)
+    tab.bars = bars
+    return tab
+
+
+def naive_lines(tab, width, first=1):
+    '''Line breaking as done by drawing bars one by one'''
+    lines = [[first]]
+    x = 2
+    for n in range(first, len(tab.bars) + 1):
+        bar_width = tab.bars[n - 1].total_width()
+        if x + bar_width >= width and x != 2:
+            lines.append([n])
+            x = 2
+        lines[-1].append(x)
+        x += bar_width + 1
+    return lines
+
+
+def layout_lines(layout):
+    lines = []
+    i = 0
+    while layout.line(i) is not None:
+        first, last = layout.line(i)
+        lines.append([first] + [layout.position(n)[1]
+                                for n in range(first, last + 1)])
+        assert all(layout.line_of(n) == i for n in range(first, last + 1))
+        i += 1
+    return lines
+
+
+def test_matches_naive_wrapping():
+    tab = make_tab()
+    for width in (20, 57, 80, 133):
+        for first in (1, 17):
+            layout = Layout(tab, width, first)
+            assert layout_lines(layout) == naive_lines(tab, width, first)
+
+
+def test_reflow_after_edits():
+    tab = make_tab()
+    layout = Layout(tab, 80)
+    layout.line_of(len(tab.bars))
+    tab.bars[50].chords.append(Chord(Fraction(1, 16)))
+    tab.bars[120].chords[0].duration = Fraction(1, 1)
+    del tab.bars[10]
+    tab.bars.insert(150, Bar())
+    layout.sync()
+    assert layout_lines(layout) == naive_lines(tab, 80)
+
+
+def test_chord_offsets():
+    tab = make_tab()
+    layout = Layout(tab, 80)
+    bar = tab.bars[3]
+    offset = 1
+    for i, chord in enumerate(bar.chords):
+        assert layout.chord_offset(bar, i + 1) == offset
+        offset += bar.chord_width(chord)*2 + 1
+    bar.chords[0].duration = Fraction(1, 32)
+    layout.sync()
+    assert layout.chord_offset(bar, 2) == bar.chord_width(bar.chords[0])*2 + 2
+
+
+def test_editor_cursor_follows_drawing(make_editor):
+    ed = make_editor(make_tab(), height=33, width=90)
+    for n in range(1, ed.last_visible_bar + 1):
+        ed.move_cursor(n, 1)
+        y, x, width, num = ed.bar_positions[ed.tab.bars[n - 1]]
+        assert (ed.cy, ed.cx) == (y + 1, x + 1)
+    assert ed.last_visible_bar == ed.lines[-1][2]
+    assert len(ed.lines) == 4
+
+    ed.move_cursor(ed.last_visible_bar + 1, 1)
+    assert ed.first_visible_bar == ed.tab.cursor_bar
+    assert (ed.cy, ed.cx) == (2, 3)
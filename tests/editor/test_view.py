@@ -0,0 +1,71 @@
+from fractions import Fraction
+
+from vitabs.tablature import Bar, Chord, Fret, Tablature
+
+
+def make_tab(nbars=60):
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(4)]
+        bar.chords[n % 4].strings[n % 6] = Fret(n % 13)
+        bars.append(bar)
+    tab.bars = bars
+    return tab
+
+
+def assert_up_to_date(ed):
+    shown = ed.stdscr.text()
+    ed.redraw_view()
+    assert shown == ed.stdscr.text()
+
+
+def no_erase(ed):
+    def erase():
+        raise AssertionError('full redraw')
+    ed.stdscr.erase = erase
+
+
+def test_fret_edit_redraws_bar(make_editor):
+    ed = make_editor(make_tab())
+    no_erase(ed)
+    ed.tab.bars[5].chords[2].strings[3] = Fret(12)
+    ed.tab.bars[6].chords[2].strings[0].symbols.append('bend')
+    ed.update_view()
+    del ed.stdscr.erase
+    assert_up_to_date(ed)
+
+
+def test_width_change_reflows(make_editor):
+    ed = make_editor(make_tab())
+    no_erase(ed)
+    ed.tab.bars[4].chords.insert(0, Chord(Fraction(1, 16)))
+    ed.tab.bars[20].chords[0].duration = Fraction(1, 32)
+    ed.update_view()
+    del ed.stdscr.erase
+    assert_up_to_date(ed)
+
+
+def test_meta_rows(make_editor):
+    for meta in ('meter', 'length', 'label'):
+        ed = make_editor(make_tab())
+        ed.visible_meta = meta
+        ed.redraw_view()
+        last = ed.lines[0][2]
+        bar = ed.tab.bars[last - 1]
+        bar.sig_num = 3
+        bar.invalidate()
+        ed.tab.bars[1].chords[1].duration = Fraction(1, 8)
+        ed.tab.bars[2].label = 'verse'
+        ed.tab.update_bar(3)
+        ed.update_view()
+        assert_up_to_date(ed)
+
+
+def test_structural_change(make_editor):
+    ed = make_editor(make_tab())
+    del ed.tab.bars[2]
+    ed.tab.bars.insert(0, Bar())
+    ed.update_view()
+    assert_up_to_date(ed)
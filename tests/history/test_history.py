@@ -0,0 +1,96 @@
+from fractions import Fraction
+
+from vitabs import tabfile
+from vitabs.history import History
+from vitabs.tablature import Bar, Chord, Fret, Tablature
+
+
+def make_tab(nbars=10):
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(4)]
+        bar.chords[0].strings[n % 6] = Fret(n)
+        bars.append(bar)
+    tab.bars = bars
+    return tab
+
+
+def contents(tab):
+    return [tabfile.encode_bar(b, {}) for b in tab.bars]
+
+
+def test_undo_redo_edits_and_splices():
+    tab = make_tab()
+    history = History(tab)
+    states = [contents(tab)]
+
+    tab.bars[2].chords[1].strings[0] = Fret(5)
+    tab.bars[2].chords[1].strings[0].symbols = ['bend']
+    tab.cursor_bar = 3
+    assert history.checkpoint()
+    states.append(contents(tab))
+
+    del tab.bars[4:6]
+    tab.bars.insert(1, Bar())
+    tab.bars[1].chords[0].strings[2] = Fret(7)
+    tab.bars[0].label = 'intro'
+    tab.update_bar(1)
+    assert history.checkpoint()
+    states.append(contents(tab))
+
+    # moving around changes nothing
+    tab.cursor_bar = 7
+    assert not history.checkpoint()
+
+    assert history.undo() == (3, 1)
+    assert contents(tab) == states[1]
+    assert history.undo() == (1, 1)
+    assert contents(tab) == states[0]
+    assert history.undo() is None
+
+    assert history.redo() == (3, 1)
+    assert contents(tab) == states[1]
+    assert history.redo() == (3, 1)
+    assert contents(tab) == states[2]
+    assert history.redo() is None
+
+
+def test_new_change_drops_redo():
+    tab = make_tab()
+    history = History(tab)
+    tab.bars[0].chords[0].strings[0] = Fret(1)
+    history.checkpoint()
+    history.undo()
+    tab.bars.append(Bar())
+    history.checkpoint()
+    assert history.redo() is None
+    history.undo()
+    assert contents(tab) == contents(make_tab())
+
+
+def test_steps_share_bars():
+    tab = make_tab(1000)
+    history = History(tab)
+    for i in range(20):
+        tab.bars[i].chords[0].strings[5] = Fret(i)
+        history.checkpoint()
+    for step in history.undo_steps:
+        assert not step.splices
+        assert len(step.edits) == 1
+    i, old, new = history.undo_steps[-1].edits[0]
+    assert history.snapshots[i] is new
+
+
+def test_unloaded_bars_stay_unloaded(tmp_path):
+    tabfile.save(make_tab(50), str(tmp_path / 'a.tab'))
+    tab = tabfile.load(str(tmp_path / 'a.tab'))
+    history = History(tab)
+    tab.bars[10].chords[0].strings[0] = Fret(3)
+    del tab.bars[20]
+    history.checkpoint()
+    loaded = sum(tab.bars.is_loaded(i) for i in range(len(tab.bars)))
+    history.undo()
+    assert sum(tab.bars.is_loaded(i) for i in range(len(tab.bars))) <= loaded
+    assert contents(tab) == contents(make_tab(50))
@@ -0,0 +1,104 @@
+from fractions import Fraction
+
+from vitabs import midi
+from vitabs.music import TICKS_PER_WHOLE
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+QUARTER = TICKS_PER_WHOLE // 4
+
+
+def compile_frets(frets, symbols):
+    '''Compile quarter notes on the low string, symbols maps chord numbers
+    to lists of symbols'''
+    tab = Tablature()
+    bar = Bar()
+    bar.chords = [Chord(Fraction(1, 4)) for fret in frets]
+    for i, (chord, fret) in enumerate(zip(bar.chords, frets)):
+        chord.strings[5] = Fret(fret)
+        chord.strings[5].symbols.extend(symbols.get(i, ()))
+    tab.bars = [bar]
+    return midi.compile_range(ChordRange(tab, (1, 1), (1, len(frets))))
+
+
+def events(stream, status):
+    return [(t, d1, d2) for t, s, d1, d2 in stream if s & 0xF0 == status]
+
+
+def bend_values(stream):
+    return [(t, d1 | d2 << 7) for t, d1, d2 in events(stream, midi.PITCH_BEND)]
+
+
+def test_bend_and_release():
+    bends = bend_values(compile_frets([5], {0: ['bend']}))
+    assert bends[0] == (0, midi.BEND_CENTER)
+    assert bends[-2] == (QUARTER / 4, 0x3FFF)
+    assert bends[-1] == (QUARTER, midi.BEND_CENTER)
+    assert [v for t, v in bends[:-1]] == sorted(v for t, v in bends[:-1])
+
+    stream = compile_frets([5], {0: ['release']})
+    # bent before the note is struck
+    assert list(stream)[0][1] == midi.PITCH_BEND
+    assert bend_values(stream)[0] == (0, 0x3FFF)
+    assert bend_values(stream)[-1] == (QUARTER, midi.BEND_CENTER)
+
+
+def test_one_bend_per_chord():
+    tab = Tablature()
+    bar = Bar()
+    bar.chords = [Chord(Fraction(1, 4))]
+    for s in (4, 5):
+        bar.chords[0].strings[s] = Fret(5)
+        bar.chords[0].strings[s].symbols.append('bend')
+    tab.bars = [bar]
+    stream = midi.compile_range(ChordRange(tab, (1, 1), (1, 1)))
+    assert len(bend_values(stream)) == midi.BEND_STEPS + 2
+
+
+def test_hammer_on_is_legato():
+    stream = compile_frets([5, 7], {1: ['hammer on']})
+    ons = events(stream, midi.NOTE_ON)
+    assert ons[1] == (QUARTER, 59, midi.LEGATO_VELOCITY)
+    offs = events(stream, midi.NOTE_OFF)
+    # the first note is released after the second is struck
+    assert offs[0] == (QUARTER + midi.LEGATO_OVERLAP, 57, midi.VELOCITY)
+
+
+def test_slide_passes_frets():
+    stream = compile_frets([5, 8], {0: ['slide up']})
+    ons = events(stream, midi.NOTE_ON)
+    assert [(t, n) for t, n, v in ons] == [
+        (0, 57), (QUARTER / 2, 58), (QUARTER * 3 / 4, 59), (QUARTER, 60)]
+    # without a fret to slide to
+    ons = events(compile_frets([5], {0: ['slide down']}), midi.NOTE_ON)
+    assert [n for t, n, v in ons] == [57, 56, 55]
+
+
+def test_tremolo_retriggers():
+    stream = compile_frets([5], {0: ['tremolo']})
+    ons = events(stream, midi.NOTE_ON)
+    assert len(ons) == QUARTER // midi.TREMOLO_TICKS
+    offs = events(stream, midi.NOTE_OFF)
+    assert [t for t, n, v in offs][-1] == QUARTER
+    # each repetition is released before the next one
+    notes = [(t, s) for t, s, d1, d2 in stream if s in (0x80, 0x90)]
+    assert notes[1:3] == [(midi.TREMOLO_TICKS, 0x80),
+                          (midi.TREMOLO_TICKS, 0x90)]
+
+
+def test_custom_articulation(monkeypatch):
+    monkeypatch.setattr(midi, 'articulations', dict(midi.articulations))
+    def accent(stream, note):
+        tick, pitch, velocity = note.onsets[0]
+        note.onsets[0] = (tick, pitch, 127)
+    midi.articulation('tremolo')(accent)
+    ons = events(compile_frets([5], {0: ['tremolo']}), midi.NOTE_ON)
+    assert ons == [(0, 57, 127)]
+
+
+def test_tie():
+    stream = compile_frets([5, 5, 5, 7], {1: ['tie'], 2: ['tie'], 3: ['tie']})
+    ons = events(stream, midi.NOTE_ON)
+    offs = events(stream, midi.NOTE_OFF)
+    # the tie to another fret is struck
+    assert [t for t, d1, d2 in ons] == [0, 3 * QUARTER]
+    assert [t for t, d1, d2 in offs] == [3 * QUARTER, 4 * QUARTER]
@@ -0,0 +1,66 @@
+from fractions import Fraction
+
+from vitabs import midi
+from vitabs.music import TICKS_PER_WHOLE, standard_E
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+
+def make_tab():
+    tab = Tablature()
+    bars = []
+    for n in range(3):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(4)]
+        for i, chord in enumerate(bar.chords):
+            chord.strings[5] = Fret(n + i)
+        bars.append(bar)
+    bars[1].chords[1].strings[0] = Fret(3)
+    bars[1].chords[1].strings[0].symbols.append('vibrato')
+    tab.bars = bars
+    return tab
+
+
+def test_events():
+    tab = make_tab()
+    crange = ChordRange(tab, (1, 3), (2, 2))
+    stream = midi.compile_range(crange, standard_E, 90, 25)
+    quarter = TICKS_PER_WHOLE / 4
+    assert stream.bpm == 90
+    assert stream.length == 4 * quarter
+    assert list(stream.chord_ticks) == [0, quarter, 2 * quarter, 3 * quarter]
+    assert stream.positions == [(1, 3), (1, 4), (2, 1), (2, 2)]
+    assert list(stream.ticks) == sorted(stream.ticks)
+
+    events = list(stream)
+    assert events[0] == (0, midi.PROGRAM_CHANGE, 25, 0)
+    notes = [(t, s, n) for t, s, n, v in events if s & 0xF0 in (0x80, 0x90)]
+    # notes ending and starting at the same tick are released first
+    assert notes[:4] == [(0, 0x90, 54), (quarter, 0x80, 54),
+                         (quarter, 0x90, 55), (2 * quarter, 0x80, 55)]
+    assert notes[-4:] == [(3 * quarter, 0x90, 54), (3 * quarter, 0x90, 79),
+                          (4 * quarter, 0x80, 54), (4 * quarter, 0x80, 79)]
+    bends = [t for t, s, n, v in events if s == midi.PITCH_BEND]
+    assert len(bends) == midi.VIBRATO_STEPS + 1
+    assert 3 * quarter <= min(bends) and max(bends) == 4 * quarter
+    assert sum(1 for e in events if e[1] == midi.CHORD_END) == 4
+
+
+def test_fractional_ticks():
+    tab = make_tab()
+    tab.bars[0].chords[0].duration = Fraction(1, 11)
+    stream = midi.compile_range(ChordRange(tab, (1, 1), (1, 2)))
+    assert stream.chord_ticks[1] == TICKS_PER_WHOLE / 11
+
+
+def test_cache_invalidated_on_edit():
+    tab = make_tab()
+    cache = midi.StreamCache(tab)
+    crange = ChordRange(tab, (1, 1), (3, 4))
+    stream = cache.get(crange, standard_E, 120)
+    assert cache.get(crange, standard_E, 120) is stream
+    assert cache.get(crange, standard_E, 100) is not stream
+
+    tab.bars[2].chords[0].strings[0] = Fret(1)
+    changed = cache.get(crange, standard_E, 120)
+    assert changed is not stream
+    assert len(changed) == len(stream) + 2
@@ -0,0 +1,130 @@
+import struct
+from fractions import Fraction
+
+from vitabs import midi
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+
+def make_tab():
+    tab = Tablature()
+    bars = []
+    for n in range(4):
+        bar = Bar(3 if n == 2 else 4, 4)
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(bar.sig_num)]
+        for i, chord in enumerate(bar.chords):
+            chord.strings[4] = Fret(i)
+        bars.append(bar)
+    bars[0].chords[0].strings[0] = Fret(0)
+    bars[0].chords[0].strings[0].symbols.append('vibrato')
+    tab.bars = bars
+    tab.bpm = 100
+    tab.instrument = 25
+    return tab
+
+
+def read_var_len(data, i):
+    value = 0
+    while True:
+        value = (value << 7) | (data[i] & 0x7F)
+        i += 1
+        if not data[i - 1] & 0x80:
+            return value, i
+
+
+def parse_track(data):
+    '''Returns (absolute tick, message bytes) of a track, expanding
+    running status'''
+    events = []
+    i = tick = 0
+    running = None
+    while i < len(data):
+        delta, i = read_var_len(data, i)
+        tick += delta
+        if data[i] == 0xFF:
+            length = data[i + 2]
+            events.append((tick, bytes(data[i : i + 3 + length])))
+            i += 3 + length
+            continue
+        if data[i] & 0x80:
+            running = data[i]
+            i += 1
+        size = 1 if running & 0xF0 in (0xC0, 0xD0) else 2
+        events.append((tick, bytes([running]) + bytes(data[i : i + size])))
+        i += size
+    return events
+
+
+def parse_smf(data):
+    assert data[:4] == b'MThd'
+    length, fmt, ntracks, ppq = struct.unpack('>IHHH', data[4:14])
+    tracks = []
+    i = 8 + length
+    for n in range(ntracks):
+        assert data[i : i + 4] == b'MTrk'
+        (length,) = struct.unpack('>I', data[i + 4 : i + 8])
+        tracks.append(parse_track(data[i + 8 : i + 8 + length]))
+        i += 8 + length
+    assert i == len(data)
+    return fmt, ppq, tracks
+
+
+def test_var_len():
+    assert midi.var_len(0) == b'\x00'
+    assert midi.var_len(0x7F) == b'\x7f'
+    assert midi.var_len(0x80) == b'\x81\x00'
+    assert midi.var_len(0x0FFFFFFF) == b'\xff\xff\xff\x7f'
+
+
+def test_export(tmp_path):
+    tab = make_tab()
+    path = str(tmp_path / 'a.mid')
+    midi.export(tab, path)
+    fmt, ppq, (conductor, track) = parse_smf(open(path, 'rb').read())
+    assert fmt == 1 and ppq == midi.PPQ
+
+    assert conductor[0] == (0, b'\xff\x51\x03' + (600000).to_bytes(3, 'big'))
+    meters = [(t, e[3:5]) for t, e in conductor if e[1] == 0x58]
+    assert meters == [(0, bytes([4, 2])), (8 * ppq, bytes([3, 2])),
+                      (11 * ppq, bytes([4, 2]))]
+    assert conductor[-1][1] == b'\xff\x2f\x00'
+
+    assert track[0] == (0, bytes([0xC0, 25]))
+    ons = [(t, e[1]) for t, e in track if e[0] == 0x90]
+    assert ons[:3] == [(0, 57), (0, 76), (ppq, 58)]
+    assert len(ons) == 16
+    offs = [t for t, e in track if e[0] == 0x80]
+    assert max(offs) == 15 * ppq
+    bends = [t for t, e in track if e[0] == 0xE0]
+    assert len(bends) == midi.VIBRATO_STEPS + 1 and max(bends) == ppq
+
+
+def test_export_range(tmp_path):
+    tab = make_tab()
+    path = str(tmp_path / 'a.mid')
+    midi.export(tab, path, ChordRange(tab, (2, 3), (3, 1)))
+    fmt, ppq, (conductor, track) = parse_smf(open(path, 'rb').read())
+    ons = [(t, e[1]) for t, e in track if e[0] == 0x90]
+    assert ons == [(0, 59), (ppq, 60), (2 * ppq, 57)]
+    meters = [(t, e[3:5]) for t, e in conductor if e[1] == 0x58]
+    assert meters == [(0, bytes([4, 2])), (2 * ppq, bytes([3, 2]))]
+
+
+def test_tempo_changes(tmp_path):
+    tab = make_tab()
+    tab.bars[2].tempo = 50
+    path = str(tmp_path / 'a.mid')
+    midi.export(tab, path, ChordRange(tab, (2, 1), (4, 1)))
+    fmt, ppq, (conductor, track) = parse_smf(open(path, 'rb').read())
+    tempos = [(t, e[3:]) for t, e in conductor if e[1] == 0x51]
+    assert tempos == [(0, (600000).to_bytes(3, 'big')),
+                      (4 * ppq, (1200000).to_bytes(3, 'big'))]
+
+
+def test_slowest_tempo(tmp_path):
+    tab = make_tab()
+    tab.bpm = 2
+    path = str(tmp_path / 'a.mid')
+    midi.export(tab, path)
+    fmt, ppq, (conductor, track) = parse_smf(open(path, 'rb').read())
+    assert [e[3:] for t, e in conductor if e[1] == 0x51] == \
+        [bytes([0xFF, 0xFF, 0xFF])]
@@ -0,0 +1,48 @@
+import pytest
+
+from vitabs.player import Player
+from vitabs.scheduler import Scheduler
+
+
+class FakeClock:
+    '''Monotonic nanosecond clock which only advances when slept on or
+    explicitly, sleeping overshoots by a fixed amount'''
+    def __init__(self, overshoot=0):
+        self.now = 0
+        self.overshoot = overshoot
+
+    def __call__(self):
+        # reading the clock takes a little time, so that polling ends
+        self.now += 1000
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += int(seconds * 1e9) + self.overshoot
+
+
+class FakeMidiOut:
+    '''Records messages with the time they were sent, each send takes
+    cost nanoseconds'''
+    def __init__(self, clock, cost=0):
+        self.clock = clock
+        self.cost = cost
+        self.messages = []
+
+    def send_message(self, message):
+        self.messages.append((self.clock.now, list(message)))
+        self.clock.now += self.cost
+
+
+@pytest.fixture
+def clock():
+    return FakeClock(overshoot=50000)
+
+
+@pytest.fixture
+def make_player(clock):
+    '''Returns a function creating a player sending to a fake output on the
+    fake clock, each message taking cost nanoseconds'''
+    def make(cost=0):
+        return Player(midiout=FakeMidiOut(clock, cost),
+                      scheduler=Scheduler(clock=clock, sleep=clock.sleep))
+    return make
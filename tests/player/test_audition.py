@@ -0,0 +1,40 @@
+import time
+
+from vitabs.midiout import Recorder
+from vitabs.player import Player
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end
+        time.sleep(0.001)
+
+
+def test_notes_released_by_timer():
+    recorder = Recorder()
+    player = Player(backend=recorder)
+    player.audition.length = 0.05
+    start = time.monotonic()
+    player.audition.play([52, 59], 25)
+    # struck at once, without waiting for the release
+    assert time.monotonic() - start < 0.05
+    assert recorder.messages() == [[0xC0, 25], [0x90, 52, 100],
+                                   [0x90, 59, 100]]
+    wait_for(lambda: len(recorder.batches) == 2)
+    assert time.monotonic() - start >= 0.05
+    assert recorder.batches[1][1] == [[0x80, 52, 0], [0x80, 59, 0]]
+    assert player.sounding == set()
+    player.audition.close()
+
+
+def test_next_chord_releases_previous():
+    recorder = Recorder()
+    player = Player(backend=recorder)
+    player.audition.play([52], 25)
+    player.audition.play([53], 25)
+    assert recorder.messages() == [[0xC0, 25], [0x90, 52, 100],
+                                   [0x80, 52, 0], [0x90, 53, 100]]
+    player.audition.close()
+    assert recorder.messages()[-1] == [0x80, 53, 0]
+    assert not player.audition.thread
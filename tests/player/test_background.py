@@ -0,0 +1,97 @@
+import threading
+import time
+from fractions import Fraction
+
+from vitabs.player import Player
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = []
+
+    def send_message(self, message):
+        with self.lock:
+            self.messages.append(list(message))
+
+
+def make_tab(nbars, bpm):
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(4)]
+        for i, chord in enumerate(bar.chords):
+            chord.strings[5] = Fret(i)
+        bars.append(bar)
+    tab.bars = bars
+    tab.bpm = bpm
+    return tab
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end
+        time.sleep(0.001)
+
+
+def test_plays_in_background():
+    tab = make_tab(4, 6000)
+    player = Player(midiout=Recorder())
+    player.start(ChordRange(tab, (1, 1), tab.last_position()))
+    wait_for(lambda: not player.playing())
+    ons = [m for m in player.midiout.messages if m[0] == 0x90]
+    assert len(ons) == 16
+    assert player.position() == (4, 4)
+    assert player.midiout.messages[-1] == [0xB0, 123, 0]
+
+
+def test_stop_pause_and_seek():
+    # a quarter note lasts 50 ms
+    tab = make_tab(20, 1200)
+    out = Recorder()
+    player = Player(midiout=out)
+    player.start(ChordRange(tab, (1, 1), tab.last_position()))
+    assert player.playing()
+    wait_for(lambda: player.position() >= (2, 1))
+
+    player.pause()
+    assert not player.playing()
+    paused_at = player.position()
+    assert out.messages[-1] == [0xB0, 123, 0]
+    assert player.sounding == set()
+    time.sleep(0.1)
+    assert player.position() == paused_at
+
+    player.seek_bars(5)
+    assert player.position() == (paused_at[0] + 5, 1)
+    player.pause()
+    assert player.playing()
+    wait_for(lambda: player.position() > (paused_at[0] + 5, 1))
+
+    player.seek_bars(-2)
+    wait_for(lambda: player.position() < (paused_at[0] + 5, 1))
+
+    player.stop()
+    assert not player.playing()
+    assert out.messages[-1] == [0xB0, 123, 0]
+    count = len(out.messages)
+    time.sleep(0.1)
+    assert len(out.messages) == count
+    assert player.sounding == set()
+
+
+def test_program_change_after_stopping():
+    tab = make_tab(20, 1200)
+    player = Player(midiout=Recorder())
+    crange = ChordRange(tab, (1, 1), tab.last_position())
+    player.start(crange, instrument=24)
+    wait_for(lambda: player.position() >= (1, 3))
+    player.start(crange, instrument=25)
+    player.stop()
+    messages = player.midiout.messages
+    # the program changes once the first playback has silenced its notes
+    assert messages[0] == [0xC0, 24]
+    assert messages.index([0xC0, 25]) > messages.index([0xB0, 123, 0])
@@ -0,0 +1,65 @@
+import io
+
+from vitabs.midiout import Output, RawBackend, Recorder, pack
+from vitabs.player import Player
+from vitabs.scheduler import Scheduler
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+
+def test_pack_uses_running_status():
+    data = pack([[0x90, 40, 100], [0x90, 45, 100], [0x80, 40, 0],
+                 [0xC0, 24], [0x80, 45, 0]])
+    assert data == bytes([0x90, 40, 100, 45, 100, 0x80, 40, 0,
+                          0xC0, 24, 0x80, 45, 0])
+
+
+def test_redundant_bends_dropped():
+    recorder = Recorder()
+    output = Output(recorder)
+    output.send([0xE0, 0, 40])
+    output.send([0xE0, 0, 50])
+    output.send([0xE1, 0, 40])
+    output.flush()
+    # same as the bend already sent
+    output.send([0xE0, 0, 50])
+    output.flush()
+    # changed and changed back within a batch
+    output.send([0x90, 40, 100])
+    output.send([0xE0, 0, 60])
+    output.send([0xE0, 0, 50])
+    output.flush()
+    assert [batch for t, batch in recorder.batches] == [
+        [[0xE0, 0, 50], [0xE1, 0, 40]],
+        [[0x90, 40, 100]]]
+
+
+def test_one_write_per_tick(clock):
+    tab = Tablature()
+    bar = Bar()
+    bar.chords = [Chord() for i in range(4)]
+    for i, chord in enumerate(bar.chords):
+        chord.strings[0] = Fret(i)
+        chord.strings[1] = Fret(i)
+    tab.bars = [bar]
+    recorder = Recorder(clock)
+    player = Player(backend=recorder,
+                    scheduler=Scheduler(clock=clock, sleep=clock.sleep))
+    player.play(ChordRange(tab, (1, 1), tab.last_position()))
+    # a write for each chord (ending the previous one) and the last end,
+    # then silencing
+    assert len(recorder.batches) == 4 + 1 + 1
+    assert recorder.batches[1][1] == [[0x80, 76, 100], [0x80, 71, 100],
+                                      [0x90, 77, 100], [0x90, 72, 100]]
+    assert player.sounding == set()
+
+
+def test_raw_backend_writes_bytes():
+    outfile = io.BytesIO()
+    player = Player(backend=RawBackend(outfile))
+    player.set_instrument(24)
+    player.output.send([0x90, 40, 100])
+    player.output.send([0x90, 45, 100])
+    player.output.flush()
+    player.silence()
+    assert outfile.getvalue() == bytes([0xC0, 24, 0x90, 40, 100, 45, 100,
+                                        0x80, 40, 0, 45, 0, 0xB0, 123, 0])
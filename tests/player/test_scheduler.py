@@ -0,0 +1,101 @@
+from fractions import Fraction
+
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+
+def make_tab(nbars=50):
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 8)) for i in range(8)]
+        for i, chord in enumerate(bar.chords):
+            chord.strings[i % 6] = Fret(i)
+        bars.append(bar)
+    if nbars > 3:
+        bars[3].chords[2].strings[2].symbols.append('vibrato')
+    tab.bars = bars
+    tab.bpm = 120
+    return tab
+
+
+def note_ons(player):
+    return [(t, m) for t, m in player.midiout.messages if m[0] == 0x90]
+
+
+def test_deadlines_are_absolute(clock, make_player):
+    tab = make_tab()
+    # every message and every chord handler call takes 2 ms
+    player = make_player(2000000)
+    def slow_handler():
+        clock.now += 2000000
+        return True
+    player.post_play_chord = slow_handler
+    stats = player.play(ChordRange(tab, (1, 1), tab.last_position()))
+
+    eighth = 240e9 / 120 / 8
+    ons = note_ons(player)
+    assert len(ons) == 400
+    start = ons[0][0]
+    for i, (t, m) in enumerate(ons):
+        # late by the preceding messages of the same instant, never more
+        assert 0 <= t - start - i * eighth < 10e6
+    assert stats.count > 400
+    assert abs(stats.drift()) < 10e6
+
+
+def test_vibrato_scheduled_not_slept(make_player):
+    tab = make_tab(5)
+    player = make_player()
+    player.play(ChordRange(tab, (4, 3), (4, 3)))
+    bends = [t for t, m in player.midiout.messages if m[0] == 0xE0]
+    assert len(bends) == 21
+    step = 240e9 / 120 / 8 / 20
+    for i in range(20):
+        assert abs(bends[i] - bends[0] - i * step) < 1e6
+
+
+def test_stop_silences(make_player):
+    tab = make_tab(5)
+    player = make_player()
+    played = []
+    def stop_after_two():
+        played.append(1)
+        return len(played) < 2
+    player.post_play_chord = stop_after_two
+    player.play(ChordRange(tab, (1, 1), tab.last_position()))
+    assert len(note_ons(player)) == 2
+    assert player.sounding == set()
+
+
+def test_continuous_loops_on_one_timeline(clock, make_player):
+    tab = make_tab(2)
+    player = make_player(1000000)
+    repeats = []
+    def before_repeat():
+        repeats.append(1)
+        clock.now += 5000000
+        return len(repeats) <= 3
+    player.before_repeat = before_repeat
+    player.play(ChordRange(tab, (1, 1), tab.last_position()), True)
+    ons = note_ons(player)
+    assert len(ons) == 48
+    bar = 240e9 / 120
+    assert abs(ons[32][0] - ons[0][0] - 4 * bar) < 10e6
+
+
+def test_interrupt_silences(make_player):
+    tab = make_tab(5)
+    player = make_player()
+    sent = player.midiout.messages
+    send_message = player.midiout.send_message
+    def interrupting_send(message):
+        send_message(message)
+        if len(sent) == 7:
+            raise KeyboardInterrupt
+    player.midiout.send_message = interrupting_send
+    player.play(ChordRange(tab, (1, 1), tab.last_position()))
+    last_on = [m for t, m in sent if m[0] == 0x90][-1]
+    assert sent[-2][1] == [0x80, last_on[1], 0]
+    assert sent[-1][1] == [0xB0, 123, 0]
+    assert player.sounding == set()
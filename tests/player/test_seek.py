@@ -0,0 +1,76 @@
+import time
+
+from vitabs.midi import compile_range
+from vitabs.player import Player
+from vitabs.tablature import ChordRange
+
+from test_background import Recorder, make_tab, wait_for
+
+
+def test_stream_index():
+    tab = make_tab(4, 120)
+    tab.bars[2].tempo = 240
+    stream = compile_range(ChordRange(tab, (1, 1), tab.last_position()),
+                           bpm=120)
+    assert stream.tick_of((1, 1)) == 0
+    assert stream.tick_of((2, 3)) == stream.chord_ticks[6]
+    # a position between chords is the next one
+    assert stream.tick_of((3, 0)) == stream.chord_ticks[8]
+    # two bars at 120 bpm last 4 s, the third one lasts 1 s
+    assert stream.tick_at_seconds(3.9) == stream.chord_ticks[7]
+    assert stream.tick_at_seconds(4.3) == stream.chord_ticks[9]
+    assert stream.tick_at_seconds(100) == stream.chord_ticks[-1]
+
+
+def test_start_and_seek():
+    tab = make_tab(8, 6000)
+    player = Player(midiout=Recorder())
+    player.start(ChordRange(tab, (1, 1), tab.last_position()),
+                 position=(7, 1))
+    wait_for(lambda: not player.playing())
+    ons = [m for m in player.midiout.messages if m[0] == 0x90]
+    assert len(ons) == 8
+
+    # a quarter note lasts 50 ms
+    tab = make_tab(20, 1200)
+    player = Player(midiout=Recorder())
+    player.start(ChordRange(tab, (1, 1), tab.last_position()))
+    player.pause()
+    # a bar lasts 0.2 s
+    assert player.seek(seconds=1.33)
+    assert player.position() == (7, 3)
+    assert player.seek(position=(15, 2))
+    assert player.position() == (15, 2)
+    player.stop()
+    assert not player.seek(position=(1, 1))
+
+
+def test_resume_after_stop():
+    tab = make_tab(20, 1200)
+    player = Player(midiout=Recorder())
+    player.start(ChordRange(tab, (1, 1), tab.last_position()))
+    wait_for(lambda: player.position() >= (2, 1))
+    player.stop()
+    stopped_at = player.position()
+    time.sleep(0.1)
+    player.pause()
+    assert player.playing()
+    wait_for(lambda: player.position() > stopped_at)
+    assert player.position() < (stopped_at[0] + 2, 1)
+    player.stop()
+
+
+def test_loop_from_start_position():
+    tab = make_tab(4, 6000)
+    player = Player(midiout=Recorder())
+    repeats = []
+    def before_repeat():
+        repeats.append(player.position())
+        return len(repeats) < 3
+    player.before_repeat = before_repeat
+    player.start(ChordRange(tab, (1, 1), tab.last_position()), True,
+                 position=(3, 1))
+    wait_for(lambda: not player.playing())
+    assert repeats[1:] == [(4, 4), (4, 4)]
+    ons = [m for m in player.midiout.messages if m[0] == 0x90]
+    assert len(ons) == 16
@@ -0,0 +1,79 @@
+import wave
+from fractions import Fraction
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from vitabs import render
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+
+def make_tab(symbol=None, frets=(5, 7)):
+    tab = Tablature()
+    bar = Bar()
+    bar.chords = [Chord(Fraction(1, 2)) for fret in frets]
+    for chord, fret in zip(bar.chords, frets):
+        chord.strings[5] = Fret(fret)
+    if symbol:
+        bar.chords[0].strings[5].symbols.append(symbol)
+    tab.bars = [bar]
+    tab.bpm = 120
+    return tab
+
+
+def dominant_frequency(samples, rate=render.RATE):
+    '''Fundamental frequency between 50 and 500 Hz, by autocorrelation'''
+    spectrum = numpy.fft.rfft(samples, 2 * len(samples))
+    correlation = numpy.fft.irfft(abs(spectrum) ** 2)[:len(samples)]
+    low, high = rate // 500, rate // 50
+    return rate / float(low + numpy.argmax(correlation[low:high]))
+
+
+def first_chord(tab, rate=render.RATE):
+    samples = render.render(ChordRange(tab, (1, 1), tab.last_position()),
+                            bpm=tab.bpm, rate=rate)
+    # a half note at 120 bpm lasts a second
+    assert len(samples) == 2 * rate
+    assert abs(samples).max() <= 0.9 + 1e-9
+    return samples[:rate]
+
+
+def test_pitch_follows_tuning():
+    tab = make_tab()
+    samples = first_chord(tab)
+    a = render.frequency(render.standard_E[5] + 5)
+    assert abs(dominant_frequency(samples[:8192]) - a) / a < 0.02
+    tab.bars[0].chords[0].strings[5].fret = 0
+    tuning = list(render.standard_E)
+    tuning[5] -= 2
+    samples = render.render(ChordRange(tab, (1, 1), (1, 1)), tuning)
+    d = render.frequency(tuning[5])
+    assert abs(dominant_frequency(samples[:8192]) - d) / d < 0.02
+
+
+def test_bend_and_slide_raise_pitch():
+    a = render.frequency(render.standard_E[5] + 5)
+    b = render.frequency(render.standard_E[5] + 7)
+    plain = first_chord(make_tab())
+    assert abs(dominant_frequency(plain[-8192:]) - a) / a < 0.02
+    for symbol in ('bend', 'slide up'):
+        samples = first_chord(make_tab(symbol))
+        # the end of the note is two semitones up
+        assert abs(dominant_frequency(samples[-4096:]) - b) / b < 0.02
+
+
+def test_vibrato_changes_samples():
+    plain = first_chord(make_tab())
+    vibrato = first_chord(make_tab('vibrato'))
+    assert not numpy.allclose(plain, vibrato)
+
+
+def test_export_writes_wav(tmp_path):
+    tab = make_tab()
+    filename = str(tmp_path / 'out.wav')
+    render.export(tab, filename, rate=8000)
+    with wave.open(filename) as infile:
+        assert infile.getnchannels() == 1
+        assert infile.getframerate() == 8000
+        assert infile.getnframes() == 16000
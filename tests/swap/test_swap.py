@@ -0,0 +1,110 @@
+import os
+from fractions import Fraction
+
+from vitabs import swap, tabfile
+from vitabs.tablature import Bar, Chord, Fret, Tablature
+
+
+def make_tab(nbars=20):
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(4)]
+        bar.chords[n % 4].strings[n % 6] = Fret(n % 13)
+        bars.append(bar)
+    tab.bars = bars
+    return tab
+
+
+def dump(tab):
+    return [(b.sig_num, b.sig_den, getattr(b, 'label', None),
+             [(c.ticks, sorted((s, f.fret, list(f.symbols))
+                               for s, f in c.strings.items()))
+              for c in b.chords])
+            for b in tab.bars]
+
+
+def flush(autosave):
+    autosave.close(remove=False)
+
+
+def test_swap_name():
+    assert swap.swap_name('/a/b/song.tab') == '/a/b/.song.tab.swp'
+
+
+def test_snapshot_of_loaded_file(tmp_path):
+    path = str(tmp_path / 'a.tab')
+    tabfile.save(make_tab(), path)
+    tab = tabfile.load(path)
+    autosave = swap.Autosave(tab, swap.swap_name(path), interval=0)
+    autosave.tick()
+    assert not os.path.exists(swap.swap_name(path))
+
+    tab.bars[2].chords[1].strings[3] = Fret(7)
+    tab.bars[2].chords[1].strings[3].symbols.append('bend')
+    del tab.bars[5]
+    tab.bars.append(Bar())
+    tab.bpm = 100
+    autosave.tick()
+    flush(autosave)
+
+    recovered = tabfile.load(swap.swap_name(path))
+    assert dump(recovered) == dump(tab)
+    assert recovered.bpm == 100
+    assert swap.recovery_available(path)
+
+
+def test_only_changed_bars_encoded(tmp_path):
+    tab = make_tab()
+    name = str(tmp_path / 'swp')
+    autosave = swap.Autosave(tab, name, interval=0)
+    tab.bars[0].chords[0].strings[0] = Fret(1)
+    autosave.tick()
+    records = dict(autosave.records)
+    assert len(records) == 20
+
+    tab.bars[4].chords[0].strings[0] = Fret(2)
+    autosave.tick()
+    for bar, record in autosave.records.items():
+        assert (record is records[bar]) == (bar is not tab.bars[4])
+    flush(autosave)
+    assert dump(tabfile.load(name)) == dump(tab)
+
+
+def test_edits_between_snapshot_and_save(tmp_path):
+    path = str(tmp_path / 'a.tab')
+    tab = make_tab()
+    autosave = swap.Autosave(tab, swap.swap_name(path), interval=0)
+    tab.bars[0].chords[0].strings[0] = Fret(1)
+    autosave.tick()
+    tab.bars[0].chords[0].strings[0] = Fret(2)
+    tabfile.save(tab, path)
+    autosave.saved()
+    tab.bars[1].chords[0].strings[0] = Fret(3)
+    autosave.tick()
+    flush(autosave)
+    assert dump(tabfile.load(swap.swap_name(path))) == dump(tab)
+
+
+def test_saved_removes_swap(tmp_path):
+    path = str(tmp_path / 'a.tab')
+    tab = make_tab()
+    autosave = swap.Autosave(tab, swap.swap_name(path), interval=0)
+    tab.bars[0].chords[0].strings[0] = Fret(1)
+    autosave.tick()
+    tabfile.save(tab, path)
+    autosave.saved()
+    autosave.close()
+    assert not os.path.exists(swap.swap_name(path))
+    assert not swap.recovery_available(path)
+
+
+def test_interval(tmp_path):
+    tab = make_tab()
+    name = str(tmp_path / 'swp')
+    autosave = swap.Autosave(tab, name, interval=60)
+    tab.bars[0].chords[0].strings[0] = Fret(1)
+    autosave.tick()
+    flush(autosave)
+    assert not os.path.exists(name)
@@ -0,0 +1,116 @@
+import os
+from fractions import Fraction
+
+from vitabs import tabfile
+from vitabs.tablature import Bar, Chord, Fret, Tablature
+
+
+def make_tab(nbars=40):
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(4)]
+        bar.chords[n % 4].strings[n % 6] = Fret(n % 13)
+        bars.append(bar)
+    tab.bars = bars
+    return tab
+
+
+def dump(tab):
+    return [(b.sig_num, b.sig_den, getattr(b, 'label', None),
+             [(c.ticks, sorted((s, f.fret, list(f.symbols))
+                               for s, f in c.strings.items()))
+              for c in b.chords])
+            for b in tab.bars]
+
+
+def test_edits_appended(tmp_path):
+    path = str(tmp_path / 'a.tab')
+    tabfile.save(make_tab(), path)
+    tab = tabfile.load(path)
+    size = os.path.getsize(path)
+
+    tab.bars[3].chords[1].strings[2] = Fret(5)
+    tab.bars[3].chords[1].strings[2].symbols.append('bend')
+    tab.bars[5].chords[0].duration = Fraction(1, 8)
+    tab.bars.insert(10, Bar())
+    del tab.bars[20:22]
+    tab.bars[10].label = 'new'
+    tab.update_bar(11)
+    tab.bpm = 90
+    tabfile.save(tab, path)
+
+    assert size < os.path.getsize(path) < 2 * size
+    assert tab.journal.size() > 0
+    reloaded = tabfile.load(path)
+    assert dump(reloaded) == dump(tab)
+    assert reloaded.bpm == 90
+
+
+def test_save_without_changes_writes_nothing(tmp_path):
+    path = str(tmp_path / 'a.tab')
+    tabfile.save(make_tab(), path)
+    tab = tabfile.load(path)
+    size = os.path.getsize(path)
+    tab.bars[0].chords[0].strings[0] = Fret(1)
+    tabfile.save(tab, path)
+    grown = os.path.getsize(path)
+    assert grown > size
+    tabfile.save(tab, path)
+    assert os.path.getsize(path) == grown
+
+
+def test_incomplete_record_ignored(tmp_path):
+    path = str(tmp_path / 'a.tab')
+    tabfile.save(make_tab(), path)
+    tab = tabfile.load(path)
+    tab.bars[1].chords[0].strings[0] = Fret(7)
+    tabfile.save(tab, path)
+    expected = dump(tab)
+    size = os.path.getsize(path)
+
+    tab.bars[2].chords[0].strings[0] = Fret(9)
+    tabfile.save(tab, path)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)
+    assert dump(tabfile.load(path)) == expected
+
+    with open(path, 'r+b') as f:
+        f.truncate(size)
+        f.seek(size)
+        f.write(b'VJNL' + b'\xff' * 40)
+    reloaded = tabfile.load(path)
+    assert dump(reloaded) == expected
+
+    # the next save replaces the damaged record
+    reloaded.bars[4].chords[0].strings[0] = Fret(4)
+    tabfile.save(reloaded, path)
+    assert dump(tabfile.load(path)) == dump(reloaded)
+
+
+def test_compaction(tmp_path):
+    path = str(tmp_path / 'a.tab')
+    tabfile.save(make_tab(), path)
+    tab = tabfile.load(path)
+    base = tab.journal.base_size
+    for n in range(200):
+        tab.bars[n % 40].chords[0].strings[0] = Fret(n % 20)
+        tabfile.save(tab, path)
+        assert tab.journal.size() <= base // 2 + 200
+    assert os.path.getsize(path) < 2 * base
+    assert dump(tabfile.load(path)) == dump(tab)
+
+
+def test_external_change_rewrites(tmp_path):
+    path = str(tmp_path / 'a.tab')
+    tabfile.save(make_tab(), path)
+    tab = tabfile.load(path)
+    other = make_tab(5)
+    tabfile.save(other, path)
+
+    tab.bars[0].chords[0].strings[0] = Fret(3)
+    tabfile.save(tab, path)
+    assert tab.journal.size() == 0
+    assert dump(tabfile.load(path)) == dump(tab)
+    assert not os.path.exists(path + '.tmp')
@@ -0,0 +1,68 @@
+from fractions import Fraction
+
+from vitabs import tabfile
+from vitabs.tablature import Bar, Chord, Fret, Tablature
+
+
+def make_file(path, nbars=50):
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 8)) for i in range(n % 4 + 1)]
+        bar.chords[0].strings[n % 6] = Fret(n % 13)
+        if n % 10 == 0:
+            bar.label = 'part{}'.format(n)
+        bars.append(bar)
+    tab.bars = bars
+    tabfile.save(tab, str(path))
+    return tab
+
+
+def loaded_count(tab):
+    return sum(tab.bars.is_loaded(i) for i in range(len(tab.bars)))
+
+
+def test_bars_decoded_on_access(tmp_path):
+    make_file(tmp_path / 'a.tab')
+    tab = tabfile.load(str(tmp_path / 'a.tab'))
+    assert len(tab.bars) == 50
+    assert loaded_count(tab) == 0
+
+    assert tab.bars[7].chords[0].strings[1].fret == 7
+    assert loaded_count(tab) == 1
+    assert tab.bars[7] is tab.bars[7]
+
+
+def test_index_without_decoding(tmp_path):
+    orig = make_file(tmp_path / 'a.tab')
+    tab = tabfile.load(str(tmp_path / 'a.tab'))
+    assert tab.time_at_bar(50) == orig.time_at_bar(50)
+    assert tab.line_end(1, 80) == orig.line_end(1, 80)
+    assert list(tab.labelled_bars()) == [1, 11, 21, 31, 41]
+    assert loaded_count(tab) == 0
+
+
+def test_edit_loaded_bar_updates_index(tmp_path):
+    make_file(tmp_path / 'a.tab')
+    tab = tabfile.load(str(tmp_path / 'a.tab'))
+    tab.index
+    tab.bars[3].chords.append(Chord(Fraction(1, 2)))
+    assert tab.time_at_bar(5) == sum(tab.bars[i].real_duration()
+                                     for i in range(4))
+
+
+def test_save_over_mapped_file(tmp_path):
+    path = tmp_path / 'a.tab'
+    make_file(path)
+    tab = tabfile.load(str(path))
+    tab.bars[2].chords[0].duration = Fraction(1, 2)
+    del tab.bars[5]
+    tabfile.save(tab, str(path))
+
+    saved = tabfile.load(str(path))
+    assert len(saved.bars) == 49
+    assert saved.bars[2].chords[0].duration == Fraction(1, 2)
+    assert saved.bars[5].chords[0].strings[0].fret == 6
+    assert getattr(saved.bars[9], 'label', None) == 'part10'
+    assert saved.time_at_bar(49) == tab.time_at_bar(49)
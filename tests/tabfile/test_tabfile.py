@@ -0,0 +1,92 @@
+import io
+import pickle
+from fractions import Fraction
+
+import pytest
+
+from vitabs import tabfile
+from vitabs.tablature import Bar, Chord, Fret, Tablature
+
+
+def make_tab():
+    tab = Tablature()
+    first = Bar(3, 4)
+    first.chords = [Chord(Fraction(1, 4)), Chord(Fraction(1, 11)),
+                    Chord(Fraction(1, 8))]
+    first.chords[0].strings[5] = Fret(3)
+    first.chords[0].strings[0] = Fret(12)
+    first.chords[0].strings[0].symbols = ['hammer on', 'vibrato']
+    first.chords[2].strings[2] = Fret(0)
+    first.chords[2].strings[2].symbols.append('bend')
+    first.label = 'intro'
+    second = Bar()
+    tab.bars = [first, second]
+    tab.bpm = 96.0
+    tab.instrument = 29
+    tab.tuning = [74, 69, 65, 60, 55, 50]
+    return tab
+
+
+def dump_tab(tab):
+    return [(b.sig_num, b.sig_den, getattr(b, 'label', None),
+             [(c.duration,
+               sorted((s, f.fret, list(f.iter_symbols()))
+                      for s, f in c.strings.items()))
+              for c in b.chords])
+            for b in tab.bars]
+
+
+def test_round_trip():
+    tab = make_tab()
+    out = io.BytesIO()
+    tabfile.write(out, tab)
+    loaded = tabfile.read(out.getvalue())
+    assert dump_tab(loaded) == dump_tab(tab)
+    assert loaded.bpm == 96.0
+    assert loaded.instrument == 29
+    assert loaded.tuning == tab.tuning
+
+
+def test_defaults_not_stored():
+    out = io.BytesIO()
+    tabfile.write(out, Tablature())
+    loaded = tabfile.read(out.getvalue())
+    assert not hasattr(loaded, 'bpm')
+    assert not hasattr(loaded, 'instrument')
+    assert not hasattr(loaded, 'tuning')
+
+
+def test_bar_table_metrics():
+    tab = make_tab()
+    out = io.BytesIO()
+    tabfile.write(out, tab)
+    reader = tabfile.TabReader(out.getvalue())
+    assert len(reader) == 2
+    first, second = reader.entries
+    assert first[2] == -1  # 1/11 is not representable in ticks
+    assert first[3:] == (3, tab.bars[0].total_width(), tabfile.ENTRY_LABEL)
+    assert second[2:] == (tab.bars[1].real_ticks(), 1,
+                          tab.bars[1].total_width(), 0)
+
+
+def test_import_pickle():
+    tab = make_tab()
+    data = pickle.dumps(tab)
+    loaded = tabfile.import_pickle(io.BytesIO(data))
+    assert dump_tab(loaded) == dump_tab(tab)
+
+
+def test_import_pickle_rejects_other_objects():
+    data = pickle.dumps(io.BytesIO)
+    with pytest.raises(tabfile.FormatError):
+        tabfile.import_pickle(io.BytesIO(data))
+
+
+def test_load_detects_format(tmp_path):
+    tab = make_tab()
+    new = tmp_path / 'new.tab'
+    old = tmp_path / 'old.tab'
+    tabfile.save(tab, str(new))
+    old.write_bytes(pickle.dumps(tab))
+    assert dump_tab(tabfile.load(str(new))) == dump_tab(tab)
+    assert dump_tab(tabfile.load(str(old))) == dump_tab(tab)
@@ -58,3 +58,116 @@ def test_total_width():
         Chord(Fraction(1, 4)),
     ]
     assert bar.total_width() == 25
+
+
+def fresh_metrics(bar):
+    '''Recompute bar metrics without using any cached values'''
+    from math import lcm
+    durations = [c.duration for c in bar.chords]
+    real_duration = sum(durations)
+    gcd = lcm(*(d.denominator for d in durations))
+    if real_duration == 0:
+        width = 2
+    else:
+        width = int(real_duration * gcd) * 2 + len(durations) + 2
+    return real_duration, gcd, width
+
+
+def cached_metrics(bar):
+    return bar.real_duration(), bar.gcd(), bar.total_width()
+
+
+def test_cache_follows_duration_change():
+    bar = Bar()
+    bar.chords = [Chord(Fraction(1, 4)), Chord(Fraction(1, 4))]
+    assert cached_metrics(bar) == fresh_metrics(bar)
+
+    bar.chords[1].duration = Fraction(1, 3)
+    assert cached_metrics(bar) == fresh_metrics(bar)
+    assert bar.gcd() == 12
+
+
+def test_cache_follows_chord_list_changes():
+    bar = Bar()
+    bar.chords.append(Chord(Fraction(1, 8)))
+    assert cached_metrics(bar) == fresh_metrics(bar)
+
+    bar.chords.insert(0, Chord(Fraction(1, 16)))
+    assert cached_metrics(bar) == fresh_metrics(bar)
+
+    del bar.chords[1:]
+    assert cached_metrics(bar) == fresh_metrics(bar)
+
+    bar.chords.extend([Chord(Fraction(1, 2)), Chord(Fraction(1, 6))])
+    assert cached_metrics(bar) == fresh_metrics(bar)
+
+    bar.chords[0] = Chord(Fraction(1, 1))
+    assert cached_metrics(bar) == fresh_metrics(bar)
+
+    bar.chords.pop()
+    assert cached_metrics(bar) == fresh_metrics(bar)
+
+    bar.chords.clear()
+    assert cached_metrics(bar) == fresh_metrics(bar)
+
+
+def test_chords_moved_between_bars_notify_new_bar():
+    first, second = Bar(), Bar()
+    second.chords = [Chord(Fraction(1, 8)), Chord(Fraction(1, 8))]
+    first.chords.extend(second.chords)
+    first.total_width()
+
+    first.chords[-1].duration = Fraction(1, 2)
+    assert cached_metrics(first) == fresh_metrics(first)
+
+
+def test_cache_matches_random_edits():
+    import random
+    rnd = random.Random(0)
+    lengths = [Fraction(1, n) for n in (1, 2, 3, 4, 6, 8, 11, 12, 16)]
+    bar = Bar()
+    for i in range(500):
+        op = rnd.randrange(4)
+        if op == 0:
+            bar.chords.insert(rnd.randint(0, len(bar.chords)),
+                              Chord(rnd.choice(lengths)))
+        elif op == 1 and bar.chords:
+            del bar.chords[rnd.randrange(len(bar.chords))]
+        elif bar.chords:
+            rnd.choice(bar.chords).duration = rnd.choice(lengths)
+        assert cached_metrics(bar) == fresh_metrics(bar)
+
+
+def test_deepcopy_keeps_cache_consistent():
+    import copy
+    bar = Bar()
+    bar.chords.append(Chord(Fraction(1, 8)))
+    bar.total_width()
+    dup = copy.deepcopy(bar)
+    dup.chords[0].duration = Fraction(1, 2)
+    assert cached_metrics(dup) == fresh_metrics(dup)
+    assert cached_metrics(bar) == fresh_metrics(bar)
+
+
+def test_durations_outside_timebase():
+    bar = Bar()
+    bar.chords = [
+        Chord(Fraction(1, 11)),
+        Chord(Fraction(1, 4)),
+        Chord(Fraction(1, 4)),
+    ]
+    assert bar.real_duration() == Fraction(13, 22)
+    assert bar.gcd() == 44
+    assert cached_metrics(bar) == fresh_metrics(bar)
+    assert [c.duration for c in bar.chords] == \
+        [Fraction(1, 11), Fraction(1, 4), Fraction(1, 4)]
+
+
+def test_chord_width():
+    bar = Bar()
+    bar.chords = [
+        Chord(Fraction(1, 8)),
+        Chord(Fraction(1, 4)),
+        Chord(Fraction(3, 8)),
+    ]
+    assert [bar.chord_width(c) for c in bar.chords] == [1, 2, 3]
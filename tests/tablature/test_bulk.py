@@ -0,0 +1,81 @@
+from fractions import Fraction
+
+import pytest
+
+from vitabs import bulk
+from vitabs.music import standard_E
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+
+def make_tab(nbars=4):
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(4)]
+        for i, chord in enumerate(bar.chords):
+            chord.strings[5] = Fret(i)
+            chord.strings[3] = Fret(i + 2)
+        bars.append(bar)
+    tab.bars = bars
+    return tab
+
+
+def frets(tab, string):
+    return [c.strings[string].fret for b in tab.bars for c in b.chords
+            if string in c.strings]
+
+
+def test_transpose_and_duration():
+    tab = make_tab()
+    log = tab.open_log()
+    assert tab.time_at_bar(5) == 4
+    bulk.transpose(ChordRange(tab, (1, 3), (2, 2)), -2)
+    assert frets(tab, 5)[:8] == [0, 1, 0, 1, 0, 0, 2, 3]
+    assert log.edited == {tab.bars[0], tab.bars[1]}
+
+    bulk.set_duration(ChordRange(tab, (2, 1), (3, 4)), Fraction(1, 8))
+    assert tab.time_at_bar(5) == 3
+    assert tab.bars[1].chords[0].duration == Fraction(1, 8)
+    with pytest.raises(ValueError):
+        bulk.set_duration(ChordRange(tab, (1, 1), (1, 1)), 0)
+
+
+def test_symbols():
+    tab = make_tab()
+    crange = ChordRange(tab, (1, 1), (4, 4))
+    assert bulk.add_symbol(crange, 'vibrato') == 32
+    assert bulk.add_symbol(crange, 'vibrato') == 0
+    assert tab.bars[3].chords[3].strings[5].has_symbol('vibrato')
+    log = tab.open_log()
+    assert bulk.remove_symbol(ChordRange(tab, (4, 1), (4, 4)), 'vibrato') == 8
+    assert list(tab.bars[3].chords[0].strings[3].iter_symbols()) == []
+    assert tab.bars[2].chords[0].strings[3].has_symbol('vibrato')
+    assert log.edited == {tab.bars[3]}
+
+
+def test_shift_strings():
+    tab = make_tab()
+    crange = ChordRange(tab, (1, 1), (4, 4))
+    bulk.transpose(crange, 5)
+    bulk.shift_strings(crange, -1, standard_E)
+    assert frets(tab, 4) == [0, 1, 2, 3] * 4
+    assert frets(tab, 2) == [2, 3, 4, 5] * 4
+    # the open A string is 5 semitones below the D string
+    with pytest.raises(ValueError):
+        bulk.shift_strings(crange, -1, standard_E)
+    assert frets(tab, 2) == [2, 3, 4, 5] * 4
+    bulk.shift_strings(crange, 1, standard_E)
+    assert frets(tab, 5) == [5, 6, 7, 8] * 4
+    assert frets(tab, 3) == [7, 8, 9, 10] * 4
+
+
+def test_clamp():
+    tab = make_tab(1)
+    bar = tab.bars[0]
+    for chord, fret in zip(bar.chords, (0, 3, 15, 22)):
+        chord.strings[5].fret = fret
+    bulk.clamp_frets(ChordRange(tab, (1, 1), (1, 4)), 2, 12)
+    assert frets(tab, 5) == [12, 3, 3, 10]
+    bulk.clamp_frets(ChordRange(tab, (1, 1), (1, 4)), 4, 6)
+    assert frets(tab, 5) == [6, 4, 4, 6]
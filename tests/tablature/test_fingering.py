@@ -0,0 +1,80 @@
+from fractions import Fraction
+
+import pytest
+
+from vitabs import fingering
+from vitabs.music import standard_E
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+
+def make_tab(voicings):
+    '''voicings are {string: fret} dicts, four chords per bar'''
+    tab = Tablature()
+    bars = []
+    for n in range(0, len(voicings), 4):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for v in voicings[n : n + 4]]
+        for chord, v in zip(bar.chords, voicings[n : n + 4]):
+            for s, f in v.items():
+                chord.strings[s] = Fret(f)
+        bars.append(bar)
+    tab.bars = bars
+    return tab
+
+
+def voicings(tab):
+    return [{s: f.fret for s, f in c.strings.items()}
+            for b in tab.bars for c in b.chords]
+
+
+def pitches(tab, tuning=standard_E):
+    return [sorted(tuning[s] + f.fret for s, f in c.strings.items())
+            for b in tab.bars for c in b.chords]
+
+
+def test_voicings():
+    # E4 on the D, A and low E strings
+    assert sorted(fingering.voicings([64], standard_E)) == \
+        [(3,), (4,), (5,)]
+    # the notes of a chord are on different strings within reach
+    for v in fingering.voicings([55, 59, 62], standard_E):
+        assert len(set(v)) == 3
+        frets = [p - standard_E[s] for p, s in zip([55, 59, 62], v) if
+                 p - standard_E[s]]
+        assert max(frets) - min(frets) <= fingering.MAX_STRETCH
+
+
+def test_least_movement():
+    # a scale run jumping between positions
+    tab = make_tab([{5: 5}, {4: 7}, {0: 0}, {3: 9}, {3: 11}, {2: 9},
+                    {1: 10}, {}])
+    before = pitches(tab)
+    crange = ChordRange(tab, (1, 1), tab.last_position())
+    fingering.revoice(crange, standard_E)
+    assert pitches(tab) == before
+    frets = [f for v in voicings(tab) for f in v.values() if f]
+    assert max(frets) - min(frets) <= 5
+
+    # rests stay
+    assert voicings(tab)[7] == {}
+    fingering.revoice(crange, standard_E, position=12)
+    assert pitches(tab) == before
+    # A2 can not be played at the 12th fret
+    assert all(f >= 12 for v in voicings(tab)[1:] for f in v.values())
+    assert fingering.hand_position(ChordRange(tab, (1, 2), (2, 4))) == 12
+
+
+def test_retune():
+    tab = make_tab([{5: 0, 4: 2, 3: 2}, {5: 3}, {0: 0}, {}])
+    drop_d = list(standard_E)
+    drop_d[5] -= 2
+    before = pitches(tab)
+    fingering.revoice(ChordRange(tab, (1, 1), (1, 4)), standard_E, drop_d)
+    assert pitches(tab, drop_d) == before
+
+    # low E is not playable in G tuning
+    with pytest.raises(ValueError) as e:
+        fingering.revoice(ChordRange(tab, (1, 1), (1, 4)), drop_d,
+                          [n + 3 for n in standard_E])
+    assert str(e.value) == 'Can not play the chord at 1,1'
+    assert pitches(tab, drop_d) == before
@@ -0,0 +1,132 @@
+import random
+from fractions import Fraction
+
+from vitabs.tablature import Bar, Chord, Tablature, FenwickTree
+
+
+def make_tab(durations):
+    tab = Tablature()
+    bars = []
+    for bar_durations in durations:
+        bar = Bar()
+        bar.chords = [Chord(d) for d in bar_durations]
+        bars.append(bar)
+    tab.bars = bars
+    return tab
+
+
+def random_durations(rnd, nbars):
+    lengths = [Fraction(1, 4), Fraction(1, 8), Fraction(1, 2), Fraction(1, 12)]
+    return [[rnd.choice(lengths) for i in range(rnd.randint(1, 6))]
+            for b in range(nbars)]
+
+
+def test_fenwick_prefix_and_search():
+    values = [3, 0, 2, 5, 1, 0, 4]
+    tree = FenwickTree(values)
+    for i in range(len(values) + 1):
+        assert tree.prefix(i) == sum(values[:i])
+    for v in range(sum(values) + 2):
+        k = tree.search(v)
+        assert sum(values[:k]) <= v
+        assert k == len(values) or sum(values[:k + 1]) > v
+
+    tree.add(1, 7)
+    values[1] += 7
+    for i in range(len(values) + 1):
+        assert tree.prefix(i) == sum(values[:i])
+
+
+def test_time_queries():
+    rnd = random.Random(1)
+    tab = make_tab(random_durations(rnd, 50))
+    start = Fraction(0)
+    for n, bar in enumerate(tab.bars, 1):
+        assert tab.time_at_bar(n) == start
+        assert tab.bar_at_time(start) == n
+        assert tab.bar_at_time(start + bar.real_duration() / 2) == n
+        start += bar.real_duration()
+
+
+def test_point_update():
+    rnd = random.Random(2)
+    tab = make_tab(random_durations(rnd, 30))
+    tab.index
+    bar = tab.bars[9]
+    bar.chords.append(Chord(Fraction(1, 2)))
+    tab.update_bar(10)
+    assert tab.time_at_bar(11) == sum(b.real_duration() for b in tab.bars[:10])
+    assert tab.chords_before(11) == sum(len(b.chords) for b in tab.bars[:10])
+
+
+def test_structural_change_invalidates():
+    rnd = random.Random(3)
+    tab = make_tab(random_durations(rnd, 20))
+    tab.index
+    del tab.bars[3:7]
+    tab.bars.insert(2, Bar())
+    assert tab.width_between(1, len(tab.bars) + 1) == \
+        sum(b.total_width() + 1 for b in tab.bars)
+
+
+def test_splices_update_index():
+    rnd = random.Random(5)
+    tab = make_tab(random_durations(rnd, 600))
+    index = tab.index
+    for step in range(200):
+        n = len(tab.bars)
+        start = rnd.randint(0, n)
+        stop = min(n, start + rnd.choice([0, 1, 3, 150]))
+        new = make_tab(random_durations(rnd, rnd.choice([0, 1, 2, 200])))
+        tab.bars[start:stop] = list(new.bars) if new.bars else []
+        if not tab.bars:
+            tab.bars.append(Bar())
+        # the index follows splices instead of being rebuilt
+        assert tab.index is index
+        bars = list(tab.bars)
+        for k in rnd.sample(range(len(bars)), min(5, len(bars))):
+            assert index.position(bars[k]) == k
+            assert tab.ticks_at_bar(k + 1) == \
+                sum(b.real_ticks() for b in bars[:k])
+            assert tab.chords_before(k + 2) == \
+                sum(len(b.chords) for b in bars[:k + 1])
+    assert all(len(b.items) <= 2 * index.BLOCK for b in index.blocks)
+    total = sum(b.real_ticks() for b in tab.bars)
+    assert tab.bar_at_tick(total - 1) == len(tab.bars)
+
+
+def test_line_end():
+    rnd = random.Random(4)
+    tab = make_tab(random_durations(rnd, 40))
+    width = 60
+    first = 1
+    while first <= len(tab.bars):
+        last = tab.line_end(first, width)
+        used = sum(b.total_width() + 1 for b in tab.bars[first - 1 : last])
+        assert used <= width or last == first
+        if last < len(tab.bars):
+            assert used + tab.bars[last].total_width() + 1 > width
+        first = last + 1
+
+
+def test_labels():
+    tab = make_tab([[Fraction(1, 4)]] * 10)
+    tab.bars[2].label = 'verse'
+    tab.bars[6].label = 'chorus'
+    tab.invalidate_index()
+    assert list(tab.labelled_bars()) == [3, 7]
+    assert tab.next_label(1) == 3
+    assert tab.next_label(3) == 7
+    assert tab.next_label(7) is None
+    assert tab.prev_label(10) == 7
+    assert tab.prev_label(6) == 3
+    assert tab.prev_label(2) is None
+
+
+def test_bar_edits_update_index():
+    tab = make_tab([[Fraction(1, 4)] * 4] * 8)
+    tab.index
+    tab.bars[2].chords[0].duration = Fraction(1, 2)
+    tab.bars[5].chords.append(Chord(Fraction(1, 4)))
+    assert tab.time_at_bar(9) == sum(b.real_duration() for b in tab.bars)
+    assert tab.chords_before(9) == 33
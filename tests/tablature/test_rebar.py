@@ -0,0 +1,76 @@
+from fractions import Fraction
+
+from vitabs import bulk
+from vitabs.music import to_ticks
+from vitabs.tablature import Bar, Chord, Fret, Tablature
+
+
+def make_tab(lengths):
+    '''Bars of 4/4 holding chords of the given lengths in quarters'''
+    tab = Tablature()
+    bars = []
+    fret = 0
+    for chords in lengths:
+        bar = Bar()
+        bar.chords = [Chord(Fraction(n, 4)) for n in chords]
+        for chord in bar.chords:
+            chord.strings[5] = Fret(fret)
+            fret += 1
+        bars.append(bar)
+    tab.bars = bars
+    return tab
+
+
+def quarters(tab):
+    return [[c.ticks // to_ticks(Fraction(1, 4)) for c in b.chords]
+            for b in tab.bars]
+
+
+def test_rebar():
+    tab = make_tab([[1, 1, 1], [1, 1, 1, 1, 1], [2, 2, 2], [1]])
+    tab.bars[1].label = 'verse'
+    tab.bars[2].tempo = 90
+    assert bulk.rebar(tab, 1, 4) == 4
+    assert quarters(tab) == [[1, 1, 1, 1], [1, 1, 1, 1], [2, 2], [2, 1]]
+    assert [b.chords[0].strings[5].fret for b in tab.bars] == [0, 4, 8, 10]
+    # the label goes with the first chord of its bar
+    assert [hasattr(b, 'label') for b in tab.bars] == \
+        [True, False, False, False]
+    assert tab.bars[2].tempo == 90
+    assert not any(b.chords[0].strings[5].has_symbol('tie')
+                   for b in tab.bars)
+
+
+def test_split_and_meter():
+    tab = make_tab([[3, 3, 3], [4]])
+    tab.bars[1].sig_num = 3
+    tab.bars[1].sig_den = 4
+    log = tab.open_log()
+    bulk.rebar(tab, 1, 2)
+    assert quarters(tab) == [[3, 1], [2, 2], [1, 3], [1]]
+    # the bar where 3/4 begins is already started in 4/4
+    assert [(b.sig_num, b.sig_den) for b in tab.bars] == \
+        [(4, 4), (4, 4), (4, 4), (3, 4)]
+    tied = tab.bars[1].chords[0].strings[5]
+    assert tied.fret == 1 and tied.has_symbol('tie')
+    assert len(log.splices) == 1
+
+    # a meter change takes effect where the first chord of its bar starts
+    tab = make_tab([[4], [3], [3], [3]])
+    for bar in tab.bars[1:]:
+        bar.sig_num, bar.sig_den = 3, 4
+    tab.bars[2].chords[0].ticks = to_ticks(Fraction(1, 2))
+    tab.bars[3].sig_num = 2
+    bulk.rebar(tab, 2, 4)
+    assert quarters(tab) == [[4], [3], [2, 1], [2]]
+    assert [b.sig_num for b in tab.bars] == [4, 3, 3, 2]
+    assert all(b.real_ticks() == b.required_ticks() for b in tab.bars)
+
+
+def test_fitting_bars_unchanged():
+    tab = make_tab([[1, 1, 2], [4], [2, 2]])
+    bars = list(tab.bars)
+    log = tab.open_log()
+    assert bulk.rebar(tab, 1, 3) == 3
+    assert list(tab.bars) == bars
+    assert not log
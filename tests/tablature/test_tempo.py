@@ -0,0 +1,87 @@
+from fractions import Fraction
+
+import pytest
+
+from vitabs import midi, tabfile
+from vitabs.music import TempoMap, TICKS_PER_WHOLE
+from vitabs.tablature import Bar, Chord, ChordRange, Fret, Tablature
+
+WHOLE = TICKS_PER_WHOLE
+
+
+def make_tab(nbars=8, tempos={3: 60, 6: 240}):
+    '''4/4 bars of quarter notes at 120 bpm (2 s per bar), tempo changes
+    at given bars'''
+    tab = Tablature()
+    bars = []
+    for n in range(nbars):
+        bar = Bar()
+        bar.chords = [Chord(Fraction(1, 4)) for i in range(4)]
+        bar.chords[0].strings[5] = Fret(n)
+        bars.append(bar)
+    for bar_num, tempo in tempos.items():
+        bars[bar_num - 1].tempo = tempo
+    tab.bars = bars
+    tab.bpm = 120
+    return tab
+
+
+def test_tempo_map_conversions():
+    tempo = TempoMap(120)
+    tempo.change(WHOLE, 60)
+    tempo.change(2 * WHOLE, 60)
+    tempo.change(3 * WHOLE, 240)
+    assert tempo.ticks == [0, WHOLE, 3 * WHOLE]
+    assert tempo.seconds_at(WHOLE / 2) == 1
+    assert tempo.seconds_at(2 * WHOLE) == 6
+    assert tempo.seconds_at(4 * WHOLE) == 11
+    for tick in (0, WHOLE / 3, 2.5 * WHOLE, 7 * WHOLE):
+        assert tempo.tick_at(tempo.seconds_at(tick)) == pytest.approx(tick)
+    assert tempo.bpm_at(3 * WHOLE - 1) == 60
+
+
+def test_tablature_tempo():
+    tab = make_tab()
+    assert list(tab.tempo_bars()) == [3, 6]
+    assert [tab.tempo_at(n) for n in (1, 2, 3, 5, 6, 8)] == \
+        [120, 120, 60, 60, 240, 240]
+    assert tab.seconds_at_bar(3) == 4
+    assert tab.seconds_at_bar(6) == 16
+    assert tab.seconds_at_bar(8) == 18
+    assert tab.bar_at_seconds(15.9) == 5
+    assert tab.bar_at_seconds(16.5) == 6
+
+    # edits are seen by the cached map
+    tab.bars[1].chords.append(Chord(Fraction(1, 4)))
+    assert tab.seconds_at_bar(6) == 16.5
+    del tab.bars[2].tempo
+    tab.update_bar(3)
+    assert tab.seconds_at_bar(6) == 10.5
+    tab.bpm = 60
+    assert tab.seconds_at_bar(6) == 21
+
+
+def test_range_tempo_and_stream():
+    tab = make_tab()
+    crange = ChordRange(tab, (2, 3), (6, 2))
+    tempo = crange.tempo_map()
+    assert tempo.bpms == [120, 60, 240]
+    assert tempo.ticks == [0, WHOLE / 2, 3.5 * WHOLE]
+
+    stream = midi.compile_range(crange)
+    assert stream.bpm == 120
+    ons = [stream.time_ns(t) for t, s, d1, d2 in stream if s == 0x90]
+    # first chords of bars 3, 4, 5 and 6
+    assert ons == [1e9, 5e9, 9e9, 13e9]
+    assert stream.time_ns(stream.length) == 13.5e9
+
+
+def test_saved_and_loaded_lazily(tmp_path):
+    path = str(tmp_path / 'a.tab')
+    tabfile.save(make_tab(), path)
+    tab = tabfile.load(path)
+    assert tab.seconds_at_bar(8) == 18
+    # only bars changing the tempo were decoded
+    assert [tab.bars.is_loaded(i) for i in range(8)] == \
+        [i in (2, 5) for i in range(8)]
+    assert tab.bars[5].tempo == 240
@@ -0,0 +1,219 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Operations on all chords of a range at once.
+
+Each operation goes over a RangeView, the chords of the range gathered by
+bar, and changes frets and chords without their per-object notifications;
+every bar touched is invalidated once at the end.  Arguments are checked
+before anything is changed, so an invalid operation leaves the range as
+it was.'''
+
+from fractions import Fraction
+from .music import to_ticks
+from .tablature import Bar, Chord, Fret, FretMap
+
+
+class RangeView:
+    '''Chords of a ChordRange as (bar, chords) pairs, one per bar'''
+    def __init__(self, crange):
+        self.parts = []
+        (first_bar, first_chord), (last_bar, last_chord) = \
+                crange.beginning, crange.end
+        for bar_num, bar in enumerate(crange.bars(), first_bar):
+            first = first_chord if bar_num == first_bar else 1
+            last = last_chord if bar_num == last_bar else len(bar.chords)
+            self.parts.append((bar, bar.chords[first - 1 : last]))
+
+    def chords(self):
+        return [c for bar, chords in self.parts for c in chords]
+
+    def frets(self):
+        '''All frets of the range'''
+        return [f for bar, chords in self.parts for c in chords
+                for f in c._strings.values()]
+
+    def changed(self):
+        '''Invalidate the bars once changes are done'''
+        for bar, chords in self.parts:
+            bar.invalidate()
+
+
+def transpose(crange, semitones):
+    '''Move all frets by a number of semitones, frets do not go below
+    zero.  Returns the number of frets.'''
+    view = RangeView(crange)
+    frets = view.frets()
+    for f in frets:
+        f._fret = max(f._fret + semitones, 0)
+    view.changed()
+    return len(frets)
+
+def set_duration(crange, duration):
+    '''Set the duration (in whole notes) of all chords'''
+    ticks = to_ticks(Fraction(duration))
+    if ticks <= 0:
+        raise ValueError('Duration must be positive')
+    view = RangeView(crange)
+    chords = view.chords()
+    for c in chords:
+        c._ticks = ticks
+    view.changed()
+    return len(chords)
+
+def add_symbol(crange, symbol):
+    '''Add a symbol to every fret not having it yet, returns the number of
+    frets changed'''
+    view = RangeView(crange)
+    changed = 0
+    for f in view.frets():
+        if not f.has_symbol(symbol):
+            # list methods skip the notification of the fret
+            list.append(f.symbols, symbol)
+            changed += 1
+    view.changed()
+    return changed
+
+def remove_symbol(crange, symbol):
+    '''Remove a symbol from every fret, returns the number of frets
+    changed'''
+    view = RangeView(crange)
+    changed = 0
+    for f in view.frets():
+        if f.has_symbol(symbol):
+            list.__setitem__(f._symbols, slice(None),
+                             [s for s in f._symbols if s != symbol])
+            changed += 1
+    view.changed()
+    return changed
+
+def shift_strings(crange, strings, tuning):
+    '''Move notes by a number of strings (towards lower strings when
+    positive) keeping their pitch in the given tuning.  Raises ValueError
+    if a note would leave the fretboard.'''
+    view = RangeView(crange)
+    moves = []
+    for bar, chords in view.parts:
+        for c in chords:
+            moved = {}
+            for s, f in c._strings.items():
+                target = s + strings
+                if not 0 <= target < len(tuning):
+                    raise ValueError('Note moved off the fretboard')
+                fret = f._fret + tuning[s] - tuning[target]
+                if fret < 0:
+                    raise ValueError('Note moved below the open string')
+                moved[target] = (f, fret)
+            moves.append((c, moved))
+    for c, moved in moves:
+        for f, fret in moved.values():
+            f._fret = fret
+        c._strings = FretMap(c, ((s, f) for s, (f, fret) in moved.items()))
+    view.changed()
+    return len(moves)
+
+def clamp_frets(crange, low, high):
+    '''Move frets outside low..high by octaves into it, frets which do not
+    fit are clamped.  Returns the number of frets changed.'''
+    if low < 0 or high < low:
+        raise ValueError('Invalid fret range')
+    view = RangeView(crange)
+    changed = 0
+    for f in view.frets():
+        fret = f._fret
+        while fret > high and fret - 12 >= low:
+            fret -= 12
+        while fret < low and fret + 12 <= high:
+            fret += 12
+        fret = min(max(fret, low), high)
+        if fret != f._fret:
+            f._fret = fret
+            changed += 1
+    view.changed()
+    return changed
+
+def _tied(chord, ticks):
+    '''Continuation of a chord split by a bar line'''
+    frets = {}
+    for s, f in chord._strings.items():
+        fret = Fret(f._fret)
+        fret.symbols = ['tie']
+        frets[s] = fret
+    return Chord.with_ticks(ticks, frets)
+
+def rebar(tab, first, last):
+    '''Distribute the chords of bars first to last into bars filled as
+    their meters require, in one pass keeping a running sum of durations.
+    The meter, label and tempo of an original bar go to the new bar in
+    which its first chord lands, the meter staying until the next change.
+    A chord crossing a bar line is split, the part after the line tied to
+    the part before.  If every bar already fits, the bars are left as they
+    are.  Returns the number of new bars.'''
+    old = tab.bars[first - 1 : last]
+    if not old:
+        return 0
+    # new bars with plain lists of their chords, which are given to the
+    # bars at the end
+    bars = []
+    meter = (old[0].sig_num, old[0].sig_den)
+
+    def new_bar(start):
+        bar = Bar.with_chords([], *meter)
+        bars.append((bar, []))
+        return bar, bars[-1][1], start + bar_ticks(bar)
+
+    def bar_ticks(bar):
+        ticks = bar.required_ticks()
+        if ticks <= 0:
+            raise ValueError('Invalid meter')
+        return ticks
+
+    t = end = 0
+    chords = None
+    for source in old:
+        for i, chord in enumerate(source.chords):
+            if chords is None or t >= end:
+                bar, chords, end = new_bar(t)
+            if i == 0:
+                meter = (source.sig_num, source.sig_den)
+                if not chords:
+                    bar.sig_num, bar.sig_den = meter
+                    end = t + bar_ticks(bar)
+                for name in ('label', 'tempo'):
+                    if hasattr(source, name) and not hasattr(bar, name):
+                        setattr(bar, name, getattr(source, name))
+            ticks = chord._ticks
+            chords.append(chord)
+            if t + ticks > end:
+                chord._ticks = end - t
+                left, position = t + ticks - end, end
+                while left > 0:
+                    bar, chords, end = new_bar(position)
+                    part = min(left, end - position)
+                    chords.append(_tied(chord, part))
+                    left -= part
+                    position += part
+            t += ticks
+    # bars which already fit are left alone, so that nothing is recorded
+    # as changed
+    if len(bars) == len(old) and all(
+            chords == list(source.chords) and
+            (bar.sig_num, bar.sig_den) == (source.sig_num, source.sig_den)
+            for (bar, chords), source in zip(bars, old)):
+        return len(bars)
+    for bar, chords in bars:
+        bar.chords = chords
+    tab.bars[first - 1 : last] = [bar for bar, chords in bars]
+    return len(bars)
@@ -16,6 +16,10 @@
 from fractions import Fraction
 from .tablature import Chord, Bar, Tablature, ChordRange, parse_position
 from . import music
+from . import bulk
+from . import fingering
+from . import midi
+from . import symbols
 import curses # KEY_*
 import curses.ascii
 
@@ -129,17 +133,52 @@ def change_to_end(ed, num):
     pos = ed.tab.cursor_position()
     change(ed, num, ChordRange(ed.tab, pos, go_bar_end(ed, num)))
 
+@nmap_char('"')
+@nosidefx
+def select_register(ed, num):
+    '''Use register {a-z} for the next yank or paste'''
+    c = ed.get_char()
+    if ord('a') <= c <= ord('z'):
+        ed.register = chr(c)
+
 @nmap_char('y')
 @nosidefx
-def yank(ed, num):
-    import copy
-    ed.yanked_bar = copy.deepcopy(ed.tab.get_cursor_bar())
+def yank(ed, num, rng=None):
+    '''Yank over a motion'''
+    if rng is None:
+        rng = ed.expect_range(num, whole_bar_cmd=ord('y'))
+    if rng:
+        ed.yank(rng)
 
 @nmap_char('p')
 def paste(ed, num):
-    import copy
-    if ed.yanked_bar:
-        ed.tab.bars.insert(ed.tab.cursor_bar, copy.deepcopy(ed.yanked_bar))
+    '''Paste [num] times after the cursor'''
+    ed.paste(num or 1)
+
+@nmap_char('P')
+def paste_before(ed, num):
+    '''Paste [num] times before the cursor'''
+    ed.paste(num or 1, before=True)
+
+@nmap_char('u')
+def undo(ed, num):
+    '''Undo [num] changes'''
+    for i in range(num or 1):
+        position = ed.history.undo()
+        if position is None:
+            ed.st = 'Already at oldest change'
+            return
+        ed.move_cursor(*position)
+
+@nmap_char_ctrl('r')
+def redo(ed, num):
+    '''Redo [num] changes'''
+    for i in range(num or 1):
+        position = ed.history.redo()
+        if position is None:
+            ed.st = 'Already at newest change'
+            return
+        ed.move_cursor(*position)
 
 @nmap_char('x')
 @nmap_key(curses.KEY_DC)
@@ -257,28 +296,23 @@ def go_bar_end(ed, num):
 @motion
 def go_next_label(ed, num):
     '''Go to the next label'''
-    pos = (len(ed.tab.bars), None)
-    for barn in range(ed.tab.cursor_bar + 1, len(ed.tab.bars) + 1):
-        if hasattr(ed.tab.bars[barn - 1], 'label'):
-            pos = (barn, None)
-            break
-    return pos
+    barn = ed.tab.next_label(ed.tab.cursor_bar)
+    if barn is None:
+        return (len(ed.tab.bars), None)
+    return (barn, None)
 
 @nmap_char('b')
 @motion
 def go_prev_label(ed, num):
     '''Go to the next label'''
     if hasattr(ed.tab.get_cursor_bar(), 'label') and ed.tab.cursor_chord == 1:
-        search_range = range(1, ed.tab.cursor_bar)
+        barn = ed.tab.prev_label(ed.tab.cursor_bar - 1)
     else:
-        search_range = range(1, ed.tab.cursor_bar + 1)
+        barn = ed.tab.prev_label(ed.tab.cursor_bar)
 
-    pos = (1, None)
-    for barn in reversed(search_range):
-        if hasattr(ed.tab.bars[barn - 1], 'label'):
-            pos = (barn, None)
-            break
-    return pos
+    if barn is None:
+        return (1, None)
+    return (barn, None)
 
 @nmap_char('I')
 def insert_at_beg(ed, num):
@@ -345,15 +379,51 @@ def go_right(ed, num):
 @nmap_char_ctrl('a')
 def transpose_up(ed, num):
     if not num: num = 1
-    chord = ed.tab.get_cursor_chord()
-    for fret in chord.strings.values():
-        fret.fret = max(fret.fret + num, 0)
+    pos = ed.tab.cursor_position()
+    bulk.transpose(ChordRange(ed.tab, pos, pos), num)
 
 @nmap_char_ctrl('x')
 def transpose_down(ed, num):
     if not num: num = 1
     transpose_up(ed, -num)
 
+def bar_range(ed, apply_to):
+    '''The range a command applies to, the cursor bar by default'''
+    if apply_to is None:
+        return ChordRange(ed.tab, (ed.tab.cursor_bar, 1),
+                          (ed.tab.cursor_bar, None))
+    return apply_to
+
+@map_command('revoice')
+def revoice(ed, params, apply_to=None):
+    '''Choose strings for the notes of the bar or a range with the least
+    hand movement, near the fret given'''
+    position = None
+    if len(params) > 1:
+        try:
+            position = int(params[1])
+        except ValueError:
+            ed.st = 'Usage: revoice [fret]'
+            return
+    try:
+        fingering.revoice(bar_range(ed, apply_to),
+                          getattr(ed.tab, 'tuning', music.standard_E),
+                          position=position)
+    except ValueError as e:
+        ed.st = str(e)
+
+@nmap_char('>')
+def shift_up_fretboard(ed, num):
+    '''Move the bar [num] frets up the fretboard keeping the pitch'''
+    crange = bar_range(ed, None)
+    position = fingering.hand_position(crange) or 0
+    revoice(ed, ['revoice', str(max(position + (num or 1), 0))])
+
+@nmap_char('<')
+def shift_down_fretboard(ed, num):
+    '''Move the bar [num] frets down the fretboard keeping the pitch'''
+    shift_up_fretboard(ed, -(num or 1))
+
 @nmap_key(curses.KEY_NPAGE) # Page-Down
 @nosidefx
 def scroll_bars(ed, num):
@@ -396,7 +466,27 @@ def play_all(ed, num):
 @nmap_char('e')
 @nosidefx
 def play_to_end(ed, num):
-    ed.play_range(ed.tab.cursor_position(), ed.tab.last_position())
+    # the whole tab is compiled once and played from the cursor
+    ed.play_range((1,1), ed.tab.last_position(), ed.tab.cursor_position())
+
+@nmap_char(' ')
+@nosidefx
+def pause_playback(ed, num):
+    '''Pause or resume playback'''
+    ed.player.pause()
+    ed.start_following()
+
+@nmap_char(']')
+@nosidefx
+def seek_forward(ed, num):
+    '''Skip [num] bars forward during playback'''
+    ed.player.seek_bars(num or 1)
+
+@nmap_char('[')
+@nosidefx
+def seek_backward(ed, num):
+    '''Skip [num] bars back during playback'''
+    ed.player.seek_bars(-(num or 1))
 
 @nmap_char('?')
 @nosidefx
@@ -435,11 +525,25 @@ def apply_to_range(ed, params):
             ed.exec_command(params[3:], apply_to=r)
 
 def find_label(ed, label):
-    for i, b in enumerate(ed.tab.bars):
-        if hasattr(b, 'label') and b.label == label:
-            return (i + 1, None)
+    for barn in ed.tab.labelled_bars():
+        if ed.tab.bars[barn - 1].label == label:
+            return (barn, None)
     return None
 
+@map_command('yank')
+def yank_range(ed, params, apply_to=None):
+    '''Yank the current bar or a range into the register given'''
+    if len(params) > 2 or (len(params) == 2 and not (
+            len(params[1]) == 1 and 'a' <= params[1] <= 'z')):
+        ed.st = 'Usage: yank [register]'
+        return
+    if len(params) == 2:
+        ed.register = params[1]
+    if apply_to is None:
+        apply_to = ChordRange(ed.tab, (ed.tab.cursor_bar, 1),
+                              (ed.tab.cursor_bar, None))
+    ed.yank(apply_to)
+
 @map_command('label')
 def set_bar_label(ed, params, apply_to=None):
     if len(params) == 2:
@@ -448,6 +552,7 @@ def set_bar_label(ed, params, apply_to=None):
             ed.make_motion(l)
         else:
             ed.tab.get_cursor_bar().label = params[1]
+            ed.tab.update_bar(ed.tab.cursor_bar)
     elif len(params) == 1:
         if hasattr(ed.tab.get_cursor_bar(), 'label'):
             ed.st = ed.tab.get_cursor_bar().label
@@ -460,6 +565,7 @@ def set_bar_label(ed, params, apply_to=None):
 @map_command('nolabel')
 def remove_bar_label(ed, params, apply_to=None):
     del ed.tab.get_cursor_bar().label
+    ed.tab.update_bar(ed.tab.cursor_bar)
 
 @map_command('meter')
 def set_bar_meter(ed, params, apply_to=None):
@@ -468,12 +574,56 @@ def set_bar_meter(ed, params, apply_to=None):
         if apply_to is None:
             curb = ed.tab.get_cursor_bar()
             curb.sig_num, curb.sig_den = sig_num, sig_den
+            curb.invalidate()
         else:
             for b in apply_to.bars():
                 b.sig_num, b.sig_den = sig_num, sig_den
+                b.invalidate()
     except:
         ed.st = 'Invalid argument'
 
+@map_command('tempo')
+def set_bar_tempo(ed, params, apply_to=None):
+    '''Change the tempo from the current bar on, or only in a range'''
+    tab = ed.tab
+    if apply_to is None:
+        first = last = tab.cursor_bar
+    else:
+        first, last = apply_to.beginning[0], apply_to.end[0]
+    if len(params) == 1:
+        ed.st = '{0:g} bpm'.format(tab.tempo_at(first))
+        return
+    if params[1] == 'off':
+        tempo = None
+    else:
+        try:
+            tempo = float(params[1])
+            if tempo <= 0:
+                raise ValueError
+        except ValueError:
+            ed.st = 'Invalid argument'
+            return
+        if tempo < midi.MIN_TEMPO:
+            ed.st = 'Tempo must be at least {0:.2f} bpm'.format(
+                midi.MIN_TEMPO)
+            return
+
+    if apply_to is not None and last < len(tab.bars):
+        # bars after the range keep their tempo
+        following = tab.bars[last]
+        if not hasattr(following, 'tempo'):
+            following.tempo = tab.tempo_at(last + 1)
+            tab.update_bar(last + 1)
+    for bar_num in range(first, last + 1):
+        bar = tab.bars[bar_num - 1]
+        if bar_num == first and tempo is not None:
+            bar.tempo = tempo
+        elif hasattr(bar, 'tempo'):
+            del bar.tempo
+        else:
+            continue
+        tab.update_bar(bar_num)
+
 @map_command('instrument')
 def set_instrument(ed, params):
     instruments = {
@@ -508,23 +658,49 @@ def set_tablature_attribute(ed, params):
     else:
         ed.st = 'Invalid argument'
 
+def parse_tuning(params):
+    '''Tuning given as :tuning arguments, None if they are invalid'''
+    try:
+        if len(params) == 2:
+            # standard E shifted
+            shift = int(params[1])
+            return [n + shift for n in music.standard_E]
+        elif len(params) == 7:
+            # individual strings
+            return list(reversed([int(s) for s in params[1:]]))
+    except ValueError:
+        pass
+    return None
+
 @map_command('tuning')
 def tuning(ed, params):
-    if len(params) == 1:
-        pass
-    elif len(params) == 2:
-        # standard E shifted
-        shift = int(params[1])
-        ed.tab.tuning = [n + shift for n in music.standard_E]
-    elif len(params) == 7:
-        # individual strings
-        ed.tab.tuning = reversed([str(s) for s in params[1:]])
-    else:
-        ed.st = 'Invalid argument'
-        return
+    if len(params) > 1:
+        new_tuning = parse_tuning(params)
+        if new_tuning is None:
+            ed.st = 'Invalid argument'
+            return
+        ed.tab.tuning = new_tuning
     # display tuning
     ed.st = music.tuning_str(getattr(ed.tab, 'tuning', music.standard_E))
 
+@map_command('retune')
+def retune(ed, params):
+    '''Change the tuning moving notes so that they keep their pitch'''
+    new_tuning = parse_tuning(params)
+    if new_tuning is None:
+        ed.st = 'Usage: retune semitones | 6th string note ... 1st string note'
+        return
+    tab = ed.tab
+    try:
+        fingering.revoice(ChordRange(tab, (1, 1), tab.last_position()),
+                          getattr(tab, 'tuning', music.standard_E),
+                          new_tuning)
+    except ValueError as e:
+        ed.st = str(e)
+        return
+    tab.tuning = new_tuning
+    ed.st = music.tuning_str(new_tuning)
+
 @map_command('ilen')
 def set_insert_duration(ed, params):
     try:
@@ -541,13 +717,96 @@ def cmd_set_duration(ed, params, apply_to=None):
         if apply_to is None:
             ed.tab.get_cursor_chord().duration = d
         else:
-            for c in apply_to.chords():
-                c.duration = d
+            bulk.set_duration(apply_to, d)
 
         ed.move_cursor()
     except:
         ed.st = 'Invalid argument'
 
+def cursor_range(ed, apply_to):
+    '''The range a command applies to, the cursor chord by default'''
+    if apply_to is None:
+        pos = ed.tab.cursor_position()
+        return ChordRange(ed.tab, pos, pos)
+    return apply_to
+
+@map_command('transpose')
+def transpose_range(ed, params, apply_to=None):
+    '''Move frets by a number of semitones'''
+    try:
+        semitones = int(params[1])
+    except (IndexError, ValueError):
+        ed.st = 'Usage: transpose semitones'
+        return
+    bulk.transpose(cursor_range(ed, apply_to), semitones)
+
+@map_command('symbol')
+def change_symbols(ed, params, apply_to=None):
+    '''Add or remove a symbol on all frets'''
+    name = ' '.join(params[2:])
+    if len(params) < 3 or params[1] not in ('add', 'del') or \
+            name not in symbols.templates:
+        ed.st = 'Usage: symbol add|del name'
+        return
+    if params[1] == 'add':
+        bulk.add_symbol(cursor_range(ed, apply_to), name)
+    else:
+        bulk.remove_symbol(cursor_range(ed, apply_to), name)
+
+@map_command('shift')
+def shift_strings(ed, params, apply_to=None):
+    '''Move notes to lower (or higher when negative) strings keeping
+    their pitch'''
+    try:
+        strings = int(params[1])
+    except (IndexError, ValueError):
+        ed.st = 'Usage: shift strings'
+        return
+    try:
+        bulk.shift_strings(cursor_range(ed, apply_to), strings,
+                           getattr(ed.tab, 'tuning', music.standard_E))
+    except ValueError as e:
+        ed.st = str(e)
+
+@map_command('clamp')
+def clamp_frets(ed, params, apply_to=None):
+    '''Move frets into a range of frets by octaves'''
+    try:
+        low, high = int(params[1]), int(params[2])
+        bulk.clamp_frets(cursor_range(ed, apply_to), low, high)
+    except (IndexError, ValueError):
+        ed.st = 'Usage: clamp lowest highest'
+
+@map_command('rebar')
+def rebar(ed, params, apply_to=None):
+    '''Move chords between bars so that bars are as long as their meters,
+    in the whole tab or a range'''
+    tab = ed.tab
+    if len(params) not in (1, 3):
+        ed.st = 'Usage: rebar [first last]'
+        return
+    if len(params) == 3:
+        try:
+            apply_to = ChordRange(tab, parse_position(tab, params[1]),
+                                  parse_position(tab, params[2]))
+        except:
+            ed.st = 'Invalid range'
+            return
+    if apply_to is None:
+        first, last = 1, len(tab.bars)
+    else:
+        first, last = apply_to.beginning[0], apply_to.end[0]
+    try:
+        count = bulk.rebar(tab, first, last)
+    except ValueError as e:
+        ed.st = str(e)
+        return
+    ed.st = '{0} bars rebarred into {1}'.format(last - first + 1, count)
+    if tab.cursor_bar > first:
+        tab.cursor_bar = min(tab.cursor_bar, first + count - 1,
+                             len(tab.bars))
+    after_delete(ed)
+
 @map_command('bartotal')
 def bar_total(ed, params):
     '''Display a sum of bars note lengths'''
@@ -559,12 +818,60 @@ def list_midi_outputs(ed, params):
 
 @map_command('midiout')
 def change_output(ed, params):
+    if len(params) > 1 and not params[1].isdigit():
+        try:
+            ed.player.open_raw_output(params[1])
+        except IOError:
+            ed.st = 'Could not open ' + params[1]
+        return
     try:
         ed.player.change_output(int(params[1]))
     except:
         ed.player.open_first_output()
         ed.st = 'Could not open given port'
 
+@map_command('midiexport')
+def export_midi(ed, params, apply_to=None):
+    '''Save the tab or a range of it as a standard MIDI file'''
+    import os.path
+    if len(params) not in (2, 4):
+        ed.st = 'Usage: midiexport file [first last]'
+        return
+    if len(params) == 4:
+        try:
+            apply_to = ChordRange(ed.tab, parse_position(ed.tab, params[2]),
+                                  parse_position(ed.tab, params[3]))
+        except:
+            ed.st = 'Invalid range'
+            return
+    try:
+        midi.export(ed.tab, os.path.expanduser(params[1]), apply_to)
+    except (IOError, OSError):
+        ed.st = 'Error: Can\'t write ' + params[1]
+
+@map_command('wavexport')
+def export_wav(ed, params, apply_to=None):
+    '''Render the tab or a range of it to a WAV file'''
+    import os.path
+    from . import render
+    if len(params) not in (2, 4):
+        ed.st = 'Usage: wavexport file [first last]'
+        return
+    if len(params) == 4:
+        try:
+            apply_to = ChordRange(ed.tab, parse_position(ed.tab, params[2]),
+                                  parse_position(ed.tab, params[3]))
+        except:
+            ed.st = 'Invalid range'
+            return
+    if render.numpy is None:
+        ed.st = 'Error: numpy is required to render audio'
+        return
+    try:
+        render.export(ed.tab, os.path.expanduser(params[1]), apply_to)
+    except (IOError, OSError):
+        ed.st = 'Error: Can\'t write ' + params[1]
+
 @map_command('nonstop')
 def enable_continuous_playback(ed, params):
     if len(params) == 2 and params[1] == 'off':
@@ -572,9 +879,41 @@ def enable_continuous_playback(ed, params):
     else:
         ed.continuous_playback = True
 
+@map_command('audition')
+def enable_audition(ed, params):
+    '''Sound chords as they are entered in insert mode'''
+    if len(params) == 2 and params[1] == 'off':
+        ed.audition_chords = False
+    else:
+        ed.audition_chords = True
+
+@map_command('seek')
+def seek_playback(ed, params):
+    '''Move playback to a position (bar[,chord]) or a time (m:ss or
+    seconds followed by s), starting it if nothing is played'''
+    if len(params) != 2:
+        ed.st = 'Usage: seek bar[,chord] | m:ss | seconds s'
+        return
+    desc = params[1]
+    position = seconds = None
+    try:
+        if ':' in desc:
+            minutes, secs = desc.split(':')
+            seconds = int(minutes) * 60 + float(secs)
+        elif desc.endswith('s'):
+            seconds = float(desc[:-1])
+        else:
+            bar, chord = parse_position(ed.tab, desc)
+            position = (bar, chord or 0)
+    except ValueError:
+        ed.st = 'Invalid position'
+        return
+    if not ed.player.seek(position, seconds):
+        ed.play_range((1,1), ed.tab.last_position(), position, seconds)
+
 @map_command('m')
 def set_visible_meta(ed, params):
-    possible_meta = ['meter', 'number', 'label', 'length']
+    possible_meta = ['meter', 'number', 'label', 'length', 'tempo']
 
     if len(params) == 1:
         try:
@@ -16,7 +16,6 @@
 import curses
 import curses.ascii
 import locale
-import pickle
 import os
 import os.path
 
@@ -24,7 +23,12 @@ from fractions import Fraction
 from .tablature import Fret, Chord, Bar, Tablature, ChordRange
 from . import symbols
 from . import music
+from . import tabfile
+from . import swap
+from .layout import Layout
 from .player import Player
+from .history import History
+from . import registers
 
 locale.setlocale(locale.LC_ALL, '')
 encoding = locale.getpreferredencoding()
@@ -32,15 +36,21 @@ encoding = locale.getpreferredencoding()
 
 class Editor:
     screen_initiated = False
-    cursor_prev_bar_x = 2
     insert_duration = Fraction('1/4')
     st = ''
     file_name = None
     terminate = False
     visible_meta = 'meter'
     continuous_playback = False
-    yanked_bar = None
+    # sound chords as they are entered in insert mode
+    audition_chords = False
+    # register named for the next yank or paste
+    register = None
     string = 0
+    # seconds between snapshots to the swap file, 0 disables them
+    autosave_interval = 4
+    autosave = None
+    following_playback = False
 
     def __init__(self, stdscr, tab = Tablature()):
         self.root = stdscr
@@ -49,6 +59,17 @@ class Editor:
         self.motion_commands = {}
         self.commands = {}
         self.log_messages = []
+        # screen lines as [row, first bar, last bar] and position of each
+        # visible bar as (row, column, width, number) as last drawn
+        self.lines = []
+        self.bar_positions = {}
+        # change log of the tab noting bars to redraw
+        self.damage_tab = None
+        self.damage = None
+        self._layout = None
+        # undo history of the tab
+        self.history = None
+        self.registers = {}
 
         self.player = Player()
 
@@ -65,6 +86,10 @@ class Editor:
         self.status_line = curses.newwin(0, 0, screen_height - 1, 0)
         self.status_line.scrollok(False)
 
+        # wake up regularly while waiting for keys to take snapshots
+        self.stdscr.timeout(250)
+        self.start_autosave()
+
         self.first_visible_bar = self.tab.cursor_bar
         self.redraw_view()
         self.cy = 2
@@ -92,6 +117,16 @@ class Editor:
                 self.set_term_title('[unnamed] + - VITABS')
         self.tab.changed = True
 
+    def checkpoint(self):
+        '''End an undo step, returns True if the tab was changed since the
+        previous one'''
+        if self.history is None or self.history.tab is not self.tab:
+            if self.history is not None:
+                self.history.close()
+            self.history = History(self.tab)
+            return False
+        return self.history.checkpoint()
+
     def register_handlers(self, module):
         '''Add commands defined in the module'''
         for f in module.__dict__.values():
@@ -106,12 +141,65 @@ class Editor:
             if hasattr(f, 'handles_command'):
                 self.commands[f.handles_command] = f
 
+    def start_autosave(self):
+        '''Start keeping a swap file for the current tab, replacing the
+        one kept so far'''
+        self.stop_autosave()
+        if self.autosave_interval:
+            self.autosave = swap.Autosave(
+                self.tab, swap.swap_name(self.file_name or 'vitabs-unnamed'),
+                self.autosave_interval)
+
+    def stop_autosave(self, remove=True):
+        '''Stop keeping the swap file, which is removed unless remove is
+        False, in which case it is brought up to date first'''
+        if self.autosave:
+            if not remove and self.autosave.dirty():
+                self.autosave.submit(self.autosave.snapshot())
+            self.autosave.close(remove)
+            self.autosave = None
+
+    def offer_recovery(self, filename):
+        '''Ask whether to recover the tab from a swap file left by a session
+        which did not end cleanly.  Returns the recovered tab or None.'''
+        swap_file = swap.swap_name(filename)
+        self.root.clear()
+        self.root.addstr(0, 0, 'Found a swap file: ' + swap_file)
+        self.root.addstr(1, 0, 'It is newer than ' + filename + ' and may '
+                         'contain changes which were not saved.')
+        self.root.addstr(3, 0, '[r] recover  [e] edit the file anyway  '
+                         '[d] delete the swap file')
+        self.root.refresh()
+        while True:
+            c = self.get_char(self.root)
+            if c == ord('r'):
+                try:
+                    tab = tabfile.load(swap_file)
+                except:
+                    tab = None
+                    self.st = 'Error: Can\'t recover from the swap file'
+                break
+            elif c == ord('e'):
+                tab = None
+                break
+            elif c == ord('d'):
+                tab = None
+                os.remove(swap_file)
+                break
+        self.root.clear()
+        self.root.refresh()
+        return tab
+
     def load_tablature(self, filename):
-        '''Unpickle tab from a file'''
-        if os.path.isfile(filename):
+        '''Load tab from a file'''
+        recovered = None
+        if swap.recovery_available(filename):
+            recovered = self.offer_recovery(filename)
+        if recovered:
+            self.tab = recovered
+        elif os.path.isfile(filename):
             try:
-                with open(filename, 'rb') as infile:
-                    self.tab = pickle.load(infile)
+                self.tab = tabfile.load(filename)
             except:
                 self.st = 'Error: Can\'t open the specified file'
                 return
@@ -125,19 +213,28 @@ class Editor:
             music.tuning_str(getattr(self.tab, 'tuning', music.standard_E)))
         self.tab.cursor_bar = 1
         self.tab.cursor_chord = 1
+        if recovered:
+            self.st = 'Recovered from ' + swap.swap_name(filename)
+            self.mark_changed()
+        if self.screen_initiated:
+            self.start_autosave()
 
     def save_tablature(self, filename):
-        '''Pickle tab to a file'''
+        '''Save tab to a file'''
         if hasattr(self.tab, 'changed'):
             self.tab.changed = False
             delattr(self.tab, 'changed')
         try:
-            outfile = open(filename, 'wb')
-            pickle.dump(self.tab, outfile)
-            outfile.close()
-            self.file_name = filename
+            tabfile.save(self.tab, filename)
         except:
             self.st = 'Error: Can\'t save'
+        else:
+            if filename != self.file_name:
+                self.file_name = filename
+                if self.autosave:
+                    self.start_autosave()
+            elif self.autosave:
+                self.autosave.saved()
         self.set_term_title(filename + ' - VITABS')
 
     def set_term_title(self, text):
@@ -156,7 +253,6 @@ class Editor:
         stdscr = self.stdscr
         screen_width = self.stdscr.getmaxyx()[1]
         stdscr.vline(y, x - 1, curses.ACS_VLINE, 6)
-        gcd = bar.gcd()
         total_width = bar.total_width()
         for i in range(6):
             stdscr.hline(y + i, x, curses.ACS_HLINE, total_width)
@@ -165,12 +261,7 @@ class Editor:
             for i in list(chord.strings.keys()):
                 if x < screen_width:
                     stdscr.addstr(y+i, x, str(chord.strings[i]), curses.A_BOLD)
-            # should it really be here?
-            if self.visible_meta == 'length':
-                dstr = music.len_str(chord.duration)
-                if x + len(dstr) < screen_width:
-                    stdscr.addstr(y - 1, x, dstr)
-            width = int(chord.duration * gcd)
+            width = bar.chord_width(chord)
             x = x + width*2 + 1
         if x + 1 < screen_width:
             stdscr.vline(y, x + 1, curses.ACS_VLINE, 6)
@@ -190,32 +281,134 @@ class Editor:
         elif self.visible_meta == 'label':
             if hasattr(bar, 'label'):
                 self.stdscr.addstr(y, x, bar.label)
-
-    def draw_tab(self, t):
-        '''Render the whole tablature'''
-        x = 2
-        y = 1
-        prev_bar = None
-        screen_height, screen_width = self.stdscr.getmaxyx()
-        for i, tbar in enumerate(t.bars[self.first_visible_bar - 1 : ]):
-            bar_width = tbar.total_width()
-            if x + bar_width >= screen_width and x != 2:
-                x = 2
-                y += 8
-            if y + 8 > screen_height:
+        elif self.visible_meta == 'tempo':
+            if hasattr(bar, 'tempo'):
+                self.stdscr.addstr(y, x, '{0:g} bpm'.format(bar.tempo))
+        elif self.visible_meta == 'length':
+            screen_width = self.stdscr.getmaxyx()[1]
+            x += 1
+            for chord in bar.chords:
+                dstr = music.len_str(chord.duration)
+                if x + len(dstr) < screen_width:
+                    self.stdscr.addstr(y, x, dstr)
+                x = x + bar.chord_width(chord)*2 + 1
+
+    def layout(self):
+        '''Layout of the tab on screen from the first visible bar'''
+        width = self.stdscr.getmaxyx()[1]
+        layout = self._layout
+        if (layout is None or layout.tab is not self.tab or
+                layout.width != width or
+                layout.first_bar != self.first_visible_bar):
+            if layout is not None:
+                layout.close()
+            layout = self._layout = Layout(self.tab, width,
+                                           self.first_visible_bar)
+        layout.sync()
+        return layout
+
+    def visible_lines(self):
+        '''Number of lines of bars which fit on the screen'''
+        return (self.stdscr.getmaxyx()[0] - 1) // 8
+
+    @property
+    def last_visible_bar(self):
+        return self.layout().last_bar(self.visible_lines())
+
+    def draw_tab(self, t, line=0):
+        '''Render the tablature from the given screen line on, the screen
+        below must be blank'''
+        layout = self.layout()
+        del self.lines[line:]
+        for bar in [b for b, pos in self.bar_positions.items()
+                    if pos[0] >= 1 + 8*line]:
+            del self.bar_positions[bar]
+        for i in range(line, self.visible_lines()):
+            bars = layout.line(i)
+            if bars is None:
                 break
-            self.draw_bar_meta(y, x, tbar, prev_bar, self.first_visible_bar + i)
-            x = self.draw_bar(y + 1, x, tbar)
-            self.last_visible_bar = i + self.first_visible_bar
-
-            prev_bar = tbar
+            first, last = bars
+            y = 1 + 8*i
+            x = 2
+            self.lines.append([y, first, last])
+            prev_bar = (t.bars[first - 2]
+                        if first > self.first_visible_bar else None)
+            for n in range(first, last + 1):
+                tbar = t.bars[n - 1]
+                self.draw_bar_meta(y, x, tbar, prev_bar, n)
+                self.bar_positions[tbar] = (y, x, tbar.total_width(), n)
+                x = self.draw_bar(y + 1, x, tbar)
+                prev_bar = tbar
 
     def redraw_view(self):
         '''Redraw tab window'''
+        if self.damage_tab is not self.tab:
+            if self.damage_tab is not None:
+                self.damage_tab.close_log(self.damage)
+            self.damage_tab = self.tab
+            self.damage = self.tab.open_log()
+        self.damage.splices = []
+        self.damage.edited = set()
         self.stdscr.erase()
-        self.draw_tab(self.tab) # merge theese functions?
+        self.draw_tab(self.tab)
         self.stdscr.noutrefresh()
 
+    def update_view(self):
+        '''Redraw only the parts of the tab window showing bars which changed
+        since the last redraw'''
+        damage = self.damage
+        if self.damage_tab is not self.tab or damage.splices:
+            self.redraw_view()
+            return
+        if not damage.edited:
+            return
+        edited = damage.edited
+        damage.edited = set()
+
+        lines = set()
+        reflow = None
+        for bar in edited:
+            pos = self.bar_positions.get(bar)
+            if pos is None:
+                continue
+            y, x, width, n = pos
+            line = self.line_at(y)
+            if bar.total_width() != width:
+                # following bars move, possibly to other lines
+                if reflow is None or line < reflow:
+                    reflow = line
+            else:
+                self.draw_bar(y + 1, x, bar)
+                lines.add(line)
+                # the meter shown over the next bar depends on this one
+                if self.lines[line][2] == n and line + 1 < len(self.lines):
+                    lines.add(line + 1)
+
+        if reflow is not None:
+            self.stdscr.move(self.lines[reflow][0], 0)
+            self.stdscr.clrtobot()
+            self.draw_tab(self.tab, reflow)
+        for line in lines:
+            if reflow is None or line < reflow:
+                self.redraw_meta(line)
+        self.stdscr.noutrefresh()
+
+    def line_at(self, y):
+        '''Number of the screen line drawn at row y'''
+        return (y - 1) // 8
+
+    def redraw_meta(self, line):
+        '''Redraw the row above bars of a screen line'''
+        y, first, last = self.lines[line]
+        self.stdscr.move(y, 0)
+        self.stdscr.clrtoeol()
+        prev_bar = (self.tab.bars[first - 2]
+                    if first > self.first_visible_bar else None)
+        for n in range(first, last + 1):
+            bar = self.tab.bars[n - 1]
+            self.draw_bar_meta(y, self.bar_positions[bar][1], bar, prev_bar, n)
+            prev_bar = bar
+
     def term_resized(self):
         '''Called when the terminal window is resized, updates window sizes'''
         height, width = self.root.getmaxyx()
@@ -240,7 +433,7 @@ class Editor:
             str(self.tab.get_cursor_chord().duration))
         # meter incomplete indicator
         cb = self.tab.get_cursor_bar()
-        if cb.real_duration() != cb.required_duration():
+        if cb.real_ticks() != cb.required_ticks():
             self.status_line.addstr(0, width - 18, 'M')
         self.status_line.noutrefresh()
 
@@ -265,54 +458,26 @@ class Editor:
         self.root.clear()
         self.redraw_view()
 
-    def move_cursor(self, new_bar=None, new_chord=None, cache_lengths=False):
+    def move_cursor(self, new_bar=None, new_chord=None):
         '''Set new cursor position'''
         if not new_bar: new_bar = self.tab.cursor_bar
         if not new_chord: new_chord = self.tab.cursor_chord
-        if not cache_lengths: self.cursor_prev_bar_x = None
 
         # make sure the cursor stays inside the visible bar range
         if new_bar < self.first_visible_bar or new_bar > self.last_visible_bar:
             self.first_visible_bar = new_bar
             self.redraw_view()
 
-        newbar_i = self.tab.bars[new_bar - 1]
-
-        # calculate the width of preceeding bars
-        screen_height, screen_width = self.stdscr.getmaxyx()
-        if new_bar != self.tab.cursor_bar or self.cursor_prev_bar_x == None:
-            self.cursor_prev_bar_x = 2
-            self.cy = 2
-            if new_bar > self.first_visible_bar:
-                for b in self.tab.bars[self.first_visible_bar - 1 : new_bar - 1]:
-                    barw = b.total_width() + 1
-
-                    self.cursor_prev_bar_x += barw
-
-                    if (self.cursor_prev_bar_x > screen_width and
-                            self.cursor_prev_bar_x != 2 + barw):
-                        self.cursor_prev_bar_x = 2 + barw
-                        self.cy += 8
-
-                # should the cursor bar be wrapped?
-                newbar_w = newbar_i.total_width() + 1
-                if newbar_w + self.cursor_prev_bar_x > screen_width:
-                    self.cursor_prev_bar_x = 2
-                    self.cy += 8
-
-        # width of preceeding chords
-        offset = 1
-        gcd = newbar_i.gcd()
-        for c in newbar_i.chords[:new_chord - 1]:
-            offset += int(c.duration * gcd)*2 + 1
-
+        layout = self.layout()
+        line, x = layout.position(new_bar)
+        self.cy = 2 + 8*line
+        self.cx = x + layout.chord_offset(self.tab.bars[new_bar - 1],
+                                          new_chord)
         self.tab.cursor_bar = new_bar
         self.tab.cursor_chord = new_chord
-        self.cx = self.cursor_prev_bar_x + offset
 
     def make_motion(self, pos):
-        self.move_cursor(pos[0], 1 if pos[1] is None else pos[1],
-                         cache_lengths=True)
+        self.move_cursor(pos[0], 1 if pos[1] is None else pos[1])
 
     def go_left(self, num=1):
         '''Returns position pair [num] chords left from the cursor'''
@@ -341,36 +506,116 @@ class Editor:
     def move_cursor_right(self):
         self.make_motion(self.go_right())
 
-    def play_range(self, fro, to):
-        def redraw_playback_status():
-            self.st = 'Playing... <CTRL-C> to abort'
-            self.redraw_status()
-            curses.setsyx(self.cy - 1, self.cx)
-            curses.doupdate()
-
-        def move_to_beginning():
-            self.move_cursor(fro[0], fro[1])
-            redraw_playback_status()
-            return True
-
-        def update_playback_status():
-            self.move_cursor_right()
-            redraw_playback_status()
-            return True
-
+    def take_register(self):
+        name = self.register or registers.UNNAMED
+        self.register = None
+        return name
+
+    def yank(self, crange):
+        '''Copy the chords of a range into the register named last'''
+        register = registers.Register(crange)
+        name = self.take_register()
+        self.registers[name] = self.registers[registers.UNNAMED] = register
+        if register.linewise:
+            self.st = '{0} bars yanked'.format(len(register))
+        else:
+            self.st = '{0} chords yanked'.format(len(register.chords()))
+
+    def paste(self, count=1, before=False):
+        '''Insert count copies of the register named last at the cursor,
+        bars after (or before) the cursor bar and chords after (or before)
+        the cursor chord'''
+        register = self.registers.get(self.take_register())
+        if register is None:
+            self.st = 'Nothing in register'
+            return
+        tab = self.tab
+        if register.linewise:
+            i = tab.cursor_bar - 1 if before else tab.cursor_bar
+            tab.bars[i:i] = [b for n in range(count) for b in register.bars()]
+            self.move_cursor(i + 1, 1)
+        else:
+            i = tab.cursor_chord - 1 if before else tab.cursor_chord
+            chords = [c for n in range(count) for c in register.chords()]
+            tab.get_cursor_bar().chords[i:i] = chords
+            self.move_cursor(tab.cursor_bar, i + 1)
+
+    def play_range(self, fro, to, position=None, seconds=None):
+        '''Start playing a range in the background, from a (bar, chord)
+        position or time in seconds if given.  The cursor follows playback
+        while waiting for keys.'''
+        self.player.start(ChordRange(self.tab, fro, to),
+                          self.continuous_playback, position, seconds,
+                          getattr(self.tab, 'instrument', 24))
+        self.start_following()
+
+    def start_following(self):
+        if self.player.playing() and not self.following_playback:
+            self.following_playback = True
+            self.followed_position = None
+            self.stdscr.timeout(20)
+            self.st = 'Playing... <Esc> to stop'
+
+    def audition_chord(self):
+        '''Briefly sound the chord under the cursor if enabled'''
+        if not self.audition_chords:
+            return
+        tuning = getattr(self.tab, 'tuning', music.standard_E)
+        chord = self.tab.get_cursor_chord()
+        self.player.audition.play(
+            [tuning[s] + fr.fret for s, fr in chord.strings.items()],
+            getattr(self.tab, 'instrument', 24))
+
+    def stop_playback(self):
+        self.player.stop()
+        self.follow_playback()
+
+    def follow_playback(self):
+        '''Move the cursor to the chord being played, called while waiting
+        for keys'''
+        if not self.following_playback:
+            return
         p = self.player
-        p.before_repeat = move_to_beginning
-        p.post_play_chord = update_playback_status
-        p.set_instrument(getattr(self.tab, 'instrument', 24))
-        p.play(ChordRange(self.tab, fro, to), self.continuous_playback)
-        self.st = ''
+        position = p.position()
+        # the cursor is moved only when playback reaches another chord, so
+        # that it can be moved away meanwhile
+        if position is not None and position != self.followed_position:
+            self.followed_position = position
+            if position[0] <= len(self.tab.bars):
+                self.move_cursor(position[0], min(
+                    position[1], len(self.tab.bars[position[0] - 1].chords)))
+        if not p.playing() and p.paused is None:
+            self.following_playback = False
+            self.stdscr.timeout(250)
+            self.log_messages.append(
+                'Playback timing: ' + str(p.scheduler.stats))
+            self.st = ''
+        elif p.paused is not None:
+            self.st = 'Paused, <Space> to resume'
+        else:
+            self.st = 'Playing... <Esc> to stop'
+        self.redraw_status()
+        self.place_cursor()
+        curses.doupdate()
 
-    def get_char(self, parent=None):
+    def place_cursor(self):
+        '''Put the terminal cursor at the normal mode cursor'''
+        curses.setsyx(self.cy - 1, self.cx)
+
+    def get_char(self, parent=None, follow=False):
         '''Get a character from terminal, handling things like terminal
-        resize'''
+        resize.  With follow, the cursor follows playback meanwhile; only
+        normal mode does that, other modes keep their cursor.'''
         if parent is None:
             parent = self.stdscr
         c = parent.getch()
+        while c == -1:
+            # timed out waiting for a key
+            if self.autosave:
+                self.autosave.tick()
+            if follow:
+                self.follow_playback()
+            c = parent.getch()
         if c == curses.KEY_RESIZE:
             self.term_resized()
         return c
@@ -405,11 +650,12 @@ class Editor:
                     curch.strings[string].fret = st_dec + c - ord('0')
                 else:
                     curch.strings[string] = Fret(c - ord('0'))
-                self.redraw_view()
+                self.update_view()
+                self.audition_chord()
             elif c == curses.KEY_DC or c == curses.ascii.DEL or c == ord('x'):
                 if self.string in self.tab.get_cursor_chord().strings:
                     del self.tab.get_cursor_chord().strings[self.string]
-                    self.redraw_view()
+                    self.update_view()
 
             elif c == curses.KEY_UP or c == ord('k'):
                 self.string = max(self.string - 1, 0)
@@ -427,7 +673,7 @@ class Editor:
                 self.tab.get_cursor_bar().chords.insert(
                         self.tab.cursor_chord,
                         Chord(self.insert_duration))
-                self.redraw_view()
+                self.update_view()
                 self.move_cursor_right()
                 self.move_cursor()
                 insert_end = (insert_end[0], insert_end[1] + 1)
@@ -438,7 +684,7 @@ class Editor:
                     self.tab.get_cursor_bar().chords.insert(
                             self.tab.cursor_chord,
                             Chord(self.insert_duration))
-                    self.redraw_view()
+                    self.update_view()
                     insert_end = right
                 self.make_motion(right)
                 self.move_cursor()
@@ -462,7 +708,8 @@ class Editor:
                     fr.symbols.remove(sym)
                 else:
                     fr.symbols.append(sym)
-                self.redraw_view()
+                self.update_view()
+                self.audition_chord()
             except KeyError:
                 pass
 
@@ -542,6 +789,7 @@ class Editor:
         '''Enter normal mode, returns on quit'''
         num_arg = None
         t = self.tab
+        self.checkpoint()
 
         while True:
             if self.terminate:
@@ -549,18 +797,19 @@ class Editor:
 
             self.redraw_status()
             self.st = ''
-            curses.setsyx(self.cy - 1, self.cx)
+            self.place_cursor()
             curses.doupdate()
             # TODO: accept multi-char commands
             try:
-                c = self.get_char()
+                c = self.get_char(follow=True)
 
                 if c in self.nmap:
                     cmd = self.nmap[c]
                     cmd(self, num_arg)
-                    if not (getattr(cmd, 'nosidefx', False)):
+                    changed = self.checkpoint()
+                    if changed or not getattr(cmd, 'nosidefx', False):
                         self.mark_changed()
-                        self.redraw_view()
+                        self.update_view()
 
                 if self._is_number(c):
                     num_arg = self._parse_numeric_arg(c, num_arg)
@@ -571,6 +820,11 @@ class Editor:
 
                 if c == curses.ascii.ESC:
                     self.st = ''
+                    if self.following_playback:
+                        self.stop_playback()
 
             except KeyboardInterrupt:
-                self.st = 'Use :q<Enter> to quit'
+                if self.following_playback:
+                    self.stop_playback()
+                else:
+                    self.st = 'Use :q<Enter> to quit'
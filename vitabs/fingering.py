@@ -0,0 +1,167 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Choosing strings and frets for the notes of a range.
+
+Every chord can be voiced in several ways: each note on a different
+string, with the fretted notes within reach of the hand.  The hand
+position of a voicing is its lowest fretted note.  The voicings are
+chosen by dynamic programming over the chords, minimizing the hand
+movement between consecutive chords plus the stretch of each voicing and
+its distance from a requested position.  Only the best voicing at each
+hand position is kept, so a step of the search compares a bounded number
+of states and the search takes time linear in the number of chords.'''
+
+from .bulk import RangeView
+from .tablature import FretMap
+
+MAX_FRET = 24
+# largest distance between fretted notes of a voicing
+MAX_STRETCH = 4
+# frets reached from a hand position without moving
+REACH = 3
+# cost of each fret of a stretch, relative to a fret of hand movement
+STRETCH_COST = 0.5
+# small preference for frets closer to the nut
+FRET_COST = 0.01
+
+
+def voicings(pitches, tuning):
+    '''Possible voicings of notes, each a tuple of the string of each
+    note'''
+    order = sorted(range(len(pitches)), key=pitches.__getitem__)
+    found = []
+    chosen = [None] * len(pitches)
+
+    def place(k, low, high):
+        if k == len(order):
+            found.append(tuple(chosen))
+            return
+        note = order[k]
+        for s in range(len(tuning)):
+            fret = pitches[note] - tuning[s]
+            if s in chosen or not 0 <= fret <= MAX_FRET:
+                continue
+            l, h = low, high
+            if fret:
+                l, h = min(low, fret), max(high, fret)
+                if h - l > MAX_STRETCH:
+                    continue
+            chosen[note] = s
+            place(k + 1, l, h)
+            chosen[note] = None
+
+    place(0, MAX_FRET + 1, -1)
+    return found
+
+def voicing_cost(frets, position=None):
+    '''Cost of a voicing apart from the movement to it, and its hand
+    position (None if all notes are open strings)'''
+    fretted = [f for f in frets if f]
+    cost = FRET_COST * sum(frets)
+    if fretted:
+        cost += STRETCH_COST * (max(fretted) - min(fretted))
+    if position is not None:
+        # open strings count too, as they do not belong to the position
+        cost += sum(max(0, position - f, f - (position + REACH))
+                    for f in frets)
+    return cost, min(fretted) if fretted else None
+
+def plan(chords, tuning, new_tuning, position=None):
+    '''Chosen strings of the notes of each chord as a list of
+    {old string: new string} dicts, None for rests.  Raises ValueError
+    with the index of a chord which can not be played.'''
+    # states of a chord are hand positions (None for open strings) mapped
+    # to the cost and strings of the best voicing there
+    cache = {}
+    steps = []
+    # least total cost of reaching each state of the previous chord
+    totals = {None: 0.}
+    for i, chord in enumerate(chords):
+        strings = list(chord.strings)
+        if not strings:
+            continue
+        pitches = tuple(tuning[s] + chord.strings[s].fret for s in strings)
+        # voicings of the same notes are the same, tabs repeat them a lot
+        local = cache.get(pitches)
+        if local is None:
+            local = cache[pitches] = {}
+            for v in voicings(pitches, new_tuning):
+                frets = [p - new_tuning[s] for p, s in zip(pitches, v)]
+                cost, hand = voicing_cost(frets, position)
+                if hand not in local or cost < local[hand][0]:
+                    local[hand] = (cost, v)
+            if not local:
+                raise ValueError(i)
+
+        new = {}
+        pointers = {}
+        for hand, (cost, v) in local.items():
+            best = None
+            for prev, total in totals.items():
+                # moving to or from open strings costs nothing
+                if hand is not None and prev is not None:
+                    total += abs(hand - prev)
+                if best is None or total < best:
+                    best, pointers[hand] = total, prev
+            new[hand] = best + cost
+        steps.append((i, strings, local, pointers))
+        totals = new
+
+    choice = [None] * len(chords)
+    state = min(totals, key=totals.get)
+    for i, strings, local, pointers in reversed(steps):
+        choice[i] = dict(zip(strings, local[state][1]))
+        state = pointers[state]
+    return choice
+
+def revoice(crange, tuning, new_tuning=None, position=None):
+    '''Move the notes of a range to other strings and frets keeping their
+    pitch, with the least hand movement.  new_tuning is the tuning they
+    are to be played in, by default the same.  position is a fret which
+    the hand should stay at if possible.  Raises ValueError if a chord
+    can not be played, leaving the range unchanged.'''
+    if new_tuning is None:
+        new_tuning = tuning
+    view = RangeView(crange)
+    chords = view.chords()
+    try:
+        choice = plan(chords, tuning, new_tuning, position)
+    except ValueError as e:
+        i = e.args[0]
+        bar_num, chord_num = crange.beginning
+        for bar, part in view.parts:
+            if i < len(part):
+                break
+            i -= len(part)
+            bar_num, chord_num = bar_num + 1, 1
+        raise ValueError('Can not play the chord at {0},{1}'.format(
+            bar_num, chord_num + i))
+    for c, strings in zip(chords, choice):
+        if strings is None:
+            continue
+        moved = {}
+        for s, f in c._strings.items():
+            pitch = tuning[s] + f._fret
+            f._fret = pitch - new_tuning[strings[s]]
+            moved[strings[s]] = f
+        c._strings = FretMap(c, moved)
+    view.changed()
+    return len(chords)
+
+def hand_position(crange):
+    '''Lowest fretted note of a range, None if there is none'''
+    frets = [f.fret for f in RangeView(crange).frets() if f.fret]
+    return min(frets) if frets else None
@@ -0,0 +1,161 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Undo and redo.
+
+The history keeps a snapshot of every bar of the tablature: its encoded
+record (see tabfile.encode_bar) or, for a bar not decoded yet, its
+BarStub.  Snapshots are immutable, so they are shared between the list
+describing the current bars and the steps which replaced them.  A step
+holds only the snapshots of bars it changed, its cost in time and memory
+is proportional to the change and not to the size of the tablature.'''
+
+from .tablature import Bar, BarStub
+from .tabfile import encode_bar, decode_bar
+
+
+class Step:
+    '''Changes made by one command: splices of the bar list as (start,
+    removed snapshots, inserted snapshots) and edits of single bars as
+    (position, old snapshot, new snapshot), with cursor positions before
+    and after the command'''
+    def __init__(self, splices, edits, before, after):
+        self.splices = splices
+        self.edits = edits
+        self.before = before
+        self.after = after
+
+
+class History:
+    # number of steps which can be undone
+    limit = 1000
+
+    def __init__(self, tab):
+        self.tab = tab
+        self.log = tab.open_log()
+        self.symbol_ids = {}
+        self.snapshots = [self.snapshot(item)
+                          for item in tab.bars.raw_items()]
+        self.undo_steps = []
+        self.redo_steps = []
+        self.cursor = tab.cursor_position()
+
+    def close(self):
+        self.tab.close_log(self.log)
+
+    def snapshot(self, item):
+        if isinstance(item, BarStub):
+            return item
+        return encode_bar(item, self.symbol_ids)
+
+    def restore(self, snapshot):
+        '''A new bar (or a stub) with the contents of a snapshot'''
+        if isinstance(snapshot, BarStub):
+            return snapshot
+        return decode_bar(snapshot, 0, list(self.symbol_ids))[0]
+
+    def checkpoint(self):
+        '''End the current step, recording changes made to the tablature
+        since the previous one.  Returns True if anything changed.'''
+        log = self.log
+        cursor = self.tab.cursor_position()
+        if not log:
+            self.cursor = cursor
+            return False
+        snapshots = self.snapshots
+        splices = []
+        # bars inserted by this step, snapshots are taken once they are
+        # complete
+        inserted_bars = {}
+        for start, nremoved, inserted in log.splices:
+            removed = snapshots[start : start + nremoved]
+            snapshots[start : start + nremoved] = inserted
+            splices.append((start, removed, list(inserted)))
+            for item in inserted:
+                if isinstance(item, Bar):
+                    inserted_bars[id(item)] = item
+        taken = {key: self.snapshot(bar)
+                 for key, bar in inserted_bars.items()}
+        index = self.tab.index
+        for bar in inserted_bars.values():
+            i = index.position(bar)
+            if i is not None:
+                snapshots[i] = taken[id(bar)]
+        for start, removed, inserted in splices:
+            for items in (removed, inserted):
+                for j, item in enumerate(items):
+                    if isinstance(item, Bar):
+                        items[j] = taken[id(item)]
+
+        edits = []
+        for bar in log.edited:
+            i = index.position(bar)
+            if i is None or id(bar) in inserted_bars:
+                continue
+            new = self.snapshot(bar)
+            if new != snapshots[i]:
+                edits.append((i, snapshots[i], new))
+                snapshots[i] = new
+
+        log.splices = []
+        log.edited = set()
+        before, self.cursor = self.cursor, cursor
+        if not splices and not edits:
+            return False
+        self.undo_steps.append(Step(splices, edits, before, cursor))
+        if len(self.undo_steps) > self.limit:
+            del self.undo_steps[0]
+        self.redo_steps = []
+        return True
+
+    def _replace(self, start, count, snapshots):
+        self.tab.bars[start : start + count] = [self.restore(s)
+                                                for s in snapshots]
+        self.snapshots[start : start + count] = snapshots
+
+    def undo(self):
+        '''Revert the last step, returns the cursor position from before
+        it or None if there is nothing to undo'''
+        self.checkpoint()
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        for i, old, new in reversed(step.edits):
+            self._replace(i, 1, [old])
+        for start, removed, inserted in reversed(step.splices):
+            self._replace(start, len(inserted), removed)
+        self.redo_steps.append(step)
+        return self._done(step.before)
+
+    def redo(self):
+        '''Repeat the last step undone, returns the cursor position from
+        after it or None if there is nothing to redo'''
+        self.checkpoint()
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        for start, removed, inserted in step.splices:
+            self._replace(start, len(removed), inserted)
+        for i, old, new in step.edits:
+            self._replace(i, 1, [new])
+        self.undo_steps.append(step)
+        return self._done(step.after)
+
+    def _done(self, cursor):
+        # changes made by the history itself are not a new step
+        self.log.splices = []
+        self.log.edited = set()
+        self.cursor = cursor
+        return cursor
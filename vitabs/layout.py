@@ -0,0 +1,122 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Placement of bars in screen lines'''
+
+from bisect import bisect_right
+
+# column of the first bar in a line
+LEFT_MARGIN = 2
+
+
+class Layout:
+    '''Breaks bars into lines of a screen of the given width, starting with
+    first_bar.  Lines are computed as they are needed and kept until a
+    change to the tablature re-flows them from the first changed bar.'''
+    def __init__(self, tab, width, first_bar=1):
+        self.tab = tab
+        self.width = width
+        self.first_bar = first_bar
+        # first and last bar of each line computed so far
+        self.starts = []
+        self.ends = []
+        # columns of chords relative to the bar by bar
+        self.columns = {}
+        self.log = tab.open_log()
+
+    def close(self):
+        '''Stop following changes to the tablature'''
+        self.tab.close_log(self.log)
+
+    def sync(self):
+        '''Re-flow lines affected by changes logged since the last call'''
+        log = self.log
+        if not log:
+            return
+        changed = None
+        for start, nremoved, inserted in log.splices:
+            if changed is None or start + 1 < changed:
+                changed = start + 1
+        if log.splices:
+            self.columns.clear()
+        index = self.tab.index
+        for bar in log.edited:
+            self.columns.pop(bar, None)
+            i = index.position(bar)
+            if i is not None and (changed is None or i + 1 < changed):
+                changed = i + 1
+        log.splices = []
+        log.edited = set()
+        if changed is not None:
+            self.reflow(changed)
+
+    def reflow(self, bar_num):
+        '''Forget lines from the one containing bar_num on'''
+        line = bisect_right(self.starts, bar_num) - 1
+        if line < 0:
+            line = 0
+        del self.starts[line:]
+        del self.ends[line:]
+
+    def _extend(self):
+        '''Compute the next line, returns False past the last bar'''
+        start = self.ends[-1] + 1 if self.ends else self.first_bar
+        if start > len(self.tab.bars):
+            return False
+        self.starts.append(start)
+        self.ends.append(
+            self.tab.line_end(start, self.width - LEFT_MARGIN))
+        return True
+
+    def line(self, i):
+        '''First and last bar of the i-th line (from 0) or None if the bars
+        end before it'''
+        while len(self.starts) <= i:
+            if not self._extend():
+                return None
+        return self.starts[i], self.ends[i]
+
+    def line_of(self, bar_num):
+        '''Line containing the bar'''
+        while not self.ends or self.ends[-1] < bar_num:
+            if not self._extend():
+                break
+        return max(bisect_right(self.starts, bar_num) - 1, 0)
+
+    def position(self, bar_num):
+        '''Line and column of the bar'''
+        line = self.line_of(bar_num)
+        return line, LEFT_MARGIN + self.tab.width_between(
+            self.starts[line], bar_num)
+
+    def last_bar(self, nlines):
+        '''Last bar shown in the first nlines lines'''
+        last = self.first_bar
+        for i in range(nlines):
+            line = self.line(i)
+            if line is None:
+                break
+            last = line[1]
+        return last
+
+    def chord_offset(self, bar, chord_num):
+        '''Column of a chord relative to the column of its bar'''
+        columns = self.columns.get(bar)
+        if columns is None:
+            columns = [1]
+            for chord in bar.chords:
+                columns.append(columns[-1] + bar.chord_width(chord)*2 + 1)
+            self.columns[bar] = columns
+        return columns[min(chord_num, len(columns)) - 1]
@@ -0,0 +1,427 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Compiling tablature ranges into streams of MIDI events'''
+
+import bisect
+import math
+import struct
+from array import array
+
+from .music import TICKS_PER_WHOLE, TempoMap, standard_E
+from .tablature import ChordRange
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+CONTROL_CHANGE = 0xB0
+PROGRAM_CHANGE = 0xC0
+PITCH_BEND = 0xE0
+# not a MIDI status: marks the end of a chord in a stream
+CHORD_END = 0x00
+
+VELOCITY = 100
+VIBRATO_STEPS = 20
+# depth of vibrato in semitones
+VIBRATO_DEPTH = 0.5
+BEND_STEPS = 10
+# pitch bend values are 14 bit, a full bend is BEND_RANGE semitones
+BEND_CENTER = 0x2000
+BEND_RANGE = 2
+LEGATO_VELOCITY = 70
+# ticks a note is held into the note played legato after it
+LEGATO_OVERLAP = TICKS_PER_WHOLE // 128
+# length of notes repeated by tremolo picking
+TREMOLO_TICKS = TICKS_PER_WHOLE // 32
+
+
+class EventStream:
+    '''Events sorted by time as parallel arrays: tick, status (including
+    the channel), first and second data byte.  Also holds the start tick
+    and (bar, chord) position of each chord and the TempoMap converting
+    ticks to time.'''
+    def __init__(self, bpm=120):
+        self.bpm = bpm
+        self.tempo = TempoMap(bpm)
+        self.ticks = array('d')
+        self.status = array('B')
+        self.data1 = array('B')
+        self.data2 = array('B')
+        self.chord_ticks = array('d')
+        self.positions = []
+        self.length = 0
+        self._batches = None
+        self._offsets = None
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def __iter__(self):
+        return zip(self.ticks, self.status, self.data1, self.data2)
+
+    def add(self, tick, status, data1=0, data2=0):
+        self.ticks.append(tick)
+        self.status.append(status)
+        self.data1.append(data1)
+        self.data2.append(data2)
+
+    def sort(self):
+        '''Order events by tick, keeping the order of simultaneous ones'''
+        order = sorted(range(len(self.ticks)), key=self.ticks.__getitem__)
+        for name in ('ticks', 'status', 'data1', 'data2'):
+            old = getattr(self, name)
+            setattr(self, name, array(old.typecode, (old[i] for i in order)))
+        self._batches = None
+        self._offsets = None
+
+    def batches(self):
+        '''Index of the first event of each run of events at one tick,
+        followed by the number of events'''
+        if self._batches is None:
+            ticks = self.ticks
+            self._batches = array('l', (i for i in range(len(ticks))
+                                        if i == 0 or ticks[i] != ticks[i-1]))
+            self._batches.append(len(ticks))
+        return self._batches
+
+    def time_ns(self, tick):
+        '''Time in nanoseconds from the start at which tick is reached'''
+        return int(round(self.tempo.seconds_at(tick) * 1e9))
+
+    def offsets(self):
+        '''Times of batches of events in nanoseconds from the start'''
+        if self._offsets is None:
+            ticks = self.ticks
+            self._offsets = array('q', (self.time_ns(ticks[i])
+                                        for i in self.batches()[:-1]))
+        return self._offsets
+
+    def chord_at(self, tick):
+        '''Index of the chord sounding at tick'''
+        i = bisect.bisect_right(self.chord_ticks, tick) - 1
+        return max(0, min(i, len(self.chord_ticks) - 1))
+
+    def tick_of(self, position):
+        '''Start tick of the chord at a (bar, chord) position, or of the
+        first chord after it'''
+        if not self.positions:
+            return 0
+        i = bisect.bisect_left(self.positions, tuple(position))
+        return self.chord_ticks[min(i, len(self.positions) - 1)]
+
+    def tick_at_seconds(self, seconds):
+        '''Start tick of the chord sounding at a time in seconds'''
+        if not self.positions:
+            return 0
+        return self.chord_ticks[self.chord_at(self.tempo.tick_at(seconds))]
+
+
+class Note:
+    '''A note being compiled.  Articulations change it before it is turned
+    into events: onsets holds (tick, pitch, velocity) of each attack of the
+    note, the last one sounding until end.  previous is the note played
+    before it on the same string and next_fret the fret played after it,
+    None if the string is not played in the neighbouring chord.'''
+    __slots__ = ('fret', 'tick', 'end', 'channel', 'onsets', 'previous',
+                 'next_fret')
+
+    def __init__(self, fret, pitch, tick, end, channel=0, previous=None,
+                 next_fret=None):
+        self.fret = fret
+        self.tick = tick
+        self.end = end
+        self.channel = channel
+        self.onsets = [(tick, pitch, VELOCITY)]
+        self.previous = previous
+        self.next_fret = next_fret
+
+    @property
+    def pitch(self):
+        return self.onsets[0][1]
+
+    def emit(self, stream):
+        for i, (tick, pitch, velocity) in enumerate(self.onsets):
+            if i + 1 < len(self.onsets):
+                end = self.onsets[i + 1][0]
+            else:
+                end = self.end
+            stream.add(float(tick), NOTE_ON | self.channel, pitch, velocity)
+            stream.add(float(end), NOTE_OFF | self.channel, pitch, VELOCITY)
+
+
+# Articulations
+
+# functions adding the gesture of a symbol to a note by symbol name
+articulations = {}
+# symbols articulated with pitch bends, which affect the whole channel, so
+# only one of them is applied to a chord
+bending = set()
+
+def articulation(symbol, bends=False):
+    '''Register a function articulating notes with the symbol.  It is
+    called with the stream and the Note before the note is added to the
+    stream, and may add events and change the note.'''
+    def register(f):
+        articulations[symbol] = f
+        if bends:
+            bending.add(symbol)
+        else:
+            bending.discard(symbol)
+        return f
+    return register
+
+def add_bend(stream, tick, channel, semitones):
+    '''Add a pitch bend by the given number of semitones'''
+    value = BEND_CENTER + int(round(semitones * (BEND_CENTER - 1) /
+                                    BEND_RANGE))
+    value = max(0, min(value, 0x3FFF))
+    stream.add(float(tick), PITCH_BEND | channel, value & 0x7F, value >> 7)
+
+def bend_curve(stream, note, start, end, bend_from, bend_to):
+    '''Bend linearly between two bends in semitones from tick start to
+    end, returning to no bend at the end of the note'''
+    for i in range(BEND_STEPS + 1):
+        add_bend(stream, start + (end - start) * i / BEND_STEPS, note.channel,
+                 bend_from + (bend_to - bend_from) * i / BEND_STEPS)
+    add_bend(stream, note.end, note.channel, 0)
+
+@articulation('vibrato', bends=True)
+def vibrato(stream, note):
+    length = note.end - note.tick
+    for i in range(VIBRATO_STEPS):
+        add_bend(stream, note.tick + length * i / VIBRATO_STEPS, note.channel,
+                 VIBRATO_DEPTH * math.sin(float(i) / 0.95))
+    add_bend(stream, note.end, note.channel, 0)
+
+@articulation('bend', bends=True)
+def bend(stream, note):
+    bend_curve(stream, note, note.tick, note.tick + (note.end - note.tick) / 4,
+               0, BEND_RANGE)
+
+@articulation('release', bends=True)
+def release(stream, note):
+    bend_curve(stream, note, note.tick, note.tick + (note.end - note.tick) / 4,
+               BEND_RANGE, 0)
+
+def slide(stream, note, direction):
+    '''Play the frets passed on the way to the next fret legato in the
+    second half of the note, sliding by two frets when there is no next
+    fret in the direction of the slide'''
+    if note.next_fret is not None and \
+            (note.next_fret - note.fret.fret) * direction > 0:
+        # the next note is played at the target
+        passed = abs(note.next_fret - note.fret.fret) - 1
+    else:
+        passed = 2
+    pitch = note.pitch
+    middle = note.tick + (note.end - note.tick) / 2
+    step = (note.end - middle) / max(passed, 1)
+    for i in range(passed):
+        note.onsets.append((middle + step * i, pitch + (i + 1) * direction,
+                            LEGATO_VELOCITY))
+
+@articulation('slide up')
+def slide_up(stream, note):
+    slide(stream, note, 1)
+
+@articulation('slide down')
+def slide_down(stream, note):
+    slide(stream, note, -1)
+
+def legato(stream, note):
+    '''Attack the note softly and hold the previous note into it'''
+    tick, pitch, velocity = note.onsets[0]
+    note.onsets[0] = (tick, pitch, LEGATO_VELOCITY)
+    if note.previous is not None:
+        note.previous.end = max(note.previous.end, note.tick + LEGATO_OVERLAP)
+
+articulation('hammer on')(legato)
+articulation('pull off')(legato)
+
+@articulation('tremolo')
+def tremolo(stream, note):
+    tick, pitch, velocity = note.onsets[0]
+    onsets = []
+    while tick < note.end:
+        onsets.append((tick, pitch, velocity))
+        tick += TREMOLO_TICKS
+    note.onsets = onsets
+
+@articulation('tie')
+def tie(stream, note):
+    '''Hold the previous note of the same pitch instead of striking the
+    note again'''
+    previous = note.previous
+    if previous is not None and previous.onsets and \
+            previous.onsets[-1][1] == note.pitch:
+        note.onsets = previous.onsets
+        previous.onsets = []
+
+
+def compile_range(crange, tuning=None, bpm=120, instrument=None, channel=0):
+    '''Compile the chords of a range into an EventStream, articulating
+    symbols of frets with the registered articulations.  bpm is the tempo
+    of bars before the first tempo change of the tablature.'''
+    if tuning is None:
+        tuning = standard_E
+    stream = EventStream()
+    stream.tempo = crange.tempo_map(bpm)
+    stream.bpm = stream.tempo.bpms[0]
+    if instrument is not None:
+        stream.add(0, PROGRAM_CHANGE | channel, instrument)
+    chords = list(crange.positioned_chords())
+    t = 0
+    # notes by string of the previous chord, added to the stream once the
+    # articulations of the following chord could change them
+    previous = {}
+    for i, (position, c) in enumerate(chords):
+        stream.chord_ticks.append(float(t))
+        stream.positions.append(position)
+        end = t + c.ticks
+        following = chords[i + 1][1].strings if i + 1 < len(chords) else {}
+        notes = {}
+        bent = False
+        for s, fr in c.strings.items():
+            next_fret = following[s].fret if s in following else None
+            note = notes[s] = Note(fr, tuning[s] + fr.fret, t, end, channel,
+                                   previous.get(s), next_fret)
+            for symbol in fr.iter_symbols():
+                articulate = articulations.get(symbol)
+                if articulate is None or symbol in bending and bent:
+                    continue
+                bent = bent or symbol in bending
+                articulate(stream, note)
+        if i:
+            emit_chord(stream, previous, t)
+        previous = notes
+        t = end
+    if chords:
+        emit_chord(stream, previous, t)
+    stream.length = float(t)
+    stream.sort()
+    return stream
+
+def emit_chord(stream, notes, end):
+    for note in notes.values():
+        note.emit(stream)
+    stream.add(float(end), CHORD_END)
+
+
+class StreamCache:
+    '''Compiled streams of ranges of one tablature, dropped whenever the
+    tablature changes'''
+    def __init__(self, tab):
+        self.tab = tab
+        self.log = tab.open_log()
+        self.streams = {}
+
+    def close(self):
+        self.tab.close_log(self.log)
+
+    def get(self, crange, tuning, bpm, instrument=None):
+        if self.log:
+            self.streams.clear()
+            self.log.splices = []
+            self.log.edited = set()
+        key = (crange.beginning, crange.end, tuple(tuning), bpm, instrument)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = compile_range(
+                crange, tuning, bpm, instrument)
+        return stream
+
+
+# Standard MIDI files
+
+# ticks per quarter note in exported files
+PPQ = 480
+# slowest tempo (bpm) a Set Tempo event holds, its microseconds per
+# quarter note have 24 bits
+MIN_TEMPO = 60e6 / 0xFFFFFF
+
+def var_len(value):
+    '''Encode a number as a MIDI variable-length quantity'''
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        out.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(out)
+
+def smf_tick(tick, ppq=PPQ):
+    '''Convert a tick of the internal timebase to a file tick'''
+    return int(round(tick * ppq * 4 / TICKS_PER_WHOLE))
+
+def track_chunk(events):
+    '''Encode a track of (file tick, message bytes) events sorted by tick,
+    using running status'''
+    data = bytearray()
+    last_tick = 0
+    running = None
+    for tick, message in events:
+        data += var_len(tick - last_tick)
+        last_tick = tick
+        if message[0] == running and message[0] < 0xF0:
+            data += message[1:]
+        else:
+            data += message
+            running = message[0] if message[0] < 0xF0 else None
+    data += b'\x00\xff\x2f\x00'
+    return b'MTrk' + struct.pack('>I', len(data)) + bytes(data)
+
+def meter_events(crange, stream, ppq=PPQ):
+    '''Time signature meta events where the meter of bars changes'''
+    events = []
+    last = None
+    for tick, (bar_num, chord_num) in zip(stream.chord_ticks,
+                                          stream.positions):
+        bar = crange.tab.bars[bar_num - 1]
+        meter = (bar.sig_num, bar.sig_den)
+        den = bar.sig_den.bit_length() - 1
+        if meter == last or bar.sig_den != 1 << den or bar.sig_num > 255:
+            continue
+        last = meter
+        events.append((smf_tick(tick, ppq), bytes(
+            [0xFF, 0x58, 4, bar.sig_num, den, 24, 8])))
+    return events
+
+def write_smf(outfile, stream, ppq=PPQ, meta=()):
+    '''Write a stream as a type 1 standard MIDI file: a tempo track
+    (holding the tempo changes and the given (file tick, bytes) meta
+    events) and a track with the events'''
+    conductor = []
+    for tick, bpm in zip(stream.tempo.ticks, stream.tempo.bpms):
+        # slower tempos are only possible in the editor
+        tempo = min(int(round(60e6 / bpm)), 0xFFFFFF)
+        conductor.append((smf_tick(tick, ppq), bytes([0xFF, 0x51, 3]) +
+                          tempo.to_bytes(3, 'big')))
+    conductor.extend(meta)
+    conductor.sort(key=lambda e: e[0])
+    notes = [(smf_tick(tick, ppq), bytes([status, data1, data2][
+                  :2 if status & 0xF0 in (PROGRAM_CHANGE, 0xD0) else 3]))
+             for tick, status, data1, data2 in stream
+             if status != CHORD_END]
+    outfile.write(b'MThd' + struct.pack('>IHHH', 6, 1, 2, ppq))
+    outfile.write(track_chunk(conductor))
+    outfile.write(track_chunk(notes))
+
+def export(tab, filename, crange=None):
+    '''Save a tab (or a range of it) as a standard MIDI file'''
+    if crange is None:
+        crange = ChordRange(tab, (1, 1), tab.last_position())
+    stream = compile_range(crange, getattr(tab, 'tuning', standard_E),
+                           getattr(tab, 'bpm', 120),
+                           getattr(tab, 'instrument', 24))
+    with open(filename, 'wb') as outfile:
+        write_smf(outfile, stream, meta=meter_events(crange, stream))
@@ -0,0 +1,151 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Sending MIDI messages in batches to pluggable backends'''
+
+import threading
+import time
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+PITCH_BEND = 0xE0
+
+
+def pack(messages):
+    '''Encode messages as a byte string using running status'''
+    data = bytearray()
+    running = None
+    for message in messages:
+        if message[0] == running:
+            data += bytes(message[1:])
+        else:
+            data += bytes(message)
+            running = message[0] if message[0] < 0xF0 else None
+    return bytes(data)
+
+
+class PortBackend:
+    '''Backend for ports taking one message at a time, like the MidiOut of
+    python-rtmidi'''
+    def __init__(self, port):
+        self.port = port
+
+    def write(self, messages):
+        for message in messages:
+            self.port.send_message(message)
+
+
+class RawBackend:
+    '''Backend writing the bytes of each batch in one write to a file
+    object, e.g. a raw MIDI device such as /dev/midi1 or a plain file'''
+    def __init__(self, outfile):
+        self.outfile = outfile
+
+    def write(self, messages):
+        self.outfile.write(pack(messages))
+        self.outfile.flush()
+
+    def close(self):
+        self.outfile.close()
+
+
+class Recorder:
+    '''Backend keeping batches in memory as (time, messages) pairs, time
+    is taken from clock (nanoseconds)'''
+    def __init__(self, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.batches = []
+
+    def write(self, messages):
+        self.batches.append((self.clock(), [list(m) for m in messages]))
+
+    def messages(self):
+        return [m for t, batch in self.batches for m in batch]
+
+
+class Output:
+    '''Queues messages with send() and hands them to the backend together
+    on flush().  Keeps track of sounding notes and the pitch bend of each
+    channel: a bend which would not change it is dropped, and of several
+    bends of one channel in a batch only the last one is sent.
+
+    Methods may be called from several threads.  A thread sending a batch
+    holds the lock from the first send() to flush(), so that messages of
+    other threads are not mixed into it.'''
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.RLock()
+        self.pending = []
+        # notes sounding as (channel, note)
+        self.sounding = set()
+        # bend sent last by channel
+        self.bends = {}
+        # index in pending of the bend queued for a channel
+        self.pending_bends = {}
+
+    def send(self, message):
+        with self.lock:
+            self._send(message)
+
+    def _send(self, message):
+        status = message[0] & 0xF0
+        channel = message[0] & 0x0F
+        if status == PITCH_BEND:
+            value = (message[1], message[2])
+            i = self.pending_bends.get(channel)
+            if i is not None:
+                if value == self.bends.get(channel):
+                    # back to the bend sounding before this batch
+                    self.pending[i] = None
+                    del self.pending_bends[channel]
+                else:
+                    self.pending[i] = message
+                return
+            if value == self.bends.get(channel):
+                return
+            self.pending_bends[channel] = len(self.pending)
+        elif status == NOTE_ON and message[2]:
+            self.sounding.add((channel, message[1]))
+        elif status == NOTE_OFF or status == NOTE_ON:
+            self.sounding.discard((channel, message[1]))
+        self.pending.append(message)
+
+    def flush(self):
+        '''Send the queued messages'''
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        for channel, i in self.pending_bends.items():
+            message = self.pending[i]
+            self.bends[channel] = (message[1], message[2])
+        messages = [m for m in self.pending if m is not None]
+        self.pending = []
+        self.pending_bends = {}
+        self.backend.write(messages)
+
+    def discard(self):
+        '''Forget queued messages except note-offs'''
+        with self.lock:
+            self.pending = [m for m in self.pending
+                            if m is not None and m[0] & 0xF0 == NOTE_OFF]
+            self.pending_bends = {}
+
+    def send_now(self, message):
+        with self.lock:
+            self._send(message)
+            self._flush()
@@ -13,12 +13,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from bisect import bisect_right
 from fractions import Fraction
 
 notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
 standard_E = [76, 71, 67, 62, 57, 52]
 
+# Internal timebase.  Divisible by 3*2^8, 5 and 7, so that regular notes down
+# to 1/256, nested triplets, quintuplets and septuplets are whole numbers of
+# ticks.  Other durations are stored as a Fraction number of ticks.
+TICKS_PER_WHOLE = 2**8 * 3**2 * 5 * 7
+
 length_names = {
     1 : 'W',
     Fraction('1/2') : 'H',
@@ -27,6 +33,51 @@ length_names = {
     Fraction('1/16') : 'S'
 }
 
+def to_ticks(duration):
+    '''Convert a duration in whole notes to ticks'''
+    ticks = Fraction(duration) * TICKS_PER_WHOLE
+    if ticks.denominator == 1:
+        return ticks.numerator
+    return ticks
+
+def from_ticks(ticks):
+    '''Convert a number of ticks to a duration in whole notes'''
+    return Fraction(ticks, TICKS_PER_WHOLE)
+
+class TempoMap:
+    '''Conversion between ticks and seconds of a piece starting at tick 0
+    with tempo changes at given ticks.  The time at each change is kept, so
+    that a conversion is a binary search.'''
+    def __init__(self, bpm=120):
+        self.ticks = [0]
+        self.seconds = [0.]
+        self.bpms = [bpm]
+
+    def change(self, tick, bpm):
+        '''Change the tempo from tick on, ticks of changes must not
+        decrease'''
+        if tick == self.ticks[-1]:
+            self.bpms[-1] = bpm
+        elif bpm != self.bpms[-1]:
+            self.seconds.append(self.seconds_at(tick))
+            self.ticks.append(tick)
+            self.bpms.append(bpm)
+
+    def bpm_at(self, tick):
+        return self.bpms[max(bisect_right(self.ticks, tick) - 1, 0)]
+
+    def seconds_at(self, tick):
+        '''Time in seconds at which tick is reached'''
+        i = max(bisect_right(self.ticks, tick) - 1, 0)
+        return self.seconds[i] + float(tick - self.ticks[i]) * \
+            240. / self.bpms[i] / TICKS_PER_WHOLE
+
+    def tick_at(self, seconds):
+        '''Tick reached at the given time in seconds'''
+        i = max(bisect_right(self.seconds, seconds) - 1, 0)
+        return self.ticks[i] + (seconds - self.seconds[i]) * \
+            self.bpms[i] * TICKS_PER_WHOLE / 240.
+
 def midi_to_note_name(note_num):
     return notes[(note_num - 24) % len(notes)] + \
             str((note_num - 24) // len(notes))
@@ -14,9 +14,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from . import tablature
+from . import midi
+from . import music
+from .midiout import Output, PortBackend, RawBackend
+from .scheduler import Scheduler, TimingStats
+import bisect
+import threading
 import time
-import math
-import functools
 
 try:
     import rtmidi
@@ -34,23 +38,51 @@ def if_mod_imported(mod, retval=None):
             return wfun
     return wrapper
 
+# controller number of the All Notes Off message
+ALL_NOTES_OFF = 123
+
 def dummy_handler():
     return True
 
 class Player:
     port = None
+    midiout = None
+    # batching output to the backend in use
+    output = None
+    # cache of compiled streams of the tab last played
+    streams = None
+    # background playback thread
+    thread = None
+    # (stream, continuous, loop tick) played in the background
+    background = None
+    # (stream, continuous, loop tick, tick) of paused background playback
+    paused = None
+    # the same of background playback stopped last
+    stopped = None
 
-    @if_mod_imported('rtmidi')
-    def __init__(self, outport=None):
+    def __init__(self, outport=None, midiout=None, scheduler=None,
+                 backend=None):
         # Handlers return a boolean indiciating wheter to continue playing
-        # Override for custom handling.
+        # Override for custom handling.  They are called from the playing
+        # thread, so background playback leaves them alone.
 
         # Called after each chord played
         self.post_play_chord = dummy_handler
         #Called before each repetition
         self.before_repeat = dummy_handler
 
-        if outport is None:
+        self.scheduler = scheduler or Scheduler()
+        self.audition = Audition(self)
+        # stream and tick last reached by playback, see position()
+        self.position_lock = threading.Lock()
+        self.last_position = None
+
+        if backend is not None:
+            self.use_backend(backend)
+        elif midiout is not None:
+            self.midiout = midiout
+            self.use_backend(PortBackend(midiout))
+        elif outport is None:
             self.open_first_output()
         else:
             self.change_output(outport)
@@ -64,6 +96,7 @@ class Player:
             self.midiout.open_port(0)
         else:
             self.midiout.open_virtual_port('vitabs out')
+        self.use_backend(PortBackend(self.midiout))
 
     @if_mod_imported('rtmidi')
     def change_output(self, num):
@@ -71,7 +104,24 @@ class Player:
             del self.midiout
         self.midiout = rtmidi.MidiOut()
         self.midiout.open_port(num)
-    
+        self.use_backend(PortBackend(self.midiout))
+
+    def open_raw_output(self, filename):
+        '''Write MIDI bytes to a file, e.g. a raw MIDI device'''
+        self.use_backend(RawBackend(open(filename, 'wb')))
+
+    def use_backend(self, backend):
+        self.stop()
+        self.audition.release()
+        if self.output is not None and hasattr(self.output.backend, 'close'):
+            self.output.backend.close()
+        self.output = Output(backend)
+
+    @property
+    def sounding(self):
+        '''Notes sounding as (channel, note)'''
+        return self.output.sounding if self.output is not None else set()
+
     @if_mod_imported('rtmidi', [])
     def list_outputs(self):
         ret = []
@@ -80,52 +130,288 @@ class Player:
             ret.append(str(i) + " " + str(port))
         return ret
 
-    @if_mod_imported('rtmidi')
     def set_instrument(self, num):
-        if not self.midiout:
+        if self.output is None:
             return
-        self.midiout.send_message([0xC0, num])
+        self.output.send_now([0xC0, num])
+
+    def silence(self):
+        '''Stop all sounding notes: release each note known to be sounding
+        and send All Notes Off to the channels used'''
+        output = self.output
+        with output.lock:
+            output.discard()
+            channels = {0}
+            for channel, note in sorted(output.sounding):
+                output.send([0x80 + channel, note, 0])
+                channels.add(channel)
+            for channel in sorted(channels):
+                output.send([midi.CONTROL_CHANGE + channel, ALL_NOTES_OFF,
+                             0])
+            output.flush()
+
+    def compile(self, crange):
+        '''Compiled event stream of a range, cached until the tab changes'''
+        tab = crange.tab
+        if self.streams is None or self.streams.tab is not tab:
+            if self.streams is not None:
+                self.streams.close()
+            self.streams = midi.StreamCache(tab)
+        return self.streams.get(crange,
+                                getattr(tab, 'tuning', music.standard_E),
+                                getattr(tab, 'bpm', 120))
 
-    @if_mod_imported('rtmidi')
     def play(self, crange, continuous=False):
-        if not self.midiout:
+        '''Play a range, returns when done'''
+        if self.output is None:
             return
-        tuning = getattr(crange.tab, 'tuning', [76, 71, 67, 62, 57, 52])
-        bpm = getattr(crange.tab, 'bpm', 120)
-        channel = 0
+        return self.play_stream(self.compile(crange), continuous)
+
+    def play_stream(self, stream, continuous=False, tick=0, loop=None):
+        '''Play a compiled stream from the given tick, returns timing
+        statistics.  Repetitions of continuous playback start at the loop
+        tick, by default the first one.'''
+        offsets = stream.offsets()
+        batches = stream.batches()
+        length = stream.time_ns(stream.length)
+        ticks = stream.ticks
+        status, data1, data2 = stream.status, stream.data1, stream.data2
+        output = self.output
+        send = output.send
+        if loop is None:
+            loop = tick
+
+        def fire(batch):
+            # events of one tick go out together
+            with output.lock:
+                for i in range(batches[batch], batches[batch + 1]):
+                    if status[i] == midi.CHORD_END:
+                        self.set_position(stream, ticks[i])
+                        if not self.post_play_chord():
+                            output.flush()
+                            return False
+                    else:
+                        send([status[i], data1[i], data2[i]])
+                output.flush()
+
+        scheduler = self.scheduler
+        scheduler.stats = TimingStats()
+        start = None
         try:
             while True:
                 if not self.before_repeat():
                     break
-                bartime = (240./bpm)
-                for c in crange.chords():
-                    play_vibrato = False
-                    for fr in c.strings.values():
-                        if 'vibrato' in fr.symbols:
-                            play_vibrato = True
-                            break
-                    for s, fr in c.strings.items():
-                        self.midiout.send_message(
-                            [144 + channel, tuning[s]+fr.fret, 100])
-                    if play_vibrato:
-                        interval = c.duration * bartime / 20
-                        for i in range(20):
-                            self.midiout.send_message([
-                                224 + channel,
-                                0,
-                                40 + int(15. * math.sin(float(i) / 0.95))
-                            ])
-                            time.sleep(interval)
-                        self.midiout.send_message([224 + channel, 0, 40])
-                    else:
-                        time.sleep(c.duration * bartime)
-                    for s, fr in c.strings.items():
-                        self.midiout.send_message(
-                            [128 + channel, tuning[s]+fr.fret, 100])
-                    if not self.post_play_chord():
-                        break
+                self.set_position(stream, tick)
+                # the first batch is found by bisection on the cached
+                # offsets, earlier chords are not walked
+                first = bisect.bisect_left(offsets, stream.time_ns(tick))
+                if start is None:
+                    start = scheduler.clock() - stream.time_ns(tick)
+                if not scheduler.run(offsets, fire, start, first):
+                    break
                 if not continuous:
                     break
+                # repetitions follow each other on the same timeline
+                start += length - stream.time_ns(loop)
+                tick = loop
         except KeyboardInterrupt:
-            for s, fr in c.strings.items():
-                self.midiout.send_message([144, tuning[s]+fr.fret, 0])
+            pass
+        finally:
+            self.silence()
+        return scheduler.stats
+
+    def set_position(self, stream, tick):
+        with self.position_lock:
+            self.last_position = (stream, tick)
+
+    def position(self):
+        '''(bar, chord) position of the chord being played, or the one where
+        playback stopped'''
+        with self.position_lock:
+            if self.last_position is None:
+                return None
+            stream, tick = self.last_position
+        if not stream.positions:
+            return None
+        return stream.positions[stream.chord_at(tick)]
+
+    def playing(self):
+        '''True while playing in the background'''
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, crange, continuous=False, position=None, seconds=None,
+              instrument=None):
+        '''Start playing a range in the background, from the chord at a
+        (bar, chord) position or time in seconds if given, with the program
+        changed to instrument if given'''
+        self.stop()
+        self.audition.release()
+        self.paused = None
+        if self.output is None:
+            return
+        if instrument is not None:
+            # sent once the playback thread is gone
+            self.set_instrument(instrument)
+        stream = self.compile(crange)
+        tick = self.seek_tick(stream, position, seconds)
+        self.spawn(stream, continuous, tick, tick)
+
+    def spawn(self, stream, continuous, tick, loop=0):
+        self.scheduler.cancelled.clear()
+        self.background = (stream, continuous, loop)
+        self.thread = threading.Thread(
+            target=self.play_stream, args=(stream, continuous, tick, loop),
+            name='playback')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        '''Stop background playback, returns once all notes are off.
+        pause() resumes it from where it stopped.'''
+        self.paused = None
+        if self.thread is not None:
+            self.scheduler.cancel()
+            self.thread.join()
+            self.thread = None
+            self.stopped = self.background + (self.last_position[1],)
+
+    def pause(self):
+        '''Pause background playback or resume paused or stopped
+        playback'''
+        if self.playing():
+            self.stop()
+            self.paused = self.stopped
+            return
+        if self.thread is not None:
+            # playback has reached the end
+            self.stop()
+        resumed = self.paused or self.stopped
+        if resumed is None or self.output is None:
+            return
+        stream, continuous, loop, tick = resumed
+        self.paused = None
+        if tick >= stream.length:
+            tick = loop
+        self.spawn(stream, continuous, tick, loop)
+
+    def seek_tick(self, stream, position=None, seconds=None):
+        if position is not None:
+            return stream.tick_of(position)
+        if seconds is not None:
+            return stream.tick_at_seconds(seconds)
+        return 0
+
+    def seek(self, position=None, seconds=None):
+        '''Move playing or paused playback to the chord at a (bar, chord)
+        position or time in seconds, returns False if there is no such
+        playback'''
+        if self.paused is not None:
+            stream, continuous, loop, tick = self.paused
+        elif self.playing():
+            stream, continuous, loop = self.background
+        else:
+            return False
+        tick = self.seek_tick(stream, position, seconds)
+        if self.paused is not None:
+            self.paused = (stream, continuous, loop, tick)
+            self.set_position(stream, tick)
+        else:
+            self.stop()
+            self.spawn(stream, continuous, tick, loop)
+        return True
+
+    def seek_bars(self, num):
+        '''Move playback num bars forward (or back when negative)'''
+        if self.paused is not None:
+            stream = self.paused[0]
+        elif self.playing():
+            stream = self.background[0]
+        else:
+            return
+        if not stream.positions:
+            return
+        bar = stream.positions[stream.chord_at(self.last_position[1])][0]
+        self.seek((bar + num, 0))
+
+
+class Audition:
+    '''Sounds notes briefly, e.g. a chord just entered.  Notes are struck
+    at once and released by a timer thread, so the caller never waits for
+    them.  Nothing is sounded while the player plays in the background.'''
+    # seconds a note sounds
+    length = 0.5
+    thread = None
+
+    def __init__(self, player):
+        self.player = player
+        self.cond = threading.Condition()
+        # (output, messages) releasing the notes sounding
+        self.releasing = None
+        self.deadline = None
+        self.instrument = None
+        self.closing = False
+
+    def play(self, notes, instrument=None, channel=0):
+        '''Strike notes (MIDI note numbers), releasing notes sounded
+        before'''
+        output = self.player.output
+        if output is None or self.player.playing():
+            return
+        with self.cond:
+            self._release()
+            with output.lock:
+                if instrument is not None and instrument != self.instrument:
+                    output.send([midi.PROGRAM_CHANGE | channel, instrument])
+                    self.instrument = instrument
+                for note in notes:
+                    output.send([midi.NOTE_ON | channel, note,
+                                 midi.VELOCITY])
+                output.flush()
+            self.releasing = (output, [[midi.NOTE_OFF | channel, note, 0]
+                                       for note in notes])
+            self.deadline = time.monotonic() + self.length
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run,
+                                               name='audition')
+                self.thread.daemon = True
+                self.thread.start()
+            self.cond.notify()
+
+    def release(self):
+        '''Release sounding notes now'''
+        with self.cond:
+            self._release()
+            # the player may switch outputs or programs
+            self.instrument = None
+
+    def _release(self):
+        if self.releasing is not None:
+            output, messages = self.releasing
+            with output.lock:
+                for message in messages:
+                    output.send(message)
+                output.flush()
+        self.releasing = None
+        self.deadline = None
+
+    def run(self):
+        with self.cond:
+            while not self.closing:
+                if self.deadline is None:
+                    self.cond.wait()
+                    continue
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                else:
+                    self._release()
+
+    def close(self):
+        '''Release notes and stop the timer thread'''
+        with self.cond:
+            self._release()
+            self.closing = True
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
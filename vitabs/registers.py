@@ -0,0 +1,74 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Registers holding yanked chords.
+
+A register keeps the yanked bars encoded as tabfile records.  Pasted bars
+are inserted as BarStubs reading from the register, so pasting shares the
+records between all copies and a bar is decoded into its own objects only
+when it is first accessed, e.g. to be drawn or edited.'''
+
+from .tablature import BarIndex, BarStub
+from .tabfile import encode_bar, decode_bar
+
+# register used when none is named
+UNNAMED = '"'
+
+
+class _Segment:
+    '''Part of a bar, encoded like a bar'''
+    __slots__ = ('chords', 'sig_num', 'sig_den')
+
+    def __init__(self, bar, chords):
+        self.chords = chords
+        self.sig_num = bar.sig_num
+        self.sig_den = bar.sig_den
+
+
+class Register:
+    def __init__(self, crange):
+        '''Yank the chords of a range'''
+        # whole bars are pasted as bars, chords from a single bar are
+        # pasted into the bar at the cursor
+        self.linewise = crange.whole_bars() or not crange.is_single_bar()
+        self.symbol_ids = {}
+        self.records = []
+        (first_bar, first_chord), (last_bar, last_chord) = \
+                crange.beginning, crange.end
+        for bar_num, bar in enumerate(crange.bars(), first_bar):
+            first = first_chord if bar_num == first_bar else 1
+            last = last_chord if bar_num == last_bar else len(bar.chords)
+            if first > 1 or last < len(bar.chords):
+                bar = _Segment(bar, bar.chords[first - 1 : last])
+            self.records.append(encode_bar(bar, self.symbol_ids))
+        self.symbol_names = list(self.symbol_ids)
+        self.metrics = [BarIndex.measure(self.load_bar(i))
+                        for i in range(len(self.records))]
+
+    def __len__(self):
+        return len(self.records)
+
+    def load_bar(self, i):
+        return decode_bar(self.records[i], 0, self.symbol_names)[0]
+
+    def bars(self):
+        '''Placeholders for a copy of the yanked bars'''
+        return [BarStub(self, i, self.metrics[i])
+                for i in range(len(self.records))]
+
+    def chords(self):
+        '''A copy of the yanked chords'''
+        return [c for i in range(len(self.records))
+                for c in self.load_bar(i).chords]
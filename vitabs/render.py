@@ -0,0 +1,167 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Rendering tablature to audio without a MIDI device.
+
+Notes are synthesized by a wavetable plucked string: the harmonics of a
+string plucked near the bridge, fading from a bright to a dull spectrum
+as the note decays.  Requires numpy.'''
+
+import wave
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .music import standard_E
+from .tablature import ChordRange
+
+RATE = 44100
+TABLE_SIZE = 2048
+HARMONICS = 24
+# where the string is plucked, as a fraction of its length
+PLUCK_POSITION = 0.2
+# bends and slides without a target go this many semitones
+BEND = 2
+VIBRATO_DEPTH = 0.3
+VIBRATO_RATE = 5.5
+# fade at the end of each note, in seconds
+RELEASE = 0.01
+# highest pitch reached by a bend, relative to the note, used to keep
+# harmonics below the Nyquist frequency
+HEADROOM = 2 ** (BEND / 12.)
+
+_tables = {}
+
+def tables(nharmonics):
+    '''Bright and dull single cycle waves with nharmonics harmonics'''
+    if nharmonics not in _tables:
+        k = numpy.arange(1, nharmonics + 1)[:, None]
+        phase = 2 * numpy.pi * k * numpy.arange(TABLE_SIZE) / TABLE_SIZE
+        pluck = numpy.sin(k * numpy.pi * PLUCK_POSITION)
+        bright = (pluck / k * numpy.sin(phase)).sum(axis=0)
+        dull = (pluck / k**3 * numpy.sin(phase)).sum(axis=0)
+        _tables[nharmonics] = (bright / abs(bright).max(),
+                               dull / abs(dull).max())
+    return _tables[nharmonics]
+
+def frequency(note):
+    return 440. * 2 ** ((note - 69) / 12.)
+
+
+def pitch_curve(fret, t, duration, target=None):
+    '''Offset from the pitch of the fret in semitones at times t of a note
+    lasting duration seconds.  target is the fret played next on the same
+    string, where a slide goes.'''
+    semis = numpy.zeros(len(t))
+    if fret.has_symbol('bend'):
+        semis += BEND * numpy.clip(t / (duration / 4), 0, 1)
+    if fret.has_symbol('release'):
+        semis += BEND * (1 - numpy.clip(t / (duration / 4), 0, 1))
+    for name, direction in (('slide up', 1), ('slide down', -1)):
+        if fret.has_symbol(name):
+            if target is not None and (target - fret.fret) * direction > 0:
+                distance = target - fret.fret
+            else:
+                distance = BEND * direction
+            semis += distance * numpy.clip(2 * t / duration - 1, 0, 1)
+    if fret.has_symbol('vibrato'):
+        semis += VIBRATO_DEPTH * numpy.sin(2 * numpy.pi * VIBRATO_RATE * t)
+    return semis
+
+def pluck(note, fret, n, rate=RATE, target=None):
+    '''n samples of a note'''
+    duration = n / float(rate)
+    t = numpy.arange(n) / float(rate)
+    f0 = frequency(note)
+    nharmonics = max(1, min(HARMONICS, int(rate / 2 / (f0 * HEADROOM))))
+    bright, dull = tables(nharmonics)
+
+    freq = f0 * 2 ** (pitch_curve(fret, t, duration, target) / 12.)
+    phase = numpy.cumsum(freq) * (TABLE_SIZE / float(rate))
+    i = phase.astype(numpy.int64) % TABLE_SIZE
+
+    # low strings ring longer and keep their brightness longer
+    decay = 1.2 * (110. / f0) ** 0.5
+    envelope = numpy.exp(-t / decay)
+    dullness = 1 - numpy.exp(-t / (decay * 0.3))
+    out = envelope * ((1 - dullness) * bright[i] + dullness * dull[i])
+    if fret.has_symbol('hammer on') or fret.has_symbol('pull off'):
+        out *= 0.6
+    fade = min(n, int(RELEASE * rate))
+    if fade:
+        out[n - fade:] *= numpy.linspace(1, 0, fade)
+    return out
+
+
+def render(crange, tuning=None, bpm=120, rate=RATE):
+    '''Samples (floats between -1 and 1) of the chords of a range, bpm is
+    the tempo of bars before the first tempo change'''
+    if numpy is None:
+        raise RuntimeError('numpy is required to render audio')
+    if tuning is None:
+        tuning = standard_E
+    tempo = crange.tempo_map(bpm)
+    chords = list(crange.chords())
+    total = sum(c.ticks for c in chords)
+    sample_of = lambda tick: int(round(tempo.seconds_at(tick) * rate))
+    out = numpy.zeros(sample_of(total))
+    # notes as [start tick, end tick, pitch, fret, target], a tied note
+    # lengthens the note before it
+    notes = []
+    sounding = {}
+    t = 0
+    for i, c in enumerate(chords):
+        following = chords[i + 1].strings if i + 1 < len(chords) else {}
+        playing = {}
+        for s, fr in c.strings.items():
+            target = following[s].fret if s in following else None
+            pitch = tuning[s] + fr.fret
+            note = sounding.get(s)
+            if fr.has_symbol('tie') and note is not None and \
+                    note[2] == pitch:
+                note[1] = t + c.ticks
+                note[4] = target
+            else:
+                note = [t, t + c.ticks, pitch, fr, target]
+                notes.append(note)
+            playing[s] = note
+        sounding = playing
+        t += c.ticks
+    for first, last, pitch, fr, target in notes:
+        start, end = sample_of(first), sample_of(last)
+        out[start:end] += pluck(pitch, fr, end - start, rate, target)
+    peak = abs(out).max() if len(out) else 0
+    if peak > 0:
+        out *= 0.9 / peak
+    return out
+
+def write_wav(filename, samples, rate=RATE):
+    '''Save samples as a 16 bit mono WAV file'''
+    data = (numpy.clip(samples, -1, 1) * 32767).astype('<i2')
+    with wave.open(filename, 'wb') as outfile:
+        outfile.setnchannels(1)
+        outfile.setsampwidth(2)
+        outfile.setframerate(rate)
+        outfile.writeframes(data.tobytes())
+
+def export(tab, filename, crange=None, rate=RATE):
+    '''Save a tab (or a range of it) as a WAV file'''
+    if crange is None:
+        crange = ChordRange(tab, (1, 1), tab.last_position())
+    samples = render(crange, getattr(tab, 'tuning', standard_E),
+                     getattr(tab, 'bpm', 120), rate)
+    write_wav(filename, samples, rate)
@@ -0,0 +1,93 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Running actions at absolute points in time'''
+
+import threading
+import time
+
+
+class TimingStats:
+    '''Lateness of actions run by a scheduler, in nanoseconds'''
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.last = 0
+
+    def add(self, lateness):
+        self.count += 1
+        self.total += abs(lateness)
+        self.max = max(self.max, abs(lateness))
+        self.last = lateness
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def drift(self):
+        '''Lateness of the last action, how far behind the timeline the
+        run ended'''
+        return self.last
+
+    def __str__(self):
+        return ('{} events, jitter mean {:.3f} ms, max {:.3f} ms, '
+                'drift {:.3f} ms'.format(self.count, self.mean() / 1e6,
+                                         self.max / 1e6, self.drift() / 1e6))
+
+
+class Scheduler:
+    '''Runs actions at deadlines counted from a start time on a monotonic
+    clock.  Deadlines are absolute, so time spent in actions delays only
+    the action itself, never the ones after it.
+
+    The scheduler sleeps until spin nanoseconds before a deadline and
+    polls the clock from there.  A run can be stopped from another thread
+    with cancel(), which also cuts the default sleep short.'''
+    def __init__(self, clock=time.perf_counter_ns, sleep=None,
+                 spin=300000):
+        self.cancelled = threading.Event()
+        self.clock = clock
+        self.sleep = sleep or self.cancelled.wait
+        self.spin = spin
+        self.stats = TimingStats()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def wait_until(self, deadline):
+        '''Returns False if cancelled before the deadline'''
+        while True:
+            if self.cancelled.is_set():
+                return False
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return True
+            if remaining > self.spin:
+                self.sleep((remaining - self.spin) / 1e9)
+
+    def run(self, offsets, action, start=None, first=0):
+        '''Call action(i) at start + offsets[i] for each i from first on
+        (start defaults to now), offsets must be sorted.  Stops when an
+        action returns False or the run is cancelled, returning False.'''
+        if start is None:
+            start = self.clock()
+        for i in range(first, len(offsets)):
+            deadline = start + offsets[i]
+            if not self.wait_until(deadline):
+                return False
+            self.stats.add(self.clock() - deadline)
+            if action(i) is False:
+                return False
+        return True
@@ -0,0 +1,200 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Swap files: periodic snapshots of an edited tablature, written in the
+background, from which unsaved changes can be recovered after a crash.'''
+
+import os
+import os.path
+import threading
+import time
+
+from . import tabfile
+from .tablature import BarStub
+
+
+def swap_name(filename):
+    '''Name of the swap file for a tablature file, e.g. .song.tab.swp'''
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, '.' + name + '.swp')
+
+def recovery_available(filename):
+    '''True if there is a swap file for filename newer than the file'''
+    swap = swap_name(filename)
+    if not os.path.isfile(swap):
+        return False
+    if not os.path.isfile(filename):
+        return True
+    return os.path.getmtime(swap) >= os.path.getmtime(filename)
+
+
+class Snapshot:
+    '''Contents of a tablature at one moment, ready to be written without
+    touching the tablature: header fields, symbol names and for each bar
+    its encoded record (bytes or a (buffer, offset, length) slice of a
+    mapped file) and bar table entry'''
+    def __init__(self, header, symbol_names, records):
+        self.header = header
+        self.symbol_names = symbol_names
+        self.records = records
+
+    def write(self, outfile):
+        outfile.write(tabfile.HEADER.pack(tabfile.MAGIC, tabfile.VERSION, 0,
+                                          *self.header + (0, 0)))
+        entries = []
+        offset = tabfile.HEADER.size
+        for data, entry in self.records:
+            if not isinstance(data, bytes):
+                buf, start, length = data
+                data = buf[start : start + length]
+            outfile.write(data)
+            entries.append((offset, len(data)) + entry[2:])
+            offset += len(data)
+        symbol_ids = {name: i for i, name in enumerate(self.symbol_names)}
+        outfile.write(tabfile.encode_index(symbol_ids, entries))
+        outfile.seek(0)
+        outfile.write(tabfile.HEADER.pack(tabfile.MAGIC, tabfile.VERSION, 0,
+                                          *self.header +
+                                          (offset, len(entries))))
+
+
+class Autosave:
+    '''Keeps the swap file of a tablature up to date.
+
+    tick() is called by the editor between key presses.  Once interval
+    seconds have passed since the last snapshot and the tablature changed,
+    it takes a snapshot, encoding only bars changed since the previous one,
+    and hands it to a background thread which writes the swap file.'''
+    def __init__(self, tab, filename, interval=4):
+        self.tab = tab
+        self.filename = filename
+        self.interval = interval
+        self.log = tab.open_log()
+        self.last_snapshot = time.monotonic()
+        self.error = None
+        # encoded records of bars and foreign stubs by object
+        self.records = {}
+        self.reader = None
+        self.symbol_ids = {}
+        self.header = tabfile.header_fields(tab)
+
+        self.cond = threading.Condition()
+        self.job = None
+        self.closing = False
+        self.thread = threading.Thread(target=self.run, name='autosave')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def dirty(self):
+        return bool(self.log) or tabfile.header_fields(self.tab) != self.header
+
+    def tick(self):
+        '''Take a snapshot if it is due'''
+        now = time.monotonic()
+        if now - self.last_snapshot < self.interval or not self.dirty():
+            return
+        self.last_snapshot = now
+        self.submit(self.snapshot())
+
+    def snapshot(self):
+        '''Capture the tablature, returns a function writing the swap
+        file'''
+        tab = self.tab
+        journal = tab.journal
+        reader = journal.reader if journal is not None else None
+        if reader is not self.reader:
+            # records of the new source use its symbol numbers
+            self.reader = reader
+            self.records = {}
+            self.symbol_ids = {}
+            if reader is not None:
+                for name in reader.symbol_names:
+                    self.symbol_ids[name] = len(self.symbol_ids)
+        self.clear_log()
+
+        records = []
+        for item in tab.bars.raw_items():
+            if isinstance(item, BarStub) and item.source is reader:
+                entry = reader.entries[item.key]
+                records.append(((reader.buf, entry[0], entry[1]), entry))
+                continue
+            record = self.records.get(item)
+            if record is None:
+                bar = item.load() if isinstance(item, BarStub) else item
+                data = tabfile.encode_bar(bar, self.symbol_ids)
+                record = (data, tabfile.bar_entry(bar, 0, len(data)))
+                self.records[item] = record
+            records.append(record)
+        snapshot = Snapshot(self.header,
+                            sorted(self.symbol_ids, key=self.symbol_ids.get),
+                            records)
+        return lambda: self.write(snapshot)
+
+    def write(self, snapshot):
+        tmpname = self.filename + '.tmp'
+        with open(tmpname, 'wb') as outfile:
+            snapshot.write(outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmpname, self.filename)
+
+    def remove(self):
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+    def clear_log(self):
+        '''Forget changes logged so far, dropping stale records'''
+        for bar in self.log.edited:
+            self.records.pop(bar, None)
+        self.log.splices = []
+        self.log.edited = set()
+        self.header = tabfile.header_fields(self.tab)
+
+    def saved(self):
+        '''Called after the tablature has been saved, the swap file is no
+        longer needed'''
+        self.clear_log()
+        self.submit(self.remove)
+
+    def submit(self, job):
+        '''Schedule job to be run by the background thread, replacing any
+        job not yet started'''
+        with self.cond:
+            self.job = job
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.job is None and not self.closing:
+                    self.cond.wait()
+                if self.job is None:
+                    return
+                job, self.job = self.job, None
+            try:
+                job()
+            except (OSError, IOError) as e:
+                self.error = e
+
+    def close(self, remove=True):
+        '''Finish pending writes and stop the background thread, removing
+        the swap file unless remove is False'''
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.thread.join()
+        self.tab.close_log(self.log)
+        if remove:
+            self.remove()
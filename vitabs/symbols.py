@@ -21,7 +21,8 @@ templates = {
     'vibrato' : '{}~',
     'tremolo' : '{}"',
     'slide up' : '{}/',
-    'slide down' : '{}\\'
+    'slide down' : '{}\\',
+    'tie' : '({})'
 }
 
 keys = {
@@ -32,7 +33,8 @@ keys = {
     ord('v') : 'vibrato',
     ord('t') : 'tremolo',
     ord('s') : 'slide up',
-    ord('d') : 'slide down'
+    ord('d') : 'slide down',
+    ord('(') : 'tie'
 }
 
 def apply_symbols(fretnum, symlist):
@@ -0,0 +1,565 @@
+# Copyright (C) 2011  Pawel Stiasny
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Reading and writing the binary tablature file format, described in
+doc/file_format.md'''
+
+import gc
+import mmap
+import os
+import pickle
+import struct
+import zlib
+from fractions import Fraction
+
+from .tablature import Fret, Chord, Bar, Tablature, BarStub, BarIndex
+
+MAGIC = b'VTAB'
+JOURNAL_MAGIC = b'VJNL'
+VERSION = 3
+
+# magic, version, flags, bpm, instrument, number of strings, tuning,
+# index offset, number of bars
+HEADER = struct.Struct('<4sHHdhB8sQI')
+# magic, payload length, length of bar records, CRC-32 of the payload
+JOURNAL_RECORD = struct.Struct('<4sIII')
+# bpm, instrument, number of strings, tuning
+JOURNAL_HEADER = struct.Struct('<dhB8s')
+COUNT = struct.Struct('<I')
+# operation, start, number of removed bars, number of inserted bars
+SPLICE = struct.Struct('<BIII')
+# operation, position
+REPLACE = struct.Struct('<BI')
+# offset, length, ticks, number of chords, width, flags
+ENTRY = struct.Struct('<QIqIIB')
+# signature numerator, denominator, flags, number of chords
+BAR = struct.Struct('<HHBI')
+LABEL = struct.Struct('<H')
+TEMPO = struct.Struct('<d')
+# number of strings (ORed with CHORD_FRACTION), ticks
+CHORD = struct.Struct('<Bi')
+FRACTION = struct.Struct('<qq')
+# string, fret number, number of symbols
+FRET = struct.Struct('<BHB')
+
+BAR_LABEL = 1
+BAR_TEMPO = 2
+CHORD_FRACTION = 0x80
+ENTRY_LABEL = 1
+ENTRY_TEMPO = 2
+OP_SPLICE = 1
+OP_REPLACE = 2
+
+class FormatError(Exception):
+    pass
+
+def is_tabfile(data):
+    '''Check whether data (at least the first 4 bytes of a file) starts
+    a file in this format'''
+    return data[:len(MAGIC)] == MAGIC
+
+def encode_bar(bar, symbol_ids):
+    '''Encode a bar, symbol_ids maps symbol names to numbers and is
+    extended with symbols not seen before'''
+    out = bytearray()
+    label = getattr(bar, 'label', None)
+    tempo = getattr(bar, 'tempo', None)
+    flags = ((0 if label is None else BAR_LABEL) |
+             (0 if tempo is None else BAR_TEMPO))
+    out += BAR.pack(bar.sig_num, bar.sig_den, flags, len(bar.chords))
+    if label is not None:
+        data = label.encode('utf-8')
+        out += LABEL.pack(len(data))
+        out += data
+    if tempo is not None:
+        out += TEMPO.pack(tempo)
+    for chord in bar.chords:
+        ticks = chord.ticks
+        strings = chord.strings
+        if isinstance(ticks, int):
+            out += CHORD.pack(len(strings), ticks)
+        else:
+            out += CHORD.pack(len(strings) | CHORD_FRACTION, 0)
+            out += FRACTION.pack(ticks.numerator, ticks.denominator)
+        for string, fret in strings.items():
+            symbols = [symbol_ids.setdefault(s, len(symbol_ids))
+                       for s in fret.iter_symbols()]
+            out += FRET.pack(string, fret.fret, len(symbols))
+            if symbols:
+                out += bytes(symbols)
+    return bytes(out)
+
+def decode_bar(buf, offset, symbol_names):
+    '''Decode a bar starting at offset in buf, returns the bar and the
+    offset following it'''
+    sig_num, sig_den, flags, nchords = BAR.unpack_from(buf, offset)
+    offset += BAR.size
+    label = None
+    if flags & BAR_LABEL:
+        (length,) = LABEL.unpack_from(buf, offset)
+        offset += LABEL.size
+        label = bytes(buf[offset : offset + length]).decode('utf-8')
+        offset += length
+    tempo = None
+    if flags & BAR_TEMPO:
+        (tempo,) = TEMPO.unpack_from(buf, offset)
+        offset += TEMPO.size
+
+    chords = []
+    for i in range(nchords):
+        nstrings, ticks = CHORD.unpack_from(buf, offset)
+        offset += CHORD.size
+        if nstrings & CHORD_FRACTION:
+            nstrings &= ~CHORD_FRACTION
+            num, den = FRACTION.unpack_from(buf, offset)
+            offset += FRACTION.size
+            ticks = Fraction(num, den)
+        strings = {}
+        for j in range(nstrings):
+            string, fretnum, nsymbols = FRET.unpack_from(buf, offset)
+            offset += FRET.size
+            fret = Fret(fretnum)
+            if nsymbols:
+                fret.symbols = [symbol_names[k]
+                                for k in buf[offset : offset + nsymbols]]
+                offset += nsymbols
+            strings[string] = fret
+        chords.append(Chord.with_ticks(ticks, strings))
+
+    bar = Bar.with_chords(chords, sig_num, sig_den)
+    if label is not None:
+        bar.label = label
+    if tempo is not None:
+        bar.tempo = tempo
+    return bar, offset
+
+def bar_entry(bar, offset, length):
+    '''Bar table entry: location of the record and metrics of the bar, which
+    allow indexing bars without decoding them'''
+    ticks = bar.real_ticks()
+    return (offset, length, ticks if isinstance(ticks, int) else -1,
+            len(bar.chords), bar.total_width(),
+            (ENTRY_LABEL if hasattr(bar, 'label') else 0) |
+            (ENTRY_TEMPO if hasattr(bar, 'tempo') else 0))
+
+def header_fields(tab):
+    '''Tempo, instrument, number of strings and tuning as stored in the
+    header'''
+    tuning = getattr(tab, 'tuning', None) or []
+    return (float(getattr(tab, 'bpm', 0)), getattr(tab, 'instrument', -1),
+            len(tuning), bytes(tuning).ljust(8, b'\0'))
+
+def encode_header(tab, index_offset, nbars):
+    return HEADER.pack(MAGIC, VERSION, 0, *header_fields(tab),
+                       index_offset, nbars)
+
+def encode_symbols(symbol_ids):
+    out = bytearray()
+    names = sorted(symbol_ids, key=symbol_ids.get)
+    out.append(len(names))
+    for name in names:
+        data = name.encode('utf-8')
+        out.append(len(data))
+        out += data
+    return out
+
+def decode_symbols(buf, offset):
+    '''Returns the list of symbol names and the offset following it'''
+    names = []
+    nsymbols = buf[offset]
+    offset += 1
+    for i in range(nsymbols):
+        length = buf[offset]
+        names.append(
+            bytes(buf[offset + 1 : offset + 1 + length]).decode('utf-8'))
+        offset += 1 + length
+    return names, offset
+
+def encode_index(symbol_ids, entries):
+    out = encode_symbols(symbol_ids)
+    for entry in entries:
+        out += ENTRY.pack(*entry)
+    return bytes(out)
+
+class TabWriter:
+    '''Streaming writer, bars are written one at a time with write_bar,
+    close writes the bar table and completes the header.  The output file
+    must be seekable.
+
+    Records of bars not yet decoded from the source reader are copied
+    without decoding.'''
+    def __init__(self, outfile, tab, source=None):
+        self.outfile = outfile
+        self.tab = tab
+        self.source = source
+        self.start = outfile.tell()
+        self.symbol_ids = {}
+        if source is not None:
+            # keep symbol numbers so that source records stay valid
+            for name in source.symbol_names:
+                self.symbol_ids[name] = len(self.symbol_ids)
+        self.entries = []
+        outfile.write(encode_header(tab, 0, 0))
+
+    def write_bar(self, bar):
+        offset = self.outfile.tell() - self.start
+        if isinstance(bar, BarStub):
+            if bar.source is self.source:
+                data, entry = self.source.raw_bar(bar.key)
+                self.outfile.write(data)
+                self.entries.append((offset,) + entry[1:])
+                return
+            bar = bar.load()
+        data = encode_bar(bar, self.symbol_ids)
+        self.outfile.write(data)
+        self.entries.append(bar_entry(bar, offset, len(data)))
+
+    def close(self):
+        index_offset = self.outfile.tell() - self.start
+        self.outfile.write(encode_index(self.symbol_ids, self.entries))
+        end = self.outfile.tell()
+        self.outfile.seek(self.start)
+        self.outfile.write(
+            encode_header(self.tab, index_offset, len(self.entries)))
+        self.outfile.seek(end)
+
+class TabReader:
+    '''Reader of a file held in a buffer (bytes or anything supporting the
+    buffer protocol), bars are decoded on request.  Journal records are
+    applied while reading, a damaged or incomplete record and anything
+    following it are ignored.'''
+    def __init__(self, buf):
+        if len(buf) < HEADER.size or not is_tabfile(buf):
+            raise FormatError('Not a VITABS file')
+        (magic, version, flags, bpm, instrument, nstrings, tuning,
+         index_offset, nbars) = HEADER.unpack_from(buf, 0)
+        if version > VERSION:
+            raise FormatError('Unsupported file version {}'.format(version))
+        self.buf = buf
+        self.version = version
+        self.header = (bpm, instrument, nstrings, tuning)
+
+        self.symbol_names, offset = decode_symbols(buf, index_offset)
+        self.entries = [ENTRY.unpack_from(buf, offset + i * ENTRY.size)
+                        for i in range(nbars)]
+        # size of the file without journal records
+        self.base_size = offset + nbars * ENTRY.size
+        # size of the file up to the last valid journal record
+        self.end = self.base_size
+        while self.read_journal_record():
+            pass
+
+    def read_journal_record(self):
+        '''Apply the journal record at self.end, returns False if there is
+        no valid record'''
+        buf = self.buf
+        start = self.end + JOURNAL_RECORD.size
+        if len(buf) < start:
+            return False
+        magic, length, records_length, crc = \
+                JOURNAL_RECORD.unpack_from(buf, self.end)
+        if (magic != JOURNAL_MAGIC or len(buf) < start + length or
+                zlib.crc32(buf[start : start + length]) != crc):
+            return False
+
+        offset = start + records_length
+        self.header = JOURNAL_HEADER.unpack_from(buf, offset)
+        offset += JOURNAL_HEADER.size
+        self.symbol_names, offset = decode_symbols(buf, offset)
+        (nops,) = COUNT.unpack_from(buf, offset)
+        offset += COUNT.size
+        entries = self.entries = list(self.entries)
+        for i in range(nops):
+            if buf[offset] == OP_SPLICE:
+                op, first, nremoved, ninserted = \
+                        SPLICE.unpack_from(buf, offset)
+                offset += SPLICE.size
+                entries[first : first + nremoved] = [
+                    ENTRY.unpack_from(buf, offset + j * ENTRY.size)
+                    for j in range(ninserted)]
+                offset += ninserted * ENTRY.size
+            elif buf[offset] == OP_REPLACE:
+                op, position = REPLACE.unpack_from(buf, offset)
+                offset += REPLACE.size
+                entries[position] = ENTRY.unpack_from(buf, offset)
+                offset += ENTRY.size
+            else:
+                raise FormatError('Unknown journal operation')
+        self.end = start + length
+        return True
+
+    def __len__(self):
+        return len(self.entries)
+
+    def read_bar(self, i):
+        return decode_bar(self.buf, self.entries[i][0], self.symbol_names)[0]
+
+    load_bar = read_bar
+
+    def raw_bar(self, i):
+        '''Encoded record and bar table entry of a bar'''
+        entry = self.entries[i]
+        return self.buf[entry[0] : entry[0] + entry[1]], entry
+
+    def stub(self, i):
+        '''A placeholder for the i-th bar, decoded on first access'''
+        offset, length, ticks, nchords, width, flags = self.entries[i]
+        if ticks < 0:
+            metrics = None
+        else:
+            metrics = BarIndex.stub_metrics(
+                ticks, nchords, width, flags & ENTRY_LABEL,
+                flags & ENTRY_TEMPO)
+        return BarStub(self, i, metrics)
+
+    def __iter__(self):
+        for i in range(len(self.entries)):
+            yield self.read_bar(i)
+
+    def apply_header(self, tab):
+        '''Set tablature attributes stored in the header'''
+        bpm, instrument, nstrings, tuning = self.header
+        if bpm:
+            tab.bpm = bpm
+        if instrument >= 0:
+            tab.instrument = instrument
+        if nstrings:
+            tab.tuning = list(tuning[:nstrings])
+
+def write(outfile, tab):
+    source = None
+    for bar in tab.bars.raw_items():
+        if isinstance(bar, BarStub) and isinstance(bar.source, TabReader):
+            source = bar.source
+            break
+    writer = TabWriter(outfile, tab, source)
+    for bar in tab.bars.raw_items():
+        writer.write_bar(bar)
+    writer.close()
+
+def read(buf):
+    reader = TabReader(buf)
+    tab = Tablature()
+    reader.apply_header(tab)
+    # the collector would repeatedly scan the growing object graph while
+    # nothing can be freed
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        tab.bars = list(reader)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return tab
+
+def read_lazy(buf):
+    '''Create a tablature whose bars are decoded from buf when accessed'''
+    return _lazy_tablature(TabReader(buf))
+
+def _lazy_tablature(reader):
+    tab = Tablature()
+    reader.apply_header(tab)
+    tab.bars = [reader.stub(i) for i in range(len(reader))]
+    return tab
+
+class _TablatureUnpickler(pickle.Unpickler):
+    '''Unpickler which only constructs tablature classes, so that importing
+    a file can not run arbitrary code'''
+    allowed = {
+        ('vitabs.tablature', 'Fret'),
+        ('vitabs.tablature', 'Chord'),
+        ('vitabs.tablature', 'Bar'),
+        ('vitabs.tablature', 'Tablature'),
+        ('fractions', 'Fraction'),
+        ('copy_reg', '_reconstructor'),
+        ('copyreg', '_reconstructor'),
+        ('__builtin__', 'object'),
+        ('builtins', 'object'),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self.allowed:
+            raise FormatError('Forbidden object in file: {}.{}'.format(
+                module, name))
+        return pickle.Unpickler.find_class(self, module, name)
+
+def import_pickle(infile):
+    '''Read a tablature saved with pickle by older versions'''
+    tab = _TablatureUnpickler(infile).load()
+    if not isinstance(tab, Tablature):
+        raise FormatError('Not a tablature')
+    return tab
+
+def _file_id(fd):
+    st = os.fstat(fd)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+def _map(filename):
+    '''Returns a reader for the file mapped in memory and the identity of
+    the mapped file'''
+    with open(filename, 'rb') as infile:
+        buf = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        return TabReader(buf), _file_id(infile.fileno())
+
+def _fsync_dir(filename):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class Journal:
+    '''State of the file a tablature was loaded from or last saved to,
+    needed to append the following changes to it'''
+    def __init__(self, filename, reader, file_id):
+        self.filename = os.path.abspath(filename)
+        self.reader = reader
+        self.file_id = file_id
+        self.end = reader.end
+        self.base_size = reader.base_size
+        self.header = reader.header
+        self.symbol_names = reader.symbol_names
+
+    def size(self):
+        return self.end - self.base_size
+
+    def matches(self, filename):
+        '''True if filename is the same file, unmodified since it was last
+        read or written'''
+        if os.path.abspath(filename) != self.filename:
+            return False
+        try:
+            with open(filename, 'rb') as f:
+                return _file_id(f.fileno()) == self.file_id
+        except OSError:
+            return False
+
+    def append(self, tab):
+        '''Append the changes recorded in tab.changes as one journal
+        record'''
+        changes = tab.changes
+        header = header_fields(tab)
+        if not changes and header == self.header:
+            return
+        reader = self.reader
+        symbol_ids = {name: i for i, name in enumerate(self.symbol_names)}
+        records_offset = self.end + JOURNAL_RECORD.size
+        records = bytearray()
+        entries = {}
+
+        def entry(item):
+            e = entries.get(item)
+            if e is None:
+                if isinstance(item, BarStub) and item.source is reader:
+                    e = reader.entries[item.key]
+                else:
+                    bar = item.load() if isinstance(item, BarStub) else item
+                    data = encode_bar(bar, symbol_ids)
+                    e = bar_entry(bar, records_offset + len(records),
+                                  len(data))
+                    records.extend(data)
+                entries[item] = e
+            return e
+
+        ops = bytearray()
+        nops = 0
+        for start, nremoved, inserted in changes.splices:
+            ops += SPLICE.pack(OP_SPLICE, start, nremoved, len(inserted))
+            for item in inserted:
+                ops += ENTRY.pack(*entry(item))
+            nops += 1
+        index = tab.index
+        for bar in changes.edited:
+            # bars inserted by this record are already encoded as they are
+            i = index.position(bar)
+            if bar in entries or i is None:
+                continue
+            ops += REPLACE.pack(OP_REPLACE, i)
+            ops += ENTRY.pack(*entry(bar))
+            nops += 1
+
+        payload = (bytes(records) + JOURNAL_HEADER.pack(*header) +
+                   bytes(encode_symbols(symbol_ids)) + COUNT.pack(nops) +
+                   bytes(ops))
+        record = JOURNAL_RECORD.pack(JOURNAL_MAGIC, len(payload),
+                                     len(records), zlib.crc32(payload))
+        with open(self.filename, 'r+b') as outfile:
+            # drop a record left incomplete by an interrupted save
+            outfile.seek(self.end)
+            outfile.truncate()
+            outfile.write(record + payload)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+            self.file_id = _file_id(outfile.fileno())
+        self.end += len(record) + len(payload)
+        self.header = header
+        self.symbol_names = sorted(symbol_ids, key=symbol_ids.get)
+
+def attach(tab, filename, reader, file_id):
+    '''Make reader the source of the tablature's unloaded bars and start
+    journaling changes to filename'''
+    tab.journal = Journal(filename, reader, file_id)
+    tab.track_changes()
+
+def load(filename):
+    '''Load a tablature file in either format.  Files in the binary format
+    are memory-mapped and bars are decoded as they are accessed.'''
+    with open(filename, 'rb') as infile:
+        if not is_tabfile(infile.read(len(MAGIC))):
+            infile.seek(0)
+            return import_pickle(infile)
+    reader, file_id = _map(filename)
+    tab = _lazy_tablature(reader)
+    attach(tab, filename, reader, file_id)
+    return tab
+
+def save(tab, filename):
+    '''Save a tablature.  Changes to the file it was loaded from are
+    appended as a journal record; the file is rewritten when it was
+    modified by someone else or the journal grew to half its size.  A
+    rewrite goes to a temporary file which then replaces the original, so
+    that an interrupted save never leaves a damaged file.'''
+    journal = tab.journal
+    # records are appended in the current format only to files written in
+    # it, which readers of older versions refuse
+    if (journal is not None and tab.changes is not None and
+            journal.reader.version == VERSION and
+            journal.size() <= journal.base_size // 2 and
+            journal.matches(filename)):
+        journal.append(tab)
+        tab.track_changes()
+        return
+
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as outfile:
+        write(outfile, tab)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(tmpname, filename)
+    _fsync_dir(filename)
+
+    # unloaded bars now refer to the new file, the old mapping is released
+    # once they are all re-pointed
+    reader, file_id = _map(filename)
+    for i, item in enumerate(tab.bars.raw_items()):
+        if isinstance(item, BarStub):
+            item.source = reader
+            item.key = i
+    attach(tab, filename, reader, file_id)
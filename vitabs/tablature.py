@@ -15,57 +15,892 @@
 
 from fractions import Fraction
 from . import symbols as syms
+from .music import TICKS_PER_WHOLE, TempoMap, to_ticks, from_ticks
 from functools import reduce
+import math
+
+_LIST_MUTATORS = ('__setitem__', '__delitem__', '__iadd__', '__imul__',
+                  'append', 'extend', 'insert', 'pop', 'remove', 'clear',
+                  'sort', 'reverse')
+
+def _notify_on_mutation(cls, notify, mutators=_LIST_MUTATORS, base=list):
+    '''Override mutating methods of cls to call notify(self) after every
+    change, methods defined by cls itself are left alone'''
+    def make_mutator(name):
+        method = getattr(base, name)
+        def mutate(self, *args, **kwds):
+            ret = method(self, *args, **kwds)
+            notify(self)
+            return ret
+        mutate.__name__ = name
+        return mutate
+    for name in mutators:
+        if name not in cls.__dict__:
+            setattr(cls, name, make_mutator(name))
+    return cls
+
+class SymbolList(list):
+    '''List of symbols of a fret, notifies the fret of changes'''
+    __slots__ = ('fret',)
+
+    def __init__(self, fret, symbols=()):
+        list.__init__(self, symbols)
+        self.fret = fret
+
+_notify_on_mutation(SymbolList, lambda symbols: symbols.fret._changed())
 
 class Fret:
+    __slots__ = ('_fret', '_symbols', '_chord')
+
     def __init__(self, fret):
-        self.fret = fret
-        self.symbols = []
+        self._fret = fret
+        self._symbols = None
+        self._chord = None
+
+    def __getstate__(self):
+        return {'fret': self._fret, 'symbols': list(self._symbols or ())}
+
+    def __setstate__(self, state):
+        self._fret = state['fret']
+        self._symbols = None
+        self._chord = None
+        if state['symbols']:
+            self._symbols = SymbolList(self, state['symbols'])
+
+    def _changed(self):
+        if self._chord is not None:
+            self._chord._changed()
+
+    @property
+    def fret(self):
+        return self._fret
+
+    @fret.setter
+    def fret(self, fret):
+        self._fret = fret
+        self._changed()
+
+    @property
+    def symbols(self):
+        '''List of symbols, allocated on first use as most frets have none'''
+        if self._symbols is None:
+            self._symbols = SymbolList(self)
+        return self._symbols
+
+    @symbols.setter
+    def symbols(self, symbols):
+        self._symbols = SymbolList(self, symbols)
+        self._changed()
+
+    def has_symbol(self, symbol):
+        return bool(self._symbols) and symbol in self._symbols
+
+    def iter_symbols(self):
+        '''Iterate over symbols without allocating the list'''
+        return iter(self._symbols or ())
 
     def __repr__(self):
         '''A textual representation of the fret as displayed in the tab'''
-        return syms.apply_symbols(self.fret, self.symbols)
+        return syms.apply_symbols(self._fret, self._symbols or ())
+
+class FretMap(dict):
+    '''Mapping of string numbers to frets of a chord, keeps fret ownership
+    and notifies the chord of changes'''
+    __slots__ = ('chord',)
+
+    def __init__(self, chord, frets=()):
+        dict.__init__(self, frets)
+        self.chord = chord
+        for fret in self.values():
+            fret._chord = chord
+
+def _frets_changed(frets):
+    for fret in frets.values():
+        fret._chord = frets.chord
+    frets.chord._changed()
+
+_notify_on_mutation(FretMap, _frets_changed, base=dict, mutators=(
+    '__setitem__', '__delitem__', 'pop', 'popitem', 'clear', 'update',
+    'setdefault', '__ior__'))
 
 class Chord:
+    __slots__ = ('_strings', '_ticks', '_bar')
+
     def __init__(self, duration = Fraction('1/4')):
-        self.strings = {}
-        self.duration = duration
+        self._bar = None
+        self._strings = FretMap(self)
+        self._ticks = to_ticks(duration)
+
+    def __getstate__(self):
+        return {'strings': dict(self._strings), 'duration': self.duration}
+
+    def __setstate__(self, state):
+        self._bar = None
+        self._strings = FretMap(self, state['strings'])
+        self._ticks = to_ticks(state['duration'])
+
+    @classmethod
+    def with_ticks(cls, ticks, strings=()):
+        '''Create a chord with duration given in ticks'''
+        chord = cls.__new__(cls)
+        chord._bar = None
+        chord._strings = FretMap(chord, strings)
+        chord._ticks = ticks
+        return chord
+
+    def _changed(self):
+        if self._bar is not None:
+            self._bar.invalidate()
+
+    @property
+    def strings(self):
+        '''Frets of the chord keyed by string number, 0 is the highest
+        string'''
+        return self._strings
+
+    @strings.setter
+    def strings(self, strings):
+        self._strings = FretMap(self, strings)
+        self._changed()
+
+    @property
+    def duration(self):
+        '''Duration in whole notes'''
+        return from_ticks(self._ticks)
+
+    @duration.setter
+    def duration(self, duration):
+        self.ticks = to_ticks(duration)
+
+    @property
+    def ticks(self):
+        '''Duration in ticks, an int unless the duration can not be
+        represented in the timebase'''
+        return self._ticks
+
+    @ticks.setter
+    def ticks(self, ticks):
+        self._ticks = ticks
+        self._changed()
+
+class ChordList(list):
+    '''A list of chords which keeps chord ownership and cached metrics of
+    its bar up to date'''
+    def __init__(self, bar, chords=()):
+        list.__init__(self, chords)
+        self.bar = bar
+        for c in self:
+            c._bar = bar
+
+def _chords_changed(chords):
+    for c in chords:
+        c._bar = chords.bar
+    chords.bar.invalidate()
+
+_notify_on_mutation(ChordList, _chords_changed)
 
 class Bar:
+    # __dict__ is kept for attributes set by plugins, it is not allocated
+    # until one is used
+    # label and tempo (in bpm, from this bar on) are unset unless given
+    __slots__ = ('_chords', 'sig_num', 'sig_den', 'label', 'tempo', 'owner',
+                 '_metrics', '__dict__')
+
     def __init__(self, sig_num=4, sig_den=4, first_chord_len=Fraction('1/4')):
+        self.owner = None
         self.chords = [Chord(first_chord_len)]
         self.sig_num = sig_num
         self.sig_den = sig_den
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['chords'] = list(self._chords)
+        state['sig_num'] = self.sig_num
+        state['sig_den'] = self.sig_den
+        if hasattr(self, 'label'):
+            state['label'] = self.label
+        if hasattr(self, 'tempo'):
+            state['tempo'] = self.tempo
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        self.owner = None
+        self.chords = state.pop('chords')
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def with_chords(cls, chords, sig_num=4, sig_den=4):
+        '''Create a bar holding the given chords'''
+        bar = cls.__new__(cls)
+        bar.owner = None
+        bar.chords = chords
+        bar.sig_num = sig_num
+        bar.sig_den = sig_den
+        return bar
+
+    @property
+    def chords(self):
+        return self._chords
+
+    @chords.setter
+    def chords(self, chords):
+        self._chords = ChordList(self, chords)
+        self.invalidate()
+
+    def invalidate(self):
+        '''Drop cached metrics and notify the owning tablature, called
+        whenever the bar's chords or anything in them changes'''
+        self._metrics = None
+        if self.owner is not None:
+            self.owner.bar_changed(self)
+
+    def _get_metrics(self):
+        '''Sum of chord ticks, gcd, total width and ticks per column'''
+        if self._metrics is None:
+            ticks = [c._ticks for c in self._chords]
+            total = sum(ticks)
+            if isinstance(total, int):
+                unit = math.gcd(TICKS_PER_WHOLE, *ticks)
+                gcd = TICKS_PER_WHOLE // unit
+            else:
+                # some durations don't fit the timebase
+                gcd = math.lcm(*(from_ticks(t).denominator for t in ticks))
+                unit = Fraction(TICKS_PER_WHOLE, gcd)
+            if total == 0:
+                width = 2
+            else:
+                width = int(total // unit) * 2 + len(ticks) + 2
+            self._metrics = (total, gcd, width, unit)
+        return self._metrics
+
     def required_duration(self):
         """Duration as specified by signature"""
         return Fraction(self.sig_num, self.sig_den)
 
+    def required_ticks(self):
+        """Duration as specified by signature, in ticks"""
+        return to_ticks(Fraction(self.sig_num, self.sig_den))
+
     def real_duration(self):
         """Sum of chord durations"""
-        return sum(c.duration for c in self.chords)
+        return from_ticks(self._get_metrics()[0])
+
+    def real_ticks(self):
+        """Sum of chord durations in ticks"""
+        return self._get_metrics()[0]
 
     def gcd(self):
         """Greatest common denominator of chord durations"""
-        from math import lcm
-        denoms = (c.duration.denominator for c in self.chords)
-        return lcm(*denoms)
+        return self._get_metrics()[1]
 
     def total_width(self):
         """Calculated width in characters"""
-        d = self.real_duration()
-        if d == 0:
-            return 2
+        return self._get_metrics()[2]
+
+    def chord_width(self, chord):
+        """Width of a chord's duration in columns, not counting the
+        separator"""
+        return int(chord._ticks // self._get_metrics()[3])
+
+class FenwickTree:
+    '''Binary indexed tree over a list of values, answers prefix sums and
+    prefix searches in O(log n)'''
+    def __init__(self, values=(), zero=0):
+        self.zero = zero
+        self.tree = [zero]
+        self.tree.extend(values)
+        n = len(self.tree)
+        for i in range(1, n):
+            parent = i + (i & -i)
+            if parent < n:
+                self.tree[parent] = self.tree[parent] + self.tree[i]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, i, delta):
+        '''Add delta to the i-th (0-based) value'''
+        i += 1
+        n = len(self.tree)
+        while i < n:
+            self.tree[i] = self.tree[i] + delta
+            i += i & -i
+
+    def prefix(self, i):
+        '''Sum of the first i values'''
+        total = self.zero
+        while i > 0:
+            total = total + self.tree[i]
+            i -= i & -i
+        return total
+
+    def search(self, value):
+        '''Largest k such that the sum of the first k values does not exceed
+        value (values are assumed non-negative)'''
+        pos = 0
+        n = len(self.tree)
+        bit = 1 << (n - 1).bit_length()
+        while bit:
+            nxt = pos + bit
+            if nxt < n and self.tree[nxt] <= value:
+                pos = nxt
+                value = value - self.tree[nxt]
+            bit >>= 1
+        return pos
+
+class BarStub:
+    '''Placeholder for a bar which is decoded when first accessed through
+    BarList.  source.load_bar(key) returns the bar, metrics are the bar's
+    BarIndex metrics if known without decoding.'''
+    __slots__ = ('source', 'key', 'metrics')
+
+    def __init__(self, source, key, metrics=None):
+        self.source = source
+        self.key = key
+        self.metrics = metrics
+
+    def load(self):
+        return self.source.load_bar(self.key)
+
+class _Block:
+    '''Consecutive bars (or stubs) of a BarIndex with their metrics'''
+    __slots__ = ('items', 'values', 'number')
+
+    def __init__(self, items, values):
+        self.items = items
+        self.values = values
+        self.number = 0
+
+    def sums(self):
+        '''Number of bars and sums of their metrics'''
+        return (len(self.items),) + tuple(map(sum, zip(*self.values)))
+
+class BarIndex:
+    '''Prefix sums of per-bar metrics: duration, number of chords, screen
+    width (including the bar separator), number of labels and of tempo
+    changes.
+
+    Bars are kept in blocks of up to 2 * BLOCK bars holding the metrics of
+    their bars, and Fenwick trees hold the sums of the blocks.  An edited
+    bar updates the trees in O(log n).  A splice of the bar list measures
+    only the inserted bars and re-chunks the blocks it touches; the trees
+    are rebuilt, in O(n / BLOCK), only when the number of blocks changes.'''
+    DURATION, CHORDS, WIDTH, LABELS, TEMPOS = range(5)
+    BLOCK = 64
+
+    def __init__(self, bars):
+        self.blocks = []
+        self.block_of = {}
+        items, values = self._measure_items(bars, 0, len(bars))
+        self._set_blocks(0, 0, self._chunk(items, values))
+        self.pending = set()
+
+    @staticmethod
+    def measure(bar):
+        if isinstance(bar, BarStub):
+            return bar.metrics
+        return (bar.real_ticks(),
+                len(bar.chords),
+                bar.total_width() + 1,
+                1 if hasattr(bar, 'label') else 0,
+                1 if hasattr(bar, 'tempo') else 0)
+
+    @staticmethod
+    def stub_metrics(ticks, nchords, width, labelled, tempo=False):
+        '''Metrics for a BarStub, from the bar's real_ticks, number of
+        chords, total_width and whether it has a label and a tempo'''
+        return (ticks, nchords, width + 1, 1 if labelled else 0,
+                1 if tempo else 0)
+
+    @classmethod
+    def _measure_items(cls, bars, start, stop):
+        '''Raw items of a BarList from start to stop and their metrics,
+        stubs with unknown metrics are decoded'''
+        items = []
+        values = []
+        for i in range(start, stop):
+            item = list.__getitem__(bars, i)
+            if isinstance(item, BarStub) and item.metrics is None:
+                item = bars[i]
+            items.append(item)
+            values.append(cls.measure(item))
+        return items, values
+
+    def _chunk(self, items, values):
+        '''New blocks holding items'''
+        if len(items) <= 2 * self.BLOCK:
+            return [_Block(items, values)] if items else []
+        n = len(items) // self.BLOCK
+        bounds = [len(items) * k // n for k in range(n + 1)]
+        return [_Block(items[a:b], values[a:b])
+                for a, b in zip(bounds, bounds[1:])]
+
+    def _set_blocks(self, first, count, blocks):
+        '''Replace count blocks from the first with new blocks'''
+        for block in blocks:
+            for item in block.items:
+                self.block_of[item] = block
+        if count == len(blocks) == 1:
+            # the trees only need the difference of the block's sums
+            block = blocks[0]
+            block.number = first
+            self.blocks[first] = block
+            new = block.sums()
+            for tree, n, o in zip(self.trees, new, self.sums[first]):
+                if n != o:
+                    tree.add(first, n - o)
+            self.sums[first] = new
+            return
+        self.blocks[first : first + count] = blocks
+        for number, block in enumerate(self.blocks):
+            block.number = number
+        self.sums = [block.sums() for block in self.blocks]
+        self.trees = [FenwickTree(column) for column in zip(*self.sums)]
+        if not self.sums:
+            self.trees = [FenwickTree() for i in range(6)]
+
+    def _locate(self, i):
+        '''Number of the block holding the i-th (0-based) bar and the bar's
+        offset in it, (number of blocks, 0) past the last bar'''
+        k = self.trees[0].search(i)
+        return k, i - self.trees[0].prefix(k)
+
+    def splice(self, bars, start, nremoved, ninserted):
+        '''Follow a change of the bar list which replaced nremoved bars
+        from start with ninserted bars'''
+        items, values = self._measure_items(bars, start, start + ninserted)
+        blocks = self.blocks
+        first, offset = self._locate(start)
+        if first == len(blocks) and first > 0:
+            # appending goes to the last block
+            first -= 1
+            offset = len(blocks[first].items)
+        last, end = self._locate(start + nremoved)
+        if last > first and not end:
+            last -= 1
+            end = len(blocks[last].items)
+        count = 0
+        if first < len(blocks):
+            count = last - first + 1
+            for block in blocks[first : last + 1]:
+                for item in block.items:
+                    if self.block_of.get(item) is block:
+                        del self.block_of[item]
+            head, tail = blocks[first], blocks[last]
+            items = head.items[:offset] + items + tail.items[end:]
+            values = head.values[:offset] + values + tail.values[end:]
+            # a small block is merged with the next one
+            if len(items) < self.BLOCK // 2 and last + 1 < len(blocks):
+                neighbour = blocks[last + 1]
+                for item in neighbour.items:
+                    del self.block_of[item]
+                items += neighbour.items
+                values += neighbour.values
+                count += 1
+        self._set_blocks(first, count, self._chunk(items, values))
+
+    def position(self, bar):
+        '''Index (0-based) of a bar or stub in the bar list, None if it is
+        not there'''
+        block = self.block_of.get(bar)
+        if block is None:
+            return None
+        return self.trees[0].prefix(block.number) + block.items.index(bar)
+
+    def replace(self, old, new):
+        '''Replace a bar stub with the decoded bar'''
+        block = self.block_of.pop(old, None)
+        if block is not None:
+            block.items[block.items.index(old)] = new
+            self.block_of[new] = block
+
+    def update(self, bar):
+        '''Refresh metrics of a bar'''
+        block = self.block_of.get(bar)
+        if block is None:
+            return
+        i = block.items.index(bar)
+        new = self.measure(bar)
+        old = block.values[i]
+        k = block.number
+        for tree, n, o in zip(self.trees[1:], new, old):
+            if n != o:
+                tree.add(k, n - o)
+        block.values[i] = new
+        self.sums[k] = block.sums()
+
+    def flush(self):
+        '''Apply updates of bars marked as changed'''
+        for bar in self.pending:
+            self.update(bar)
+        self.pending.clear()
+
+    def prefix(self, field, n):
+        '''Sum of field over the first n bars'''
+        k, offset = self._locate(n)
+        total = self.trees[field + 1].prefix(k)
+        if offset and k < len(self.blocks):
+            total += sum(v[field] for v in self.blocks[k].values[:offset])
+        return total
+
+    def search(self, field, value):
+        '''Largest number of leading bars whose field sum does not exceed
+        value'''
+        tree = self.trees[field + 1]
+        k = tree.search(value)
+        n = self.trees[0].prefix(k)
+        if k < len(self.blocks):
+            value -= tree.prefix(k)
+            for v in self.blocks[k].values:
+                if v[field] > value:
+                    break
+                value -= v[field]
+                n += 1
+        return n
+
+class BarList(list):
+    '''A list of bars which notifies its tablature when modified.  It may
+    hold BarStubs, which are replaced with bars when accessed.'''
+    def __init__(self, tab, bars=()):
+        list.__init__(self, bars)
+        self.tab = tab
+        self.lazy = any(isinstance(b, BarStub) for b in self.raw_items())
+        for b in self.raw_items():
+            if not isinstance(b, BarStub):
+                b.owner = tab
+
+    def raw_items(self):
+        '''Iterate over bars and stubs without decoding'''
+        return list.__iter__(self)
+
+    def is_loaded(self, i):
+        return not isinstance(list.__getitem__(self, i), BarStub)
+
+    def _load(self, i, stub):
+        bar = stub.load()
+        list.__setitem__(self, i, bar)
+        self.tab.bar_loaded(stub, bar)
+        return bar
+
+    def __getitem__(self, i):
+        if not self.lazy:
+            return list.__getitem__(self, i)
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        item = list.__getitem__(self, i)
+        if isinstance(item, BarStub):
+            item = self._load(i, item)
+        return item
+
+    def __iter__(self):
+        if not self.lazy:
+            return list.__iter__(self)
+        return (self[i] for i in range(len(self)))
+
+    def __reversed__(self):
+        if not self.lazy:
+            return list.__reversed__(self)
+        return (self[i] for i in reversed(range(len(self))))
+
+    def _replace(self, start, stop, items):
+        '''Replace bars from start to stop (exclusive) with items, every
+        change to the list goes through here'''
+        items = list(items)
+        removed = list.__getitem__(self, slice(start, stop))
+        list.__setitem__(self, slice(start, stop), items)
+        if not self.lazy:
+            self.lazy = any(isinstance(b, BarStub) for b in items)
+        self.tab.bars_spliced(start, removed, items)
+        return removed
+
+    def _replace_all(self, items):
+        self._replace(0, len(self), items)
+
+    def _span(self, i):
+        '''Start and stop of an index or a slice with step 1, None for
+        extended slices'''
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return None
+            return start, max(start, stop)
+        i = range(len(self))[i]
+        return i, i + 1
+
+    def __setitem__(self, i, value):
+        span = self._span(i)
+        if span is None:
+            items = list(self.raw_items())
+            items[i] = value
+            self._replace_all(items)
         else:
-            return int(d * self.gcd()) * 2 + len(self.chords) + 2
+            self._replace(span[0], span[1],
+                          value if isinstance(i, slice) else [value])
+
+    def __delitem__(self, i):
+        span = self._span(i)
+        if span is None:
+            items = list(self.raw_items())
+            del items[i]
+            self._replace_all(items)
+        else:
+            self._replace(span[0], span[1], [])
+
+    def insert(self, i, value):
+        i = min(max(i + len(self) if i < 0 else i, 0), len(self))
+        self._replace(i, i, [value])
+
+    def append(self, value):
+        self._replace(len(self), len(self), [value])
+
+    def extend(self, values):
+        self._replace(len(self), len(self), values)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __imul__(self, n):
+        self._replace_all(list(self.raw_items()) * n)
+        return self
+
+    def pop(self, i=-1):
+        i = range(len(self))[i]
+        item = self._replace(i, i + 1, [])[0]
+        if isinstance(item, BarStub):
+            item = item.load()
+        return item
+
+    def remove(self, value):
+        del self[list.index(self, value)]
+
+    def clear(self):
+        self._replace(0, len(self), [])
+
+    def sort(self, **kwds):
+        items = list(self)
+        items.sort(**kwds)
+        self._replace_all(items)
+
+    def reverse(self):
+        self._replace_all(reversed(list(self.raw_items())))
+
+class ChangeLog:
+    '''Changes to a tablature since the log was started: structural changes
+    to the bar list as (start, number of removed bars, inserted bars) and
+    the set of bars whose contents changed'''
+    def __init__(self):
+        self.splices = []
+        self.edited = set()
+
+    def __bool__(self):
+        return bool(self.splices or self.edited)
 
 class Tablature:
     cursor_bar = 1
     cursor_chord = 1
+    _index = None
+    # (bpm, TempoMap) of the whole tablature, see tempo_map
+    _tempo_map = None
+    # ChangeLog of changes since the last save, if tracked
+    changes = None
+    # other ChangeLogs kept up to date, see open_log
+    logs = ()
+    # tabfile.Journal of the file this tab was loaded from or saved to
+    journal = None
 
     def __init__(self):
         self.bars = [Bar()]
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['bars'] = list(state.pop('_bars'))
+        for name in ('_index', '_tempo_map', 'changes', 'logs', 'journal'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        bars = state.pop('bars')
+        self.__dict__.update(state)
+        self.bars = bars
+
+    @property
+    def bars(self):
+        return self._bars
+
+    @bars.setter
+    def bars(self, bars):
+        old = self.__dict__.get('_bars')
+        self._bars = BarList(self, bars)
+        self._index = None
+        self._tempo_map = None
+        for log in self._logs():
+            log.splices.append((0, len(old or ()),
+                                list(self._bars.raw_items())))
+
+    @property
+    def index(self):
+        '''Prefix sum index over bars, built on first use and kept up to
+        date afterwards'''
+        if self._index is None:
+            self._index = BarIndex(self._bars)
+        elif self._index.pending:
+            self._index.flush()
+        return self._index
+
+    def invalidate_index(self):
+        self._index = None
+
+    def track_changes(self):
+        '''Start a new log of changes'''
+        self.changes = ChangeLog()
+        return self.changes
+
+    def open_log(self):
+        '''Start an additional log of changes, independent of the one
+        in self.changes'''
+        log = ChangeLog()
+        self.logs = self.logs + (log,)
+        return log
+
+    def close_log(self, log):
+        self.logs = tuple(l for l in self.logs if l is not log)
+
+    def _logs(self):
+        if self.changes is not None:
+            yield self.changes
+        for log in self.logs:
+            yield log
+
+    def bars_spliced(self, start, removed, inserted):
+        '''Called by the bar list when bars from start have been replaced'''
+        for b in inserted:
+            if not isinstance(b, BarStub):
+                b.owner = self
+        if self._index is not None:
+            self._index.splice(self._bars, start, len(removed), len(inserted))
+        self._tempo_map = None
+        for log in self._logs():
+            log.splices.append((start, len(removed), inserted))
+
+    def bar_loaded(self, stub, bar):
+        '''Called by the bar list when a bar stub has been decoded'''
+        bar.owner = self
+        if self._index is not None:
+            self._index.replace(stub, bar)
+
+    def bar_changed(self, bar):
+        '''Called by bars owned by this tablature when their contents
+        change'''
+        if self._index is not None:
+            self._index.pending.add(bar)
+        self._tempo_map = None
+        for log in self._logs():
+            log.edited.add(bar)
+
+    def update_bar(self, bar_num):
+        '''Notify the index that attributes of a bar (such as the label) have
+        changed'''
+        self.bar_changed(self._bars[bar_num - 1])
+
+    def time_at_bar(self, bar_num):
+        '''Musical time (in whole notes) at the beginning of a bar'''
+        return from_ticks(self.ticks_at_bar(bar_num))
+
+    def ticks_at_bar(self, bar_num):
+        '''Musical time (in ticks) at the beginning of a bar'''
+        return self.index.prefix(BarIndex.DURATION, bar_num - 1)
+
+    def bar_at_time(self, t):
+        '''Number of the bar playing at musical time t'''
+        return self.bar_at_tick(to_ticks(t))
+
+    def bar_at_tick(self, tick):
+        '''Number of the bar playing at musical time given in ticks'''
+        n = self.index.search(BarIndex.DURATION, tick)
+        return max(1, min(n + 1, len(self._bars)))
+
+    def chords_before(self, bar_num):
+        '''Number of chords in bars preceding the given one'''
+        return self.index.prefix(BarIndex.CHORDS, bar_num - 1)
+
+    def width_between(self, first_bar, bar_num):
+        '''Screen width taken by bars from first_bar up to (excluding)
+        bar_num'''
+        index = self.index
+        return (index.prefix(BarIndex.WIDTH, bar_num - 1) -
+                index.prefix(BarIndex.WIDTH, first_bar - 1))
+
+    def line_end(self, first_bar, width):
+        '''Number of the last bar which fits in a line of given width
+        starting with first_bar, at least one bar is always placed'''
+        index = self.index
+        offset = index.prefix(BarIndex.WIDTH, first_bar - 1)
+        last = index.search(BarIndex.WIDTH, offset + width)
+        return min(max(last, first_bar), len(self._bars))
+
+    def next_label(self, bar_num):
+        '''Number of the first labelled bar after bar_num or None'''
+        index = self.index
+        seen = index.prefix(BarIndex.LABELS, bar_num)
+        n = index.search(BarIndex.LABELS, seen)
+        if n >= len(self._bars):
+            return None
+        return n + 1
+
+    def prev_label(self, bar_num):
+        '''Number of the last labelled bar up to and including bar_num or
+        None'''
+        index = self.index
+        seen = index.prefix(BarIndex.LABELS, bar_num)
+        if not seen:
+            return None
+        return index.search(BarIndex.LABELS, seen - 1) + 1
+
+    def labelled_bars(self):
+        '''Iterator over numbers of labelled bars'''
+        index = self.index
+        for i in range(index.prefix(BarIndex.LABELS, len(self._bars))):
+            yield index.search(BarIndex.LABELS, i) + 1
+
+    def tempo_bars(self):
+        '''Iterator over numbers of bars changing the tempo'''
+        index = self.index
+        for i in range(index.prefix(BarIndex.TEMPOS, len(self._bars))):
+            yield index.search(BarIndex.TEMPOS, i) + 1
+
+    def tempo_at(self, bar_num, default=None):
+        '''Tempo in bpm of a bar, set by the last bar up to and including
+        it which changes the tempo, or default (the tablature's bpm)'''
+        index = self.index
+        seen = index.prefix(BarIndex.TEMPOS, bar_num)
+        if not seen:
+            return default if default is not None else \
+                getattr(self, 'bpm', 120)
+        return self._bars[index.search(BarIndex.TEMPOS, seen - 1)].tempo
+
+    def tempo_map(self):
+        '''TempoMap of the whole tablature, kept until a bar changes'''
+        bpm = getattr(self, 'bpm', 120)
+        if self._tempo_map is None or self._tempo_map[0] != bpm:
+            tempo_map = TempoMap(bpm)
+            for bar_num in self.tempo_bars():
+                tempo_map.change(self.ticks_at_bar(bar_num),
+                                 self._bars[bar_num - 1].tempo)
+            self._tempo_map = (bpm, tempo_map)
+        return self._tempo_map[1]
+
+    def seconds_at_bar(self, bar_num):
+        '''Time in seconds at the beginning of a bar'''
+        return self.tempo_map().seconds_at(self.ticks_at_bar(bar_num))
+
+    def bar_at_seconds(self, seconds):
+        '''Number of the bar playing at the given time in seconds'''
+        return self.bar_at_tick(self.tempo_map().tick_at(seconds))
+
     def get_cursor_bar(self):
         return self.bars[self.cursor_bar - 1]
 
@@ -125,10 +960,45 @@ class ChordRange:
             for c in self.tab.bars[last_bar].chords[ : last_chord]:
                 yield c
 
+    def positioned_chords(self):
+        '''Iterator over ((bar number, chord number), chord) pairs of chords
+        in the range'''
+        first_bar, first_chord = self.beginning
+        last_bar, last_chord = self.end
+        for bar_num in range(first_bar, last_bar + 1):
+            chords = self.tab.bars[bar_num - 1].chords
+            first = first_chord if bar_num == first_bar else 1
+            last = last_chord if bar_num == last_bar else len(chords)
+            for chord_num in range(first, last + 1):
+                yield (bar_num, chord_num), chords[chord_num - 1]
+
     def bars(self):
         for b in self.tab.bars[self.beginning[0] - 1 : self.end[0]]:
             yield b
 
+    def start_tick(self):
+        '''Musical time (in ticks) at the first chord of the range'''
+        bar_num, chord_num = self.beginning
+        chords = self.tab.bars[bar_num - 1].chords
+        return self.tab.ticks_at_bar(bar_num) + \
+            sum(c.ticks for c in chords[:chord_num - 1])
+
+    def tempo_map(self, bpm=None):
+        '''TempoMap of the range, with ticks counted from its beginning.
+        bpm is the tempo of bars before the first tempo change, the
+        tablature's bpm by default.'''
+        tab = self.tab
+        first_bar, last_bar = self.beginning[0], self.end[0]
+        tempo_map = TempoMap(tab.tempo_at(first_bar, bpm))
+        start = self.start_tick()
+        for bar_num in tab.tempo_bars():
+            if bar_num > last_bar:
+                break
+            if bar_num > first_bar:
+                tempo_map.change(tab.ticks_at_bar(bar_num) - start,
+                                 tab.bars[bar_num - 1].tempo)
+        return tempo_map
+
     def delete_all(self):
         '''Delete the range of chords from the tablature'''
         first_bar = self.beginning[0] - 1